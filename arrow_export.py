@@ -0,0 +1,110 @@
+"""
+Arrow IPC and Parquet export of the counts, the per volunteer schedule and the dog roster.  Times are
+timestamp[ns] and repeated strings are dictionary encoded.  IPC files are written uncompressed so
+readers can memory map them:
+
+    table = arrow_export.read_table('DBS_Shift_Counts_2020_01_06_2020_01_19.arrow')
+"""
+from __future__ import annotations
+
+from os.path import splitext
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow')
+
+ARROW = 'arrow'
+PARQUET = 'parquet'
+extensions = {ARROW: '.arrow', PARQUET: '.parquet'}
+LEVELS = ['Green', 'Blue', 'Purple']
+
+
+def get_shift_counts_frame(assigned: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param assigned: Counts indexed by standard shift tuple, as from shift_counts.assign_sources_to_shift
+    :return: Start and End as datetime64 columns followed by the count columns, with a RangeIndex
+    """
+    shift_df = pd.DataFrame({
+        'Start': np.array([shift[0] for shift in assigned.index], dtype='datetime64[ns]'),
+        'End': np.array([shift[1] for shift in assigned.index], dtype='datetime64[ns]'),
+    })
+    for column in assigned.columns:
+        shift_df[column] = assigned[column].values
+    return shift_df
+
+
+def shift_counts_table(assigned: pd.DataFrame) -> pa.Table:
+    shift_df = get_shift_counts_frame(assigned)
+    for column in LEVELS + ['Need']:
+        if column in shift_df.columns:
+            shift_df[column] = shift_df[column].astype(np.int32)
+    return pa.Table.from_pandas(shift_df, preserve_index=False)
+
+
+def schedule_table(schedule_df: pd.DataFrame) -> pa.Table:
+    """
+    :param schedule_df: Compact schedule, see shift_counts.compact_schedule
+    :return: Volunteer and LEVEL as dictionaries, level_code and Start and End timestamps per sign up
+    """
+    return pa.Table.from_pandas(pd.DataFrame({
+        'Volunteer': schedule_df['Volunteer'].astype('category'),
+        'LEVEL': schedule_df['LEVEL'].astype('category'),
+        'level_code': schedule_df['level_code'].values,
+        'Start': schedule_df['Start_Epoch'].values.view('datetime64[ns]'),
+        'End': schedule_df['End_Epoch'].values.view('datetime64[ns]'),
+    }), preserve_index=False)
+
+
+def dce_counts_table(dce_counts_df: pd.DataFrame) -> pa.Table:
+    """
+    :param dce_counts_df: DCE counts indexed by Start_Date and End_Date
+    """
+    dce_df = dce_counts_df.reset_index().rename(columns={'Start_Date': 'Start', 'End_Date': 'End'})
+    for column in LEVELS:
+        if column in dce_df.columns:
+            dce_df[column] = dce_df[column].astype(np.int32)
+    return pa.Table.from_pandas(dce_df, preserve_index=False)
+
+
+def dog_roster_table(dogs_df: pd.DataFrame, report_time=None) -> pa.Table:
+    """
+    :param dogs_df: Dogs by name, as from etl_dog_ex_list.get_dog_dataframe
+    :param report_time: Time of the Dog Exercise List, added as a Report_Time column
+    """
+    roster_df = dogs_df.rename_axis('name').reset_index()
+    for column in ('Level', 'location'):
+        roster_df[column] = roster_df[column].astype('category')
+    for column in ('weight', 'age'):
+        roster_df[column] = roster_df[column].astype(np.int32)
+    if report_time is not None:
+        roster_df['Report_Time'] = pd.Timestamp(report_time)
+    table = pa.Table.from_pandas(roster_df, preserve_index=False)
+    for column in ('diet', 'notes'):  # Lists that are all empty or None are inferred as list<null> or null
+        if column in table.column_names:
+            table = table.set_column(table.column_names.index(column), column,
+                                     table[column].cast(pa.list_(pa.string())))
+    return table
+
+
+def write_table(table: pa.Table, file_name: str):
+    """
+    Write as Parquet for a .parquet file name, otherwise as an Arrow IPC file
+    """
+    if splitext(file_name)[1] == extensions[PARQUET]:
+        import pyarrow.parquet as pq
+        pq.write_table(table, file_name)
+        return
+    with pa.OSFile(file_name, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def read_table(file_name: str) -> pa.Table:
+    """
+    Read a file written by write_table, memory mapped
+    """
+    if splitext(file_name)[1] == extensions[PARQUET]:
+        import pyarrow.parquet as pq
+        return pq.read_table(file_name, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(file_name)).read_all()
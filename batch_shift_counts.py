@@ -0,0 +1,193 @@
+"""
+Shift counts for many DBS schedule reports in one run, e.g. to backfill a year of archived weekly PDFs.
+All reports not already in the schedule cache are extracted by a single tabula-java batch run, so the
+JVM starts once instead of once per report, and the pandas post processing runs in a process pool.
+
+    python batch_shift_counts.py ~/Archive/DBS --csv --per_file
+    python batch_shift_counts.py "~/Archive/DBS/DBS Schedule 2020*.pdf" --history
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+from argparse import ArgumentParser
+from collections import Counter
+from functools import partial
+from os.path import basename, getsize, isfile, join, splitext
+from typing import List, Optional
+
+import dce_shift_counts_from_excel as dce_excel
+import dce_shift_counts_from_html as dce_html
+import profiling
+import shift_counts
+import shift_exceptions as exceptions
+from lazy_imports import lazy_import
+from report_files import find_reports
+from schedule_cache import ScheduleCache, count_pdf_pages, file_hash, pdf_page_hashes
+
+pd = lazy_import('pandas')
+tabula = lazy_import('tabula')
+
+
+def get_csv_suffix(file_name: str) -> str:
+    """
+    Report file name without extension, spaces replaced, added to its per file CSV name so reports covering
+    the same days, e.g. a re-exported schedule, do not overwrite each other's counts
+    """
+    return '_'.join(splitext(basename(file_name))[0].split())
+
+
+def _link_or_copy(source: str, target: str):
+    try:
+        os.symlink(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+@profiling.stage
+def read_schedule_pdfs(files: List[str], pandas_options: dict = None) -> List[pd.DataFrame]:
+    """
+    Extract the schedule table of each report with one run of tabula-java in batch mode.  The reports
+    are linked into a scratch directory under numbered names, which tabula converts to CSVs alongside.
+    :return: raw schedule tables in the order of files, as from shift_counts.read_schedule_pdf
+    """
+    pandas_options = pandas_options or {'header': [1]}
+    with tempfile.TemporaryDirectory() as batch_dir:
+        for i, file_name in enumerate(files):
+            _link_or_copy(file_name, join(batch_dir, f'{i:05}.pdf'))
+        tabula.convert_into_by_batch(batch_dir, output_format='csv', pages='all', lattice=True)
+
+        schedules = []
+        for i, file_name in enumerate(files):
+            csv_file = join(batch_dir, f'{i:05}.csv')
+            schedule_df = pd.read_csv(csv_file, **pandas_options) if isfile(csv_file) and getsize(csv_file) \
+                else pd.DataFrame()
+            if len(schedule_df.columns) != 6:
+                raise Exception(f'Format of {file_name} is wrong.  Expected 6 columns.  Actual: ',
+                                len(schedule_df.columns))
+            schedules.append(schedule_df)
+    return schedules
+
+
+@profiling.stage
+def etl_shift_schedules(files: List[str], cache: Optional[ScheduleCache] = None) -> List[pd.DataFrame]:
+    """
+    Cleaned schedule of each report, taken from the cache where present.  The rest are extracted
+    together and added to the cache.
+    """
+    keys = [file_hash(f) for f in files] if cache is not None else [None] * len(files)
+    schedules = [cache.get_schedule(key) if cache is not None else None for key in keys]
+    pending = [i for i, schedule_df in enumerate(schedules) if schedule_df is None]
+    if pending:
+        raw_schedules = read_schedule_pdfs([files[i] for i in pending])
+        for i, raw_df in zip(pending, raw_schedules):
+            schedules[i] = shift_counts.clean_shift_schedule(raw_df)
+            if cache is not None:
+                cache.put(keys[i], files[i], raw_df, schedules[i], count_pdf_pages(files[i]),
+                          pdf_page_hashes(files[i]))
+    return schedules
+
+
+@profiling.stage
+def summarize_dbs_schedules(schedules: List[pd.DataFrame], workers: int = None) -> List[pd.DataFrame]:
+    """
+    :param workers: Number of worker processes, None for one per CPU.  1 runs in the current process.
+    :return: shift counts of each schedule, as from shift_counts.load_and_summarize_dbs_counts
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    summarize = partial(shift_counts.summarize_dbs_schedule, rules=exceptions.get_rules())
+    if workers == 1 or len(schedules) < 2:
+        return [summarize(schedule_df) for schedule_df in schedules]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(summarize, schedules))
+
+
+@profiling.stage
+def combine_shift_counts(counts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Merge the counts of several reports.  Reports overlap when a later export still covers earlier
+    days, so each day is taken from the last report that covers it.
+    :param counts: Shift counts by (Start_Date, End_Date), oldest report first
+    :return: combined shift counts
+    """
+    covered_days = set()
+    kept = []
+    for shift_counts_df in reversed(counts):
+        days = shift_counts_df.index.get_level_values('Start_Date').normalize()
+        kept.append(shift_counts_df[~days.isin(covered_days)])
+        covered_days.update(days.unique())
+    return pd.concat(reversed(kept)).sort_index()
+
+
+def get_arg_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument('dbs_reports', help='DBS Shift report PDFs, directories of them or glob patterns',
+                        metavar='dbs_files', nargs='+')
+    parser.add_argument('--per_file', help='Output the counts of each report separately instead of combined',
+                        required=False, action='store_true')
+    parser.add_argument('--output_dir', help='Directory for CSV output', default='.', required=False)
+    parser.add_argument('--workers', help='Number of processes used to summarize the reports, default one per CPU',
+                        type=int, default=None, required=False)
+    parser.add_argument('--dce_html_dir', help='Directory containing DCE Schedules as HTML, combined output only',
+                        metavar='dce_html_dir', required=False)
+    parser.add_argument('--dce_excel', help='DCE Schedule workbook, instead of --dce_html_dir', metavar='dce_excel',
+                        required=False)
+    parser.add_argument('--dce_parser', help='HTML parser used for the DCE schedules', default='html5lib',
+                        choices=sorted(dce_html.dce_parsers), required=False)
+    parser.add_argument('--html', help='Output as html', required=False, action='store_true')
+    parser.add_argument('--csv', help='Output as csv', required=False, action='store_true')
+    parser.add_argument('--markdown', help='Output as a Markdown table', required=False, action='store_true')
+    parser.add_argument('--slack', help='Output as Slack message text', required=False, action='store_true')
+    parser.add_argument('--history', help='Add the counts to the shift history store', required=False,
+                        action='store_true')
+    parser.add_argument('--exceptions', help='Exception rules file, YAML or JSON, instead of the default '
+                                             f'{exceptions.DEFAULT_RULES_FILE}', metavar='rules_file', required=False)
+    parser.add_argument('--no_cache', help='Always extract the PDFs, bypassing the schedule cache', required=False,
+                        action='store_true')
+    parser.add_argument('--profile', help='Time each stage and print a table to stderr, or write JSON to the given '
+                                          'file', nargs='?', const='-', metavar='json_file', required=False)
+    return parser
+
+
+def main():
+    args = get_arg_parser().parse_args()
+    if args.profile:
+        profiling.enable()
+
+    files = find_reports(args.dbs_reports)
+    if not files:
+        sys.exit('No DBS reports found')
+    if args.per_file and args.csv:
+        suffixes = Counter(get_csv_suffix(f) for f in files)
+        repeated = [f for f in files if suffixes[get_csv_suffix(f)] > 1]
+        if repeated:
+            sys.exit('Reports with the same name would write the same CSV: ' + ', '.join(repeated))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.exceptions:
+        exceptions.use_rules(exceptions.load_rules(args.exceptions))
+    cache = None if args.no_cache else ScheduleCache()
+    counts = summarize_dbs_schedules(etl_shift_schedules(files, cache), args.workers)
+    if args.per_file:
+        for file_name, shift_counts_df in zip(files, counts):
+            print(f'== {basename(file_name)}')
+            shift_counts.print_shift_counts(args, shift_counts_df, output_dir=args.output_dir,
+                                            csv_suffix=get_csv_suffix(file_name))
+    else:
+        dce_counts_df = None
+        if args.dce_html_dir:
+            dce_counts_df = dce_html.load_and_summarize_dce_counts(args.dce_html_dir, args.workers or 1,
+                                                                   args.dce_parser)
+        elif args.dce_excel:
+            dce_counts_df = dce_excel.load_and_summarize_dce_counts(args.dce_excel, cache)
+        shift_counts.print_shift_counts(args, combine_shift_counts(counts), dce_counts_df,
+                                        output_dir=args.output_dir)
+    if args.profile:
+        profiling.report(args.profile)
+
+
+if __name__ == '__main__':
+    main()
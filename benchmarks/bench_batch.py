@@ -0,0 +1,63 @@
+"""
+Throughput of batch_shift_counts.py against running shift_counts.py once per report.
+
+    python benchmarks/bench_batch.py --reports 52
+
+Both run with the schedule cache and daemon bypassed, so every report is extracted.  Needs Java.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+from synthetic import write_dbs_schedule_pdf  # noqa: E402
+
+repo_dir = abspath(join(dirname(__file__), '..'))
+
+
+def run(argv: list) -> float:
+    begin = default_timer()
+    subprocess.run([sys.executable] + argv, cwd=repo_dir, check=True, stdout=subprocess.DEVNULL)
+    return default_timer() - begin
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--reports', type=int, default=52, help='Weekly reports in the archive')
+    parser.add_argument('--days', type=int, default=14, help='Days covered by each report')
+    parser.add_argument('--volunteers', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if not shutil.which('java'):
+        sys.exit('java not found, tabula cannot extract the reports')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = []
+        for week in range(args.reports):
+            file_name = join(tmp_dir, f'DBS Schedule {week:03}.pdf')
+            write_dbs_schedule_pdf(file_name, args.days, args.volunteers,
+                                   start_date=date(2020, 1, 6) + timedelta(weeks=week), seed=week)
+            files.append(file_name)
+        out_dir = join(tmp_dir, 'out')
+        os.makedirs(out_dir)
+
+        loop_time = sum(run(['shift_counts.py', f, '--no_cache', '--no_daemon']) for f in files)
+        batch_argv = ['batch_shift_counts.py', tmp_dir, '--no_cache', '--per_file', '--output_dir', out_dir]
+        if args.workers:
+            batch_argv += ['--workers', str(args.workers)]
+        batch_time = run(batch_argv)
+
+    print(f'{"reports":>8} {"loop s":>10} {"batch s":>10} {"speed up":>9}')
+    print(f'{args.reports:>8} {loop_time:>10.2f} {batch_time:>10.2f} {loop_time / batch_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Time and peak Python memory of counting a DBS schedule PDF in one piece against chunks of pages.
+
+    python benchmarks/bench_chunked.py --days 90 365 730 --chunk_pages 25
+
+The chunked counts are checked to be identical first.  Needs Java.
+"""
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+import pandas as pd
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+import shift_counts as sc  # noqa: E402
+from synthetic import write_dbs_schedule_pdf  # noqa: E402
+
+
+def measure(func) -> tuple:
+    tracemalloc.start()
+    begin = default_timer()
+    func()
+    elapsed = default_timer() - begin
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--days', type=int, nargs='+', default=[90, 365, 730], help='Days covered by each PDF')
+    parser.add_argument('--chunk_pages', type=int, default=sc.DEFAULT_CHUNK_PAGES)
+    args = parser.parse_args()
+
+    if not shutil.which('java'):
+        sys.exit('java not found, tabula cannot extract the schedules')
+
+    print(f'{"days":>6} {"pages":>6} {"mode":>8} {"s":>8} {"peak KiB":>10}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for days in args.days:
+            pdf_file = join(tmp_dir, f'DBS Schedule {days}.pdf')
+            write_dbs_schedule_pdf(pdf_file, days)
+            pd.testing.assert_frame_equal(sc.load_and_summarize_dbs_counts(pdf_file),
+                                          sc.load_and_summarize_dbs_counts_chunked(pdf_file, args.chunk_pages))
+            modes = [('full', lambda: sc.load_and_summarize_dbs_counts(pdf_file)),
+                     ('chunked', lambda: sc.load_and_summarize_dbs_counts_chunked(pdf_file, args.chunk_pages))]
+            for mode, func in modes:
+                elapsed, peak = measure(func)
+                print(f'{days:>6} {sc.count_pdf_pages(pdf_file):>6} {mode:>8} {elapsed:>8.2f} {peak // 1024:>10}')
+
+
+if __name__ == '__main__':
+    main()
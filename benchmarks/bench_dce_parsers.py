@@ -0,0 +1,61 @@
+"""
+Per-file parse time / peak memory of the DCE HTML parser backends, after a quick parity check.
+The parity tests are in tests/test_dce_html.py.
+
+    python benchmarks/bench_dce_parsers.py --entries 40
+
+Each backend is measured in a fresh process so peak RSS includes memory allocated by C parsers.
+"""
+import resource
+import sys
+import tempfile
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+import dce_shift_counts_from_html as dce_html  # noqa: E402
+from synthetic import make_dce_html  # noqa: E402
+
+
+def measure(file_name: str, parser: str, repeat: int) -> tuple:
+    import bs4, html5lib, lxml.html  # noqa: E401, F401  Load the parser modules up front so only parsing is measured
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    begin = default_timer()
+    for _ in range(repeat):
+        dce_html.process_dce_html_file(file_name, parser)
+    elapsed = (default_timer() - begin) / repeat
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    if sys.platform == 'darwin':
+        peak //= 1024  # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return elapsed, peak
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--entries', type=int, default=40, help='Maximum schedule entries per day')
+    parser.add_argument('--padding', type=int, default=500, help='Unrelated table rows around the calendar')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = join(tmp_dir, 'dce.html')
+        with open(file_name, 'w') as html_out:
+            html_out.write(make_dce_html(2020, 3, args.entries, args.padding))
+
+        expected = dce_html.process_dce_html_file(file_name, 'html5lib')
+        for name in dce_html.dce_parsers:
+            if dce_html.process_dce_html_file(file_name, name) != expected:
+                raise AssertionError(f'{name} counts differ from html5lib')
+
+        print(f'{"parser":>10} {"ms/file":>10} {"peak KiB":>10}')
+        for name in dce_html.dce_parsers:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                elapsed, peak = executor.submit(measure, file_name, name, args.repeat).result()
+            print(f'{name:>10} {elapsed * 1000:>10.1f} {peak:>10}')
+
+
+if __name__ == '__main__':
+    main()
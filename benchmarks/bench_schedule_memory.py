@@ -0,0 +1,61 @@
+"""
+Memory of the DBS schedule frame before and after the compact representation.
+
+    python benchmarks/bench_schedule_memory.py --days 365
+
+Also checks that the compact pipeline produces the same shift counts and assignments.
+"""
+import sys
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+import pandas as pd
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+import shift_counts as sc  # noqa: E402
+from synthetic import make_dbs_schedule_frame  # noqa: E402
+
+
+def legacy_schedule(schedule_df: pd.DataFrame) -> pd.DataFrame:
+    schedule_df = schedule_df.copy()
+    for level in sc.level_bits:
+        schedule_df[level] = schedule_df.LEVEL.apply(lambda l: level.upper() in l.upper())
+    return sc.transform_dates(schedule_df)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--signups', type=int, default=12, help='Average sign ups per standard shift')
+    args = parser.parse_args()
+
+    schedule_df = make_dbs_schedule_frame(args.days, signups_per_slot=args.signups)
+
+    begin = default_timer()
+    legacy_df = legacy_schedule(schedule_df)
+    legacy_time = default_timer() - begin
+    begin = default_timer()
+    compact_df = sc.compact_schedule(schedule_df)
+    compact_time = default_timer() - begin
+
+    legacy_counts = legacy_df[['Start_Date', 'End_Date', 'Green', 'Blue', 'Purple']] \
+        .groupby(['Start_Date', 'End_Date']).sum()
+    compact_counts = sc.get_dbs_shift_counts(compact_df)
+    pd.testing.assert_frame_equal(legacy_counts, compact_counts)
+    schedule = sc.get_schedule(compact_counts)
+    pd.testing.assert_frame_equal(sc.assign_dbs_to_shift(compact_counts, schedule),
+                                  sc.assign_dbs_to_shift(compact_df, schedule))
+
+    legacy_bytes = legacy_df.memory_usage(deep=True).sum()
+    compact_bytes = compact_df.memory_usage(deep=True).sum()
+    print(f'{len(schedule_df)} sign ups over {args.days} days')
+    print(f'{"":>8} {"MiB":>8} {"build s":>8}')
+    print(f'{"legacy":>8} {legacy_bytes / 2 ** 20:>8.2f} {legacy_time:>8.3f}')
+    print(f'{"compact":>8} {compact_bytes / 2 ** 20:>8.2f} {compact_time:>8.3f}')
+    print(f'{legacy_bytes / compact_bytes:.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
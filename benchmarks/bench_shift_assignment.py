@@ -0,0 +1,77 @@
+"""
+Benchmark of standard shift assignment: row-wise get_shift scan vs. the searchsorted engine.
+
+    python benchmarks/bench_shift_assignment.py --rows 10000 100000 1000000
+
+The row-wise path is linear in rows for a fixed schedule, so above --legacy_max rows it is timed
+on a sample and extrapolated.
+"""
+import sys
+from argparse import ArgumentParser
+from datetime import date
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+import shift_counts as sc  # noqa: E402
+
+
+def make_shift_counts(num_rows: int, start_date: date, num_days: int, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    day = rng.integers(0, num_days, num_rows)
+    start_half_hour = rng.integers(13, 38, num_rows)  # 6:30 - 19:00
+    length_half_hour = rng.integers(2, 9, num_rows)  # 1 - 4 hours
+    base = np.datetime64(start_date, 'ns')
+    starts = base + day * np.timedelta64(1, 'D') + start_half_hour * np.timedelta64(30, 'm')
+    ends = starts + length_half_hour * np.timedelta64(30, 'm')
+    return pd.DataFrame({'Start_Date': starts, 'End_Date': ends,
+                         'Green': rng.integers(0, 2, num_rows),
+                         'Blue': rng.integers(0, 2, num_rows),
+                         'Purple': rng.integers(0, 2, num_rows)}).set_index(['Start_Date', 'End_Date'])
+
+
+def legacy_assign(shift_counts_df: pd.DataFrame, schedule: list) -> pd.DataFrame:
+    assigned_counts = shift_counts_df.reset_index()
+    assigned_counts['shift'] = assigned_counts.apply(
+        lambda row: sc.get_shift((row['Start_Date'], row['End_Date']), schedule), axis=1)
+    assigned_counts = assigned_counts.drop(columns=['Start_Date', 'End_Date'])
+    return assigned_counts.groupby(['shift']).sum()
+
+
+def time_call(func, *args) -> float:
+    begin = default_timer()
+    func(*args)
+    return default_timer() - begin
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--days', type=int, default=90, help='Length of the standard schedule in days')
+    parser.add_argument('--legacy_max', type=int, default=20_000,
+                        help='Largest row count timed directly for the row-wise path')
+    args = parser.parse_args()
+
+    start_date = date(2020, 1, 1)
+    schedule = sc.generate_schedule(start_date, args.days)
+    check_df = make_shift_counts(2_000, start_date, args.days, seed=1)
+    pd.testing.assert_frame_equal(legacy_assign(check_df, schedule),
+                                  sc.assign_to_shift(check_df, schedule), check_dtype=False)
+
+    print(f'{"rows":>10} {"row-wise (s)":>14} {"indexed (s)":>12} {"speedup":>9}')
+    for num_rows in args.rows:
+        counts_df = make_shift_counts(num_rows, start_date, args.days)
+        sample = min(num_rows, args.legacy_max)
+        legacy = time_call(legacy_assign, counts_df.iloc[:sample], schedule) * num_rows / sample
+        indexed = time_call(sc.assign_to_shift, counts_df, schedule)
+        estimated = '*' if sample < num_rows else ' '
+        print(f'{num_rows:>10} {legacy:>13.3f}{estimated} {indexed:>12.3f} {legacy / indexed:>8.0f}x')
+    print('* extrapolated from a sample of --legacy_max rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Start up regression check for the command line entry points, based on python -X importtime.
+
+    python benchmarks/bench_startup.py --budget_ms 100
+
+Fails when importing an entry point takes longer than the budget or loads a heavy dependency.  The heavy
+dependency check also runs as tests/test_startup.py.
+"""
+import subprocess
+import sys
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+
+ROOT = abspath(join(dirname(__file__), '..'))
+ENTRY_POINTS = ['shift_counts', 'etl_dog_ex_list', 'counts_daemon']
+HEAVY_MODULES = ['pandas', 'numpy', 'tabula', 'bs4', 'html5lib', 'lxml.html', 'pyarrow']
+
+
+def import_profile(module: str) -> tuple:
+    """
+    :return: tuple of (cumulative import time in microseconds, heavy modules actually executed)
+    """
+    # A lazily imported module keeps the _LazyModule type until its first attribute access
+    check = ('import sys\n'
+             f'import {module}\n'
+             f'heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules\n'
+             '         and type(sys.modules[m]).__name__ != "_LazyModule"]\n'
+             'print(",".join(heavy))')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', check], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    heavy = [m for m in result.stdout.strip().split(',') if m]
+    return cumulative, heavy
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--budget_ms', type=float, default=100.0, help='Maximum import time per entry point')
+    parser.add_argument('--runs', type=int, default=5, help='Best of this many imports is compared')
+    args = parser.parse_args()
+
+    failed = False
+    print(f'{"module":>18} {"import ms":>10}  heavy modules')
+    for module in ENTRY_POINTS:
+        profiles = [import_profile(module) for _ in range(args.runs)]
+        best = min(cumulative for cumulative, _ in profiles) / 1000
+        heavy = profiles[0][1]
+        over = best > args.budget_ms or heavy
+        failed |= bool(over)
+        print(f'{module:>18} {best:>10.1f}  {", ".join(heavy) or "-"}{"  OVER BUDGET" if over else ""}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
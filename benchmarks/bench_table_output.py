@@ -0,0 +1,90 @@
+"""
+Time and peak memory of rendering the shift counts table with pandas' Styler against the streaming
+table_output renderer, for multi-month tables.
+
+    python benchmarks/bench_table_output.py --days 90 365 1095
+
+Highlighted cells are checked to match between the Styler and HTML outputs first.
+"""
+import re
+import sys
+import tracemalloc
+import warnings
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+import shift_counts as sc  # noqa: E402
+import table_output  # noqa: E402
+from synthetic import make_dbs_schedule_frame  # noqa: E402
+
+
+def render_styler(table_df) -> str:
+    styles = [
+        dict(selector="tr", props=[('text-align', 'right')]),
+        dict(selector='th', props=[('text-align', 'right')])
+    ]
+    styled = table_df.style \
+        .set_table_styles(styles) \
+        .hide_index() \
+        .apply(sc.color_need, subset=['Need']) \
+        .apply(sc.color_purples, subset=['Purple'])
+    return styled.render()
+
+
+def highlighted_cells(html_text: str, table_df) -> list:
+    """
+    (row, column) of every highlighted cell.  Styler puts the styles in CSS rules keyed by cell id,
+    table_output inline on the cell.
+    """
+    if 'style="' in html_text:
+        rows = re.findall(r'<tr>(.*?)</tr>', html_text)[1:]
+        return [(r, c) for r, row in enumerate(rows)
+                for c, cell in enumerate(re.findall(r'<td[^>]*>', row)) if 'style=' in cell]
+    columns = list(table_df.columns)
+    return sorted((int(r), int(c)) for r, c in re.findall(r'#T_\w+_row(\d+)_col(\d+)', html_text)
+                  if columns[int(c)] in sc.shift_highlights)
+
+
+def measure(func, repeat: int) -> tuple:
+    func()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    begin = default_timer()
+    for _ in range(repeat):
+        func()
+    return (default_timer() - begin) / repeat, peak
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--days', type=int, nargs='+', default=[90, 365, 1095], help='Days covered by each table')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)  # Styler.hide_index and render, kept as the baseline
+
+    print(f'{"days":>6} {"rows":>6} {"renderer":>10} {"ms":>10} {"peak KiB":>10}')
+    for days in args.days:
+        shift_counts_df = sc.get_dbs_shift_counts(sc.compact_schedule(make_dbs_schedule_frame(days)))
+        table_df = sc.format_shift_counts(sc.assign_dbs_to_shift(shift_counts_df, sc.get_schedule(shift_counts_df)))
+        if highlighted_cells(render_styler(table_df), table_df) != \
+                highlighted_cells(sc.get_shift_counts_as_html(table_df), table_df):
+            sys.exit(f'Highlighted cells differ for {days} days')
+
+        renderers = [
+            ('styler', lambda: render_styler(table_df)),
+            ('html', lambda: sc.get_shift_counts_as_html(table_df)),
+            ('markdown', lambda: table_output.render_table(table_df, table_output.MARKDOWN, sc.shift_highlights)),
+            ('slack', lambda: table_output.render_table(table_df, table_output.SLACK, sc.shift_highlights)),
+        ]
+        for name, func in renderers:
+            elapsed, peak = measure(func, args.repeat)
+            print(f'{days:>6} {len(table_df):>6} {name:>10} {elapsed * 1000:>10.1f} {peak // 1024:>10}')
+
+
+if __name__ == '__main__':
+    main()
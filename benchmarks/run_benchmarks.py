@@ -0,0 +1,166 @@
+"""
+Benchmark suite over synthetic DBS, DCE and dog list inputs.  Results are written as JSON so runs can
+be compared for regressions.
+
+    python benchmarks/run_benchmarks.py --days 90 --output before.json
+    python benchmarks/run_benchmarks.py --days 90 --output after.json --compare before.json
+
+The PDF extraction benchmark needs Java for tabula and is skipped without it.
+"""
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+from timeit import default_timer
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+import dce_shift_counts_from_excel as dce_excel  # noqa: E402
+import dce_shift_counts_from_html as dce_html  # noqa: E402
+import dog_forecast  # noqa: E402
+import dog_snapshots  # noqa: E402
+import etl_dog_ex_list as dog_list  # noqa: E402
+import shift_counts as sc  # noqa: E402
+import shift_exceptions as exceptions  # noqa: E402
+import shift_staffing as staffing  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def build_cases(tmp_dir: str, args) -> list:
+    """
+    :return: list of (name, function, rows processed)
+    """
+    pdf_file = join(tmp_dir, 'DBS Schedule.pdf')
+    synthetic.write_dbs_schedule_pdf(pdf_file, args.days, args.volunteers)
+    schedule_df = synthetic.make_dbs_schedule_frame(args.days, args.volunteers)
+    dce_dir = join(tmp_dir, 'dce')
+    os.makedirs(dce_dir)
+    synthetic.write_dce_html_dir(dce_dir, args.months)
+    dce_file = join(tmp_dir, 'DCE.xlsx')
+    synthetic.write_dce_excel(dce_file, args.days, args.volunteers)
+    dog_file = join(tmp_dir, 'Dog_Exercise_List.csv')
+    synthetic.write_dog_exercise_list(dog_file, args.dogs)
+
+    shift_counts_df = sc.get_dbs_shift_counts(sc.compact_schedule(schedule_df))
+    schedule = sc.get_schedule(shift_counts_df)
+    assigned = sc.assign_dbs_to_shift(shift_counts_df, schedule)
+    assigned_fmt = sc.format_shift_counts(assigned)
+    compact_df = sc.compact_schedule(schedule_df)
+    rules = exceptions.ExceptionRules(synthetic.make_exception_rules(args.rules, args.days, args.volunteers))
+    sources = {'DBS': shift_counts_df, 'DCE': dce_excel.load_and_summarize_dce_counts(dce_file)}
+    dce_assigned = sc.assign_sources_to_shift({'DCE': sources['DCE']}, schedule)
+    dogs = dog_list.get_dogs(dog_file)[0]
+    dogs_df = dog_list.get_dog_dataframe(dogs)
+    targets = staffing.get_level_targets(dog_list.get_dog_counts_dataframe(dog_list.filter_for_dbs(dogs_df)))
+    roster_df = dog_snapshots.get_roster_frame(dogs)
+    moved_df = dog_snapshots.get_roster_frame(  # Every 50th dog moved to another kennel
+        {name: dict(dog, location='Kennel 0') if i % 50 == 0 else dog for i, (name, dog) in enumerate(dogs.items())})
+
+    def load_dce_excel():
+        dce_excel._workbook_counts.clear()  # Measure the workbook read, not the in-memory memo
+        return dce_excel.load_and_summarize_dce_counts(dce_file)
+
+    cases = [
+        ('dbs_transform', lambda: sc.get_dbs_shift_counts(sc.compact_schedule(schedule_df)), len(schedule_df)),
+        ('apply_exceptions', lambda: sc.apply_exceptions(compact_df, rules), len(compact_df)),
+        ('assign_dbs_to_shift', lambda: sc.assign_dbs_to_shift(shift_counts_df, schedule), len(shift_counts_df)),
+        ('assign_sources_to_shift', lambda: sc.assign_sources_to_shift(sources, schedule),
+         sum(len(df) for df in sources.values())),
+        ('suggest_staffing', lambda: staffing.suggest_staffing(compact_df, schedule, targets, 14, dce_assigned),
+         len(compact_df)),
+        ('dce_html_html5lib', lambda: dce_html.load_and_summarize_dce_counts(dce_dir, 1, 'html5lib'), args.months),
+        ('dce_html_lxml', lambda: dce_html.load_and_summarize_dce_counts(dce_dir, 1, 'lxml'), args.months),
+        ('dce_excel', load_dce_excel, args.days),
+        ('get_dogs', lambda: dog_list.get_dogs(dog_file), args.dogs),
+        ('dog_report_features', lambda: dog_forecast.get_report_features(dogs_df), len(dogs_df)),
+        ('diff_rosters', lambda: dog_snapshots.diff_rosters(roster_df, moved_df), len(moved_df)),
+        ('shift_counts_html', lambda: sc.get_shift_counts_as_html(assigned_fmt), len(assigned_fmt)),
+        ('dog_counts_html', lambda: dog_list.get_dog_counts_as_html(dog_list.filter_for_dbs(dogs_df)), len(dogs_df)),
+    ]
+    if shutil.which('java'):
+        cases.insert(0, ('load_and_summarize_dbs_counts', lambda: sc.load_and_summarize_dbs_counts(pdf_file),
+                         len(schedule_df)))
+    else:
+        print('java not found, skipping load_and_summarize_dbs_counts')
+    return cases
+
+
+def run_case(func, repeat: int) -> list:
+    func()  # Warm up imports and caches
+    timings = []
+    for _ in range(repeat):
+        begin = default_timer()
+        func()
+        timings.append(default_timer() - begin)
+    return timings
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=dirname(__file__), capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--days', type=int, default=90, help='Days covered by the DBS schedule and DCE workbook')
+    parser.add_argument('--volunteers', type=int, default=300)
+    parser.add_argument('--months', type=int, default=3, help='DCE HTML calendar months')
+    parser.add_argument('--dogs', type=int, default=2000)
+    parser.add_argument('--rules', type=int, default=500, help='Exception rules applied to the DBS schedule')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='*', help='Run only these benchmarks')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file for the results')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative slow down reported as a regression')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases = build_cases(tmp_dir, args)
+        results = []
+        for name, func, rows in cases:
+            if args.only and name not in args.only:
+                continue
+            timings = run_case(func, args.repeat)
+            results.append({'name': name, 'rows': rows, 'min': min(timings), 'mean': statistics.mean(timings),
+                            'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0})
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as compare_in:
+            previous = {result['name']: result for result in json.load(compare_in)['results']}
+
+    regressions = []
+    print(f'{"benchmark":>30} {"rows":>8} {"min ms":>10} {"mean ms":>10} {"change":>8}')
+    for result in results:
+        change = ''
+        if result['name'] in previous:
+            ratio = result['min'] / previous[result['name']]['min'] - 1
+            change = f'{ratio:+.0%}'
+            if ratio > args.threshold:
+                regressions.append(result['name'])
+        print(f'{result["name"]:>30} {result["rows"]:>8} {result["min"] * 1000:>10.2f} '
+              f'{result["mean"] * 1000:>10.2f} {change:>8}')
+
+    with open(args.output, 'w') as json_out:
+        json.dump({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': git_revision(),
+                   'python': platform.python_version(), 'machine': platform.machine(),
+                   'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+                   'results': results}, json_out, indent=2)
+    print(f'Results saved to {args.output}')
+    if regressions:
+        print(f'Regressions over {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Synthetic stand-ins for the private exports the scripts read, for benchmarks and parity checks.
+"""
+import calendar
+import random
+from datetime import date, datetime, timedelta
+
+
+
+def make_dce_html(year: int, month: int, max_entries_per_day: int = 8, padding_rows: int = 200, seed=0) -> str:
+    """
+    DCE calendar page with the markup process_dce_html_file navigates: SDM/SDY inputs, the P2_29
+    month table of vicnet229 week rows, and a P2_31 table of vicnet228 entries per day.
+    Other roles and unrelated page furniture are mixed in so the parser has realistic work to skip.
+    """
+    rnd = random.Random(seed)
+    times = ['7:30&nbsp;a - 10:30&nbsp;a', '8:00&nbsp;a - 11:00&nbsp;a', '1:00&nbsp;p - 4:00&nbsp;p',
+             '3:00&nbsp;p - 6:00&nbsp;p', '4:00&nbsp;p - 6:00&nbsp;p', '4:00&nbsp;p - 7:30&nbsp;p']
+    roles = ['Dog Care - GREEN-D', 'Dog Care - BLUE-D', 'Cat Care - GREEN-C', 'Front Desk']
+    first_weekday, num_days = calendar.monthrange(year, month)
+    cells = ['<td class="a"><span class="e">&nbsp;</span></td>'] * ((first_weekday + 1) % 7)
+    for day in range(1, num_days + 1):
+        entries = ''.join(
+            f'<tr class="vicnet228"><td class="b"><a href="#s{day}">{rnd.choice(times)} {rnd.choice(roles)}</a>'
+            f'<br><span class="f">Volunteer {rnd.randint(1, 500)}</span></td></tr>'
+            for _ in range(rnd.randint(0, max_entries_per_day)))
+        cells.append(f'<td class="a"><span class="e">{day}</span><table id="P2_31" class="c">{entries}</table></td>')
+    weeks = ''.join('<tr class="vicnet229">' + ''.join(cells[i:i + 7]) + '</tr>' for i in range(0, len(cells), 7))
+    padding = ''.join(f'<tr class="vicnet230"><td><a href="/page/{i}">Link {i}</a></td><td>{"x" * 40}</td></tr>'
+                      for i in range(padding_rows))
+    return (f'<!DOCTYPE html><html><head><title>Schedule</title><script>var x = "<table>";</script></head><body>'
+            f'<table id="nav">{padding}</table>'
+            f'<form><input type="hidden" name="SDM" value="{month}"><input type="hidden" name="SDY" value="{year}">'
+            f'</form><table id="P2_29" class="vicnet227">{weeks}</table><table id="footer">{padding}</table>'
+            f'</body></html>')
+
+
+def make_dog_exercise_list(num_dogs: int, report_time: str = '01/06/2020 07:30 AM', seed=0) -> list:
+    """
+    Rows of a Dog Exercise List CSV export.  Report columns start after 8 leading layout columns.
+    Each dog has an AM row followed by diet, handling level, holder, medical and note rows and ends
+    with a short row.
+    """
+    rnd = random.Random(seed)
+    offset = [''] * 8
+    levels = ['Green', 'Blue', 'Purple', 'Red', 'Orange']
+    red_notes = ['No Handling Level assigned', 'Team handling only', 'Staff only']
+    rows = [offset + [f'Dog Exercise List - {report_time}'] + [''] * 8,
+            offset + ['', '', '', 'Location', 'Level', 'Name', 'Age', 'Weight', 'ID']]
+    for dog in range(num_dogs):
+        name = f'Dog{dog}' + ('-DELETE' if rnd.random() < 0.01 else '')
+        rows.append(offset + ['AM', '', '', f'Kennel {rnd.randint(1, 80)}', '', f'{name}, Mixed Breed',
+                              f'Dog/{rnd.randint(0, 14):02}y {rnd.randint(0, 11):02}m', f'{rnd.randint(5, 110)} lbs',
+                              f'A{1000000 + dog}'])
+        if rnd.random() < 0.1:
+            rows.append(offset + ['', '', '', '', 'Intake notes', 'Arrived as a stray', '', '', ''])
+        if rnd.random() < 0.3:
+            rows.append(offset + ['DIET', '', '', '', '', 'Sensitive stomach food', '', '', ''])
+        if rnd.random() < 0.05:
+            rows.append(offset + ['', '', '', '', 'Bite Quarantine', 'Until 1/10', '', '', ''])
+        if rnd.random() < 0.1:
+            rows.append(offset + ['', '', '', '', 'Kennel Cough', 'On medication', '', '', ''])
+        if rnd.random() < 0.25:
+            rows.append(offset + ['H', '', '', '', 'Holder', 'Pending adoption', '', '', ''])
+        if rnd.random() < 0.95:
+            level = rnd.choice(levels)
+            note = rnd.choice(red_notes) if level == 'Red' else 'Handling notes'
+            rows.append(offset + ['', '', '', '', f'{level} level', note, '', '', ''])
+        if rnd.random() < 0.2:
+            rows.append(offset + ['RDR', '', '', '', 'Run dog run', 'Yes', '', '', ''])
+        rows.append(offset + ['', '', '', '', '', 'Loves tennis balls', '', '', ''])
+        rows.append(offset + [''])
+    return rows
+
+
+def make_exception_rules(num_rules: int, num_days: int, volunteers: int = 300, start_date=date(2020, 1, 6),
+                         seed=0) -> dict:
+    """
+    Exception rules spec for shift_exceptions.ExceptionRules over the volunteers of make_dbs_schedule_frame:
+    one tenth date overrides, three tenths reclassifications and the rest exclusions, half of those dated
+    """
+    rnd = random.Random(seed)
+    names = [f'Volunteer {i}' for i in range(volunteers)]
+
+    def day():
+        return (start_date + timedelta(rnd.randrange(num_days))).isoformat()
+
+    spec = {'exclusions': [], 'overrides': [], 'reclassifications': []}
+    for i in range(num_rules):
+        kind = i % 10
+        if kind == 0:
+            spec['overrides'].append({'dates': [day()], 'exclude': True} if rnd.random() < .2 else
+                                     {'dates': [day(), day()], 'names': [rnd.choice(names)], 'level': 'Blue'})
+        elif kind < 4:
+            spec['reclassifications'].append({'names': [rnd.choice(names)], 'level': rnd.choice(['Blue', 'Purple'])})
+        elif kind < 7:
+            spec['exclusions'].append({'names': rnd.sample(names, 2)})
+        else:
+            first, last = sorted([day(), day()])
+            spec['exclusions'].append({'name': rnd.choice(names), 'from': first, 'to': last})
+    return spec
+
+
+def make_dbs_schedule_frame(num_days: int, volunteers: int = 300, signups_per_slot: int = 12,
+                            start_date=date(2020, 1, 6), seed=0):
+    """
+    DBS schedule rows as etl_shift_schedule returns them from the PDF: one row per volunteer sign up
+    with Volunteer, LEVEL, Date, From, To and Phone strings, plus a few Open slots.
+    """
+    import pandas as pd
+    from shift_counts import shift_times
+
+    rnd = random.Random(seed)
+    names = [f'Volunteer {i}' for i in range(volunteers)]
+    level_names = ['GREEN', 'BLUE', 'PURPLE', 'Green Trainee', 'BLUE Mentor']
+    rows = []
+    for day in range(num_days):
+        curr_date = start_date + timedelta(day)
+        date_text = f'{curr_date.month}/{curr_date.day}/{curr_date.year} ({curr_date.strftime("%A")})'
+        for (start_h, start_m), (end_h, end_m) in shift_times[curr_date.isoweekday()]:
+            from_text = datetime(2000, 1, 1, start_h, start_m).strftime('%-I:%M %p')
+            to_text = datetime(2000, 1, 1, end_h, end_m).strftime('%-I:%M %p')
+            for _ in range(rnd.randint(signups_per_slot // 2, signups_per_slot * 3 // 2)):
+                rows.append([rnd.choice(names), rnd.choice(level_names), date_text, from_text, to_text,
+                             f'206-555-{rnd.randint(0, 9999):04}'])
+    return pd.DataFrame(rows, columns=['Volunteer', 'LEVEL', 'Date', 'From', 'To', 'Phone'])
+
+
+def _pdf_text(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_table_pdf(file_name: str, pages: list, col_widths: list, row_height: float = 14.0, font_size: float = 7.0):
+    """
+    Minimal PDF with one ruled table per page, the layout tabula's lattice mode extracts.
+    :param pages: list of pages, each a list of rows of cell strings
+    """
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_refs = []
+    for rows in pages:
+        ops = ['0.5 w']
+        y = 792 - 36
+        for row in rows:
+            y -= row_height
+            x = 36.0
+            for width, cell in zip(col_widths, row):
+                ops.append(f'{x:.1f} {y:.1f} {width:.1f} {row_height:.1f} re S')
+                if cell:
+                    ops.append(f'BT /F1 {font_size} Tf {x + 2:.1f} {y + 4:.1f} Td ({_pdf_text(cell)}) Tj ET')
+                x += width
+        stream = '\n'.join(ops)
+        objects.append(f'<< /Length {len(stream.encode("latin-1"))} >>\nstream\n{stream}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R '
+                       f'/Resources << /Font << /F1 3 0 R >> >> >>')
+        page_refs.append(f'{len(objects)} 0 R')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(page_refs)}] /Count {len(page_refs)} >>'
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    for offset in offsets:
+        out += f'{offset:010} 00000 n \n'.encode('latin-1')
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    with open(file_name, 'wb') as pdf_out:
+        pdf_out.write(out)
+
+
+def make_dbs_schedule_pages(num_days: int, volunteers: int = 300, signups_per_slot: int = 12,
+                            open_slots: float = 0.05, rows_per_page: int = 48, start_date=date(2020, 1, 6),
+                            seed=0) -> list:
+    """
+    Rows of each page of a DBS Schedule report: a title row, then a Volunteer/LEVEL/Date/From/To/Phone
+    header repeated on every page.  Date, From and To are only filled on the first sign up of a shift,
+    as in the report.
+    """
+    schedule_df = make_dbs_schedule_frame(num_days, volunteers, signups_per_slot, start_date, seed)
+    rnd = random.Random(seed)
+    header = list(schedule_df.columns)
+    rows = []
+    previous_shift = None
+    for row in schedule_df.itertuples(index=False):
+        shift = (row.Date, row.From, row.To)
+        if rnd.random() < open_slots:
+            rows.append(['Open', '', '', '', '', ''])
+        row = list(row)
+        if shift == previous_shift:
+            row[2:5] = ['', '', '']
+        previous_shift = shift
+        rows.append(row)
+    pages = []
+    for start in range(0, len(rows), rows_per_page):
+        page = [header] + rows[start:start + rows_per_page]
+        pages.append(([['DBS Schedule', '', '', '', '', '']] if not pages else []) + page)
+    return pages
+
+
+def write_dbs_schedule_pdf(file_name: str, num_days: int, volunteers: int = 300, signups_per_slot: int = 12,
+                           open_slots: float = 0.05, rows_per_page: int = 48, start_date=date(2020, 1, 6), seed=0):
+    pages = make_dbs_schedule_pages(num_days, volunteers, signups_per_slot, open_slots, rows_per_page, start_date,
+                                    seed)
+    write_table_pdf(file_name, pages, [110, 70, 110, 55, 55, 70])
+
+
+def write_dce_html_dir(dir_name: str, months: int, max_entries_per_day: int = 8, start_year: int = 2020, seed=0):
+    for month in range(months):
+        year, month_of_year = start_year + month // 12, month % 12 + 1
+        with open(f'{dir_name}/DCE_{year}_{month_of_year:02}.html', 'w') as html_out:
+            html_out.write(make_dce_html(year, month_of_year, max_entries_per_day, seed=seed + month))
+
+
+def write_dce_excel(file_name: str, num_days: int, volunteers: int = 200, signups_per_day: int = 20,
+                    start_date=date(2020, 1, 6), seed=0):
+    """
+    DCE schedule workbook: a level by name sheet and a shift by name sheet with text dates and times
+    """
+    import pandas as pd
+
+    rnd = random.Random(seed)
+    people = [(f'First{i}', f'Last{i}') for i in range(volunteers)]
+    levels = pd.DataFrame({'First name Last name': [f'{first} {last}' for first, last in people],
+                           'LEVEL': [rnd.choice(['GREEN-D', 'GREEN-D', 'BLUE-D', 'GREEN-C']) for _ in people]})
+    times = [('7:30 AM', '10:30 AM'), ('1:00 PM', '4:00 PM'), ('4:00 PM', '6:00 PM')]
+    shifts = []
+    for day in range(num_days):
+        curr_date = start_date + timedelta(day)
+        for _ in range(signups_per_day):
+            first, last = rnd.choice(people)
+            from_time, to_time = rnd.choice(times)
+            shifts.append({'First name': first, 'Last name': last, 'Note': '', 'Number': rnd.randint(1, 9999),
+                           'Date': curr_date.strftime('%m/%d/%Y'), 'From time': from_time, 'To time': to_time})
+    with pd.ExcelWriter(file_name) as writer:
+        levels.to_excel(writer, sheet_name='Levels', index=False)
+        pd.DataFrame(shifts).to_excel(writer, sheet_name='Shifts', index=False)
+
+
+def write_dog_exercise_list(file_name: str, num_dogs: int, seed=0):
+    import csv
+
+    with open(file_name, 'w', newline='') as csv_out:
+        csv.writer(csv_out).writerows(make_dog_exercise_list(num_dogs, seed=seed))
@@ -0,0 +1,208 @@
+"""
+Long running counts daemon.  Keeps the parsed DBS schedules, DCE counts and dog rosters in memory,
+polls their files for changes and answers shift_counts.py and etl_dog_ex_list.py over a Unix socket.
+
+    python counts_daemon.py --watch "~/Downloads/DBS Schedule.pdf" ~/Downloads/Dog_Exercise_List.csv
+
+Files are also watched from the first request that names them.
+"""
+import io
+import json
+import os
+import signal
+import socketserver
+import threading
+import traceback
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from os.path import abspath, dirname, expanduser, getmtime, isdir, isfile, join
+
+import dce_shift_counts_from_excel as dce_excel
+import dce_shift_counts_from_html as dce_html
+import etl_dog_ex_list as dog_list
+import shift_counts
+import shift_exceptions as exceptions
+from daemon_client import SOCKET_PATH
+from schedule_cache import ScheduleCache
+
+
+class CountsState:
+    """
+    Parsed sources by file path.  A source is reloaded only when its modification time, or for the DBS
+    reports and DCE workbooks the exception rules, change.
+    DCE directories are tracked per file so only changed months are parsed again, and DBS reports go
+    through the schedule cache so a re-exported report only has the pages after those unchanged extracted.
+    """
+
+    def __init__(self, cache: ScheduleCache = None):
+        self.lock = threading.RLock()
+        self.cache = cache or ScheduleCache()
+        self.dbs_reports = {}
+        self.dce_files = {}
+        self.dce_dirs = {}
+        self.dce_workbooks = {}
+        self.dog_lists = {}
+
+    @staticmethod
+    def _load(entries: dict, path: str, loader, rules_digest: str = None):
+        """
+        :param rules_digest: Digest of the exception rules the loader applies, a change also reloads the source
+        """
+        version = (getmtime(path), rules_digest)
+        entry = entries.get(path)
+        if entry is None or entry[0] != version:
+            entry = (version, loader(path))
+            entries[path] = entry
+        return entry[1]
+
+    def dbs_counts(self, path: str):
+        with self.lock:
+            return self._load(self.dbs_reports, path,
+                              lambda p: shift_counts.load_and_summarize_dbs_counts(p, self.cache),
+                              exceptions.get_rules().digest)
+
+    def dce_counts(self, path: str, parser: str = 'html5lib'):
+        with self.lock:
+            if not isdir(path):
+                return dce_html.get_counts_by_shift(
+                    self._load(self.dce_files, path, lambda p: dce_html.process_dce_html_file(p, parser)))
+            self.dce_dirs[path] = parser
+            files = [join(path, sched) for sched in sorted(os.listdir(path)) if isfile(join(path, sched))]
+            counts = [self._load(self.dce_files, sched, lambda p: dce_html.process_dce_html_file(p, parser))
+                      for sched in files]
+            return dce_html.get_counts_by_shift(dce_html.merge_shift_counts(counts))
+
+    def dce_excel_counts(self, path: str):
+        with self.lock:
+            return self._load(self.dce_workbooks, path,
+                              lambda p: dce_excel.load_and_summarize_dce_counts(p, self.cache),
+                              exceptions.get_rules().digest)
+
+    def dogs(self, path: str) -> tuple:
+        with self.lock:
+            def load_dogs(p):
+                dogs, report_time = dog_list.get_dogs(p)
+                return dog_list.get_dog_dataframe(dogs), report_time
+
+            return self._load(self.dog_lists, path, load_dogs)
+
+    def refresh(self):
+        """
+        Reload every watched source whose file changed, so the next request is answered from memory
+        """
+        with self.lock:
+            for path in list(self.dbs_reports):
+                if isfile(path):
+                    self.dbs_counts(path)
+            for path, parser in list(self.dce_dirs.items()):
+                if isdir(path):
+                    self.dce_counts(path, parser)
+            for path in list(self.dce_workbooks):
+                if isfile(path):
+                    self.dce_excel_counts(path)
+            for path in list(self.dog_lists):
+                if isfile(path):
+                    self.dogs(path)
+            for path in [p for p in self.dce_files if not isfile(p)]:
+                del self.dce_files[path]
+
+    def watch(self, path: str):
+        path = abspath(expanduser(path))
+        if path.lower().endswith('.pdf'):
+            self.dbs_counts(path)
+        elif path.lower().endswith('.csv'):
+            self.dogs(path)
+        elif path.lower().endswith(('.xlsx', '.xls')):
+            self.dce_excel_counts(path)
+        else:
+            self.dce_counts(path)
+
+
+def run_shift_counts(state: CountsState, argv: list, cwd: str):
+    args = shift_counts.get_arg_parser().parse_args(argv)
+    shift_counts_df = state.dbs_counts(join(cwd, args.dbs_report))
+    dce_counts_df = None
+    if args.dce_html_dir:
+        dce_counts_df = state.dce_counts(join(cwd, args.dce_html_dir), args.dce_parser)
+    elif args.dce_excel:
+        dce_counts_df = state.dce_excel_counts(join(cwd, args.dce_excel))
+    shift_counts.print_shift_counts(args, shift_counts_df, dce_counts_df, output_dir=cwd)
+
+
+def run_dog_counts(state: CountsState, argv: list, cwd: str):
+    args = dog_list.get_arg_parser().parse_args(argv)
+    dogs_df, report_time = state.dogs(join(cwd, args.filename))
+    dog_list.print_dog_counts(args, dogs_df, report_time)
+
+
+commands = {
+    'shift_counts': run_shift_counts,
+    'dog_counts': run_dog_counts,
+}
+
+
+class CountsRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            output = io.StringIO()
+            with redirect_stdout(output):
+                commands[request['command']](self.server.state, request['argv'], request['cwd'])
+            response = {'output': output.getvalue()}
+        except (Exception, SystemExit):
+            response = {'error': traceback.format_exc()}
+        self.wfile.write(json.dumps(response).encode())
+
+
+class CountsServer(socketserver.UnixStreamServer):
+    """
+    Requests are served one at a time; each is answered from memory in milliseconds and stdout is
+    redirected per request.
+    """
+
+    def __init__(self, socket_path: str, state: CountsState):
+        self.state = state
+        super().__init__(socket_path, CountsRequestHandler)
+
+
+def watch_files(state: CountsState, interval: float, stop: threading.Event):
+    while not stop.wait(interval):
+        try:
+            state.refresh()
+        except Exception:
+            traceback.print_exc()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--socket', help='Unix socket to listen on', default=SOCKET_PATH, required=False)
+    parser.add_argument('--interval', help='Seconds between checks for changed files', type=float, default=2.0,
+                        required=False)
+    parser.add_argument('--watch', help='DBS report PDFs, DCE schedule directories or workbooks or dog exercise CSVs '
+                                        'to load at start', nargs='*', default=[], required=False)
+    args = parser.parse_args()
+
+    state = CountsState()
+    for path in args.watch:
+        state.watch(path)
+
+    os.makedirs(dirname(args.socket), exist_ok=True)
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_files, args=(state, args.interval, stop), daemon=True)
+    watcher.start()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with CountsServer(args.socket, state) as server:
+        print(f'Serving counts on {args.socket}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Local HTTP service with the shift, DCE and dog counts for dashboards and coordinators.  Needs aiohttp.
+
+    python counts_server.py --root ~/Downloads
+    curl 'http://localhost:8642/shift_counts?dbs=DBS%20Schedule.pdf&dce=dce_html&format=html'
+
+Endpoints, with paths relative to --root:
+    /shift_counts?dbs=<pdf>[&dce=<html dir or workbook>]   Counts by standard shift, as from shift_counts.py
+    /dce_counts?dce=<html dir or workbook>                 DCE counts by shift start and end
+    /dog_counts?dogs=<csv>                                  DBS and Staff/BPA dog counts
+format is json (default), csv or html.
+
+Parsing runs in a process pool so the event loop stays responsive.  Results are kept in an LRU cache
+keyed by the content hash of the input files, which also makes the ETag, so repeated requests for
+unchanged exports are never parsed twice and requests with a matching If-None-Match get a 304.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from os.path import abspath, commonpath, expanduser, isdir, isfile, join
+
+from aiohttp import web
+
+import dce_shift_counts_from_excel as dce_excel
+import dce_shift_counts_from_html as dce_html
+import etl_dog_ex_list as dog_list
+import shift_counts
+import shift_exceptions as exceptions
+import table_output
+from lazy_imports import lazy_import
+from schedule_cache import ScheduleCache, file_hash
+
+pd = lazy_import('pandas')
+
+content_types = {'json': 'application/json', 'csv': 'text/csv', 'html': 'text/html'}
+
+
+def load_dce_counts(path: str):
+    if path.lower().endswith(('.xlsx', '.xls')):
+        return dce_excel.load_and_summarize_dce_counts(path, ScheduleCache())
+    return dce_html.load_and_summarize_dce_counts(path)
+
+
+def load_shift_counts(dbs_file: str, dce_path: str = None):
+    shift_counts_df = shift_counts.load_and_summarize_dbs_counts(dbs_file, ScheduleCache())
+    sources = {'DBS': shift_counts_df}
+    if dce_path:
+        sources['DCE'] = load_dce_counts(dce_path)
+    return shift_counts.assign_sources_to_shift(sources, shift_counts.get_schedule(shift_counts_df))
+
+
+def load_dog_counts(dogs_file: str) -> dict:
+    dogs, report_time = dog_list.get_dogs(dogs_file)
+    dogs_df = dog_list.get_dog_dataframe(dogs)
+    return {'report_time': report_time,
+            'DBS': dog_list.get_dog_counts_table(dog_list.filter_for_dbs(dogs_df)),
+            'Staff/BPA': dog_list.get_dog_counts_table(dog_list.filter_for_non_dbs(dogs_df))}
+
+
+def render_shift_counts(assigned, fmt: str) -> str:
+    table_df = shift_counts.format_shift_counts(assigned)
+    if fmt == 'html':
+        return shift_counts.get_shift_counts_as_html(table_df)
+    table_df.insert(0, 'Start', [shift[0] for shift in assigned.index])
+    table_df.insert(1, 'End', [shift[1] for shift in assigned.index])
+    if fmt == 'csv':
+        return table_df.to_csv(index=False)
+    return table_df.to_json(orient='records', date_format='iso')
+
+
+def render_dce_counts(dce_counts_df, fmt: str) -> str:
+    table_df = dce_counts_df.reset_index()
+    if fmt == 'html':
+        return table_output.render_table(table_df, table_id='dce_counts')
+    if fmt == 'csv':
+        return table_df.to_csv(index=False)
+    return table_df.to_json(orient='records', date_format='iso')
+
+
+def render_dog_counts(dog_counts: dict, fmt: str) -> str:
+    groups = {group: table_df for group, table_df in dog_counts.items() if group != 'report_time'}
+    report_time = dog_counts['report_time'].isoformat()
+    if fmt == 'html':
+        out = io.StringIO()
+        out.write(f'<h3>{report_time}</h3>\n')
+        for group, table_df in groups.items():
+            out.write(f'<h2>{group} Dog Counts</h2>\n')
+            table_output.write_table(table_df, out, index=True, table_id=group.split('/')[0].lower() + '_dog_counts')
+        return out.getvalue()
+    rows = [{'Group': group, 'Level': level, **row} for group, table_df in groups.items()
+            for level, row in table_df.to_dict(orient='index').items()]
+    if fmt == 'csv':
+        return pd.DataFrame(rows).to_csv(index=False)
+    return json.dumps({'report_time': report_time, 'counts': rows})
+
+
+# Loader and renderer by endpoint, with the query parameters naming input files
+endpoints = {
+    'shift_counts': (load_shift_counts, render_shift_counts, ('dbs', 'dce')),
+    'dce_counts': (load_dce_counts, render_dce_counts, ('dce',)),
+    'dog_counts': (load_dog_counts, render_dog_counts, ('dogs',)),
+}
+
+
+def run_loader(rules: exceptions.ExceptionRules, loader, *paths):
+    """
+    Run a loader in a pool process with the exception rules of the request
+    """
+    exceptions.use_rules(rules)
+    return loader(*paths)
+
+
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class CountsService:
+    def __init__(self, root: str, workers: int = None, cache_entries: int = 64):
+        self.root = abspath(expanduser(root))
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.cache = LRUCache(cache_entries)
+        self.pending = {}  # Loads in progress by cache key, shared by concurrent requests
+        self.hashes = {}  # Content hash by path, valid while the modification time and size are unchanged
+
+    def resolve(self, name: str) -> str:
+        path = abspath(join(self.root, name))
+        if commonpath([self.root, path]) != self.root or not (isfile(path) or isdir(path)):
+            raise web.HTTPNotFound(text=f'{name} not found')
+        return path
+
+    def content_hash(self, path: str) -> str:
+        if isdir(path):
+            digest = hashlib.sha256()
+            for name in sorted(os.listdir(path)):
+                if isfile(join(path, name)):
+                    digest.update(f'{name}:{self.content_hash(join(path, name))}\n'.encode())
+            return digest.hexdigest()
+        stat = os.stat(path)
+        entry = self.hashes.get(path)
+        if entry is None or entry[0] != (stat.st_mtime_ns, stat.st_size):
+            entry = ((stat.st_mtime_ns, stat.st_size), file_hash(path))
+            self.hashes[path] = entry
+        return entry[1]
+
+    async def load(self, key: tuple, loader, paths: list, rules: exceptions.ExceptionRules):
+        """
+        Parsed result for key from the cache, otherwise from the loader run in the process pool.
+        Concurrent requests for the same key wait on the one load.
+        """
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        if key not in self.pending:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, run_loader, rules, loader, *paths)
+            self.pending[key] = asyncio.ensure_future(future)
+        try:
+            result = await asyncio.shield(self.pending[key])
+        finally:
+            if key in self.pending and self.pending[key].done():
+                del self.pending[key]
+        self.cache.put(key, result)
+        return result
+
+    async def handle(self, request: web.Request) -> web.Response:
+        endpoint = request.match_info['endpoint']
+        if endpoint not in endpoints:
+            raise web.HTTPNotFound(text=f'Unknown endpoint {endpoint}, expected one of {", ".join(endpoints)}')
+        loader, renderer, params = endpoints[endpoint]
+        fmt = request.query.get('format', 'json')
+        if fmt not in content_types:
+            raise web.HTTPBadRequest(text=f'Unknown format {fmt}, expected one of {", ".join(content_types)}')
+        if params[0] not in request.query:
+            raise web.HTTPBadRequest(text=f'{params[0]} is required')
+        paths = [self.resolve(request.query[param]) for param in params if param in request.query]
+
+        loop = asyncio.get_running_loop()
+        hashes = await loop.run_in_executor(None, lambda: [self.content_hash(path) for path in paths])
+        rules = exceptions.get_rules()
+        key = (endpoint, rules.digest, *hashes)
+        etag = '"' + hashlib.sha256(repr((key, fmt)).encode()).hexdigest()[:32] + '"'
+        if etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers={'ETag': etag})
+
+        body = self.cache.get(key + (fmt,))
+        if body is None:
+            result = await self.load(key, loader, paths, rules)
+            body = await loop.run_in_executor(None, renderer, result, fmt)
+            self.cache.put(key + (fmt,), body)
+        return web.Response(text=body, content_type=content_types[fmt], headers={'ETag': etag})
+
+
+def make_app(service: CountsService) -> web.Application:
+    async def shutdown_executor(_):
+        service.executor.shutdown(wait=False)
+
+    app = web.Application()
+    app.router.add_get('/{endpoint}', service.handle)
+    app.on_cleanup.append(shutdown_executor)
+    return app
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--root', help='Directory the requested files are relative to', default='.', required=False)
+    parser.add_argument('--host', help='Address to listen on', default='127.0.0.1', required=False)
+    parser.add_argument('--port', help='Port to listen on', type=int, default=8642, required=False)
+    parser.add_argument('--workers', help='Number of parsing processes, default one per CPU', type=int, default=None,
+                        required=False)
+    parser.add_argument('--cache_entries', help='Parsed results and responses kept in memory', type=int, default=64,
+                        required=False)
+    parser.add_argument('--exceptions', help='Exception rules file, YAML or JSON', metavar='rules_file',
+                        required=False)
+    args = parser.parse_args()
+
+    if args.exceptions:
+        exceptions.use_rules(exceptions.load_rules(args.exceptions))
+    service = CountsService(args.root, args.workers, args.cache_entries)
+    web.run_app(make_app(service), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
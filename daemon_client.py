@@ -0,0 +1,38 @@
+import json
+import os
+import socket
+from os.path import exists, expanduser
+from typing import Optional
+
+SOCKET_PATH = os.environ.get('SHS_COUNTS_SOCKET', expanduser('~/.cache/shs_counts/daemon.sock'))
+
+
+def query(command: str, argv: list, socket_path: str = SOCKET_PATH, timeout: float = 60.0) -> Optional[str]:
+    """
+    Ask a running counts daemon for the output of a command.  Only the standard library is used so
+    the query costs no more than the interpreter start.
+    :param command: Daemon command, e.g. shift_counts or dog_counts
+    :param argv: Command line arguments, as they would be passed to the script
+    :param socket_path: Unix socket the daemon listens on
+    :param timeout: Seconds to wait for the answer
+    :return: text the script would have printed, None if no daemon answered or it failed
+    """
+    if not exists(socket_path):
+        return None
+    request = json.dumps({'command': command, 'argv': argv, 'cwd': os.getcwd()}) + '\n'
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(request.encode())
+            client.shutdown(socket.SHUT_WR)
+            chunks = []
+            for chunk in iter(lambda: client.recv(65536), b''):
+                chunks.append(chunk)
+    except OSError:
+        return None
+    try:
+        response = json.loads(b''.join(chunks))
+    except ValueError:
+        return None
+    return response.get('output')
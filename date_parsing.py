@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+
+DBS_PDF = 'dbs_pdf'
+DCE_EXCEL = 'dce_excel'
+
+# Candidate formats for the combined "<date> <time>" strings of each source, most likely first
+date_time_formats = {
+    DBS_PDF: ('%m/%d/%Y %I:%M %p', '%m/%d/%y %I:%M %p', '%a %m/%d/%Y %I:%M %p', '%A, %B %d, %Y %I:%M %p',
+              '%B %d, %Y %I:%M %p', '%b %d, %Y %I:%M %p', '%m/%d/%Y %H:%M'),
+    DCE_EXCEL: ('%m/%d/%Y %I:%M %p', '%m/%d/%y %I:%M %p', '%Y-%m-%d %I:%M %p', '%Y-%m-%d %H:%M:%S',
+                '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M'),
+}
+
+# Format found to work for each source, so detection only happens once per source
+_format_cache = {}
+
+
+def combine_date_time(dates: pd.Series, times: pd.Series, strip_pattern: Optional[str] = None) -> pd.Series:
+    """
+    Build "<date> <time>" strings with vectorized string operations
+    :param dates: Date strings
+    :param times: Time strings
+    :param strip_pattern: Optional regex removed from the dates first, e.g. a trailing day name
+    :return: combined date time strings
+    """
+    if strip_pattern:
+        dates = dates.str.replace(strip_pattern, '', regex=True)
+    return dates.str.cat(times, sep=' ')
+
+
+def detect_format(sample: str, source: str) -> Optional[str]:
+    for fmt in date_time_formats.get(source, ()):
+        try:
+            datetime.strptime(sample, fmt)
+            return fmt
+        except ValueError:
+            continue
+    return None
+
+
+def parse_date_times(date_times: pd.Series, source: str) -> pd.Series:
+    """
+    Parse date time strings using the explicit format known for the source.  The format is detected
+    from the first value on first use and cached.  Values that do not match fall back to pandas'
+    general purpose parser.
+    :param date_times: Combined date time strings
+    :param source: Source type, e.g. DBS_PDF or DCE_EXCEL
+    :return: parsed datetime64 series
+    """
+    fmt = _format_cache.get(source)
+    if fmt is None:
+        samples = date_times.dropna()
+        fmt = detect_format(samples.iloc[0], source) if len(samples) > 0 else None
+    if fmt is not None:
+        try:
+            parsed = pd.to_datetime(date_times, format=fmt, cache=True)
+            _format_cache[source] = fmt
+            return parsed
+        except ValueError:
+            _format_cache.pop(source, None)
+    return pd.to_datetime(date_times, cache=True)
@@ -1,19 +1,35 @@
-import re
-from argparse import ArgumentParser
-from datetime import date, datetime, timedelta
-from typing import Tuple, List
+from __future__ import annotations
+
+import importlib.util
+import os
+from os.path import abspath
+from typing import Tuple, Optional
+
+import date_parsing as dates
+import profiling
 import shift_exceptions as exceptions
+from lazy_imports import lazy_import
+from schedule_cache import ScheduleCache, file_hash
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
-import pandas as pd
-import tabula
+_calamine = importlib.util.find_spec('python_calamine') is not None
+
+GREEN_LEVEL = 'GREEN-D'
+level_columns = ['First name Last name', 'LEVEL']
+shift_columns = ['First name', 'Last name', 'Date', 'From time', 'To time']
+
+# Counts by workbook path, valid while the modification time and size are unchanged
+_workbook_counts = {}
 
 
 def transform_dce_dates(schedule_df: pd.DataFrame) -> pd.DataFrame:
-    schedule_df['Begin'] = schedule_df.apply(lambda l: l['Date'] + ' ' + l['From time'], axis=1)
-    schedule_df['Start_Date'] = pd.to_datetime(schedule_df['Begin'], infer_datetime_format=True)
-    schedule_df['End'] = schedule_df.apply(lambda l: l['Date'] + ' ' + l['To time'], axis=1)
-    schedule_df['End_Date'] = pd.to_datetime(schedule_df['End'], infer_datetime_format=True)
-    schedule_df = schedule_df.drop(['Date', 'Begin', 'End', 'From time', 'To time'], axis=1)
+    schedule_df['Start_Date'] = dates.parse_date_times(
+        dates.combine_date_time(schedule_df['Date'], schedule_df['From time']), dates.DCE_EXCEL)
+    schedule_df['End_Date'] = dates.parse_date_times(
+        dates.combine_date_time(schedule_df['Date'], schedule_df['To time']), dates.DCE_EXCEL)
+    schedule_df = schedule_df.drop(['Date', 'From time', 'To time'], axis=1)
     return schedule_df
 
 
@@ -24,21 +40,88 @@ def get_dce_shift_counts(schedule_df: pd.DataFrame) -> pd.DataFrame:
     return shift_counts
 
 
-def load_and_summarize_dce_counts(file_name: str) -> pd.DataFrame:
-    # Load level by name data
-    dces = pd.read_excel(file_name, sheet_name=0)
-    greens = dces[dces.LEVEL == 'GREEN-D']
-    greens = greens.rename(columns={'First name Last name': 'Full Name', 'LEVEL': 'Level'})
-    greens.set_index('Full Name', inplace=True)
+def _read_sheets_calamine(file_name: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_path(file_name)
+    sheets = []
+    for sheet, columns in ((0, level_columns), (1, shift_columns)):
+        rows = workbook.get_sheet_by_index(sheet).to_python()
+        positions = [rows[0].index(column) for column in columns]
+        sheets.append(pd.DataFrame({
+            column: [None if row[i] == '' else str(row[i]) for row in rows[1:]]
+            for column, i in zip(columns, positions)
+        }))
+    return sheets[0], sheets[1]
+
+
+@profiling.stage
+def read_dce_workbook(file_name: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read only the columns used from the level by name and shift by name sheets, all as strings.
+    python-calamine is used when installed, otherwise pandas' default engine.
+    :return: tuple of (levels, shifts)
+    """
+    if _calamine:
+        return _read_sheets_calamine(file_name)
+    levels = pd.read_excel(file_name, sheet_name=0, usecols=level_columns, dtype=str)
+    sched = pd.read_excel(file_name, sheet_name=1, usecols=shift_columns, dtype=str)
+    return levels, sched
+
+
+@profiling.stage
+def get_green_signups(levels: pd.DataFrame, sched: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shift sign ups of Green DCEs.  Each distinct first and last name pair gets an integer key, so
+    full names are built and matched against the level sheet once per person rather than per row.
+    :return: Name, Date, From time and To time of each sign up
+    """
+    green_names = levels.loc[levels['LEVEL'] == GREEN_LEVEL, 'First name Last name'].unique()
+    name_codes, names = pd.MultiIndex.from_arrays([sched['First name'], sched['Last name']]).factorize()
+    full_names = np.array([f'{first} {last}' for first, last in names], dtype=object)
+    is_green = np.append(np.isin(full_names, green_names), False)[name_codes]  # Last entry for missing names (-1)
+    signups = sched.loc[is_green, ['Date', 'From time', 'To time']]
+    signups.insert(0, 'Name', full_names[name_codes[is_green]])
+    return signups
+
+
+@profiling.stage
+def count_signups(signups: pd.DataFrame, rules: Optional[exceptions.ExceptionRules] = None) -> pd.DataFrame:
+    """
+    Count sign ups per distinct date and time strings first, so dates are parsed once per shift.  When
+    there are exception rules the counts are also kept by name until the rules are applied.
+    :return: Green counts by Start_Date and End_Date, as from get_dce_shift_counts, plus Blue or Purple
+    counts if rules reclassified any sign ups
+    """
+    rules = exceptions.get_rules() if rules is None else rules
+    keys = ['Name', 'Date', 'From time', 'To time'] if rules else ['Date', 'From time', 'To time']
+    counts = signups.groupby(keys, sort=False).size()
+    shifts_df = transform_dce_dates(counts.index.to_frame(index=False))
+    shifts_df['Green'] = counts.values
+    shifts_df = exceptions.apply_exceptions_to_counts(shifts_df, 'Green', rules)
+    levels = [level for level in exceptions.LEVELS if level in shifts_df.columns]
+    return shifts_df.groupby(['Start_Date', 'End_Date'])[levels].sum()
 
-    # Load the shift by name data
-    sched = pd.read_excel(file_name, sheet_name=1)
-    sched['Full Name'] = sched['First name'] + ' ' + sched['Last name']
-    sched = sched.drop(columns=['First name', 'Last name', 'Note', 'Number'])
-    sched.set_index('Full Name', inplace=True)
 
-    # Add shift data for all Green DCEs
-    greens_shift_df = greens.merge(left_on='Full Name', right=sched, right_on='Full Name')
-    greens_shift_df = transform_dce_dates(greens_shift_df)
+@profiling.stage
+def load_and_summarize_dce_counts(file_name: str, cache: Optional[ScheduleCache] = None) -> pd.DataFrame:
+    """
+    Green DCE counts by shift from the DCE schedule workbook, with the exception rules applied.  Counts
+    are kept in memory by path while the file's modification time and size and the rules are unchanged,
+    and in the cache by content hash and rules.
+    """
+    rules = exceptions.get_rules()
+    stat = os.stat(file_name)
+    path = abspath(file_name)
+    entry = _workbook_counts.get(path)
+    if entry is not None and entry[0] == (stat.st_mtime_ns, stat.st_size, rules.digest):
+        return entry[1]
 
-    return get_dce_shift_counts(greens_shift_df)
+    key = f'dce_excel-{file_hash(file_name)}-{rules.digest}' if cache is not None else None
+    counts_df = cache.get_schedule(key) if cache is not None else None
+    if counts_df is None:
+        counts_df = count_signups(get_green_signups(*read_dce_workbook(file_name)), rules)
+        if cache is not None:
+            cache.put(key, file_name, None, counts_df, 0)
+    _workbook_counts[path] = ((stat.st_mtime_ns, stat.st_size, rules.digest), counts_df)
+    return counts_df
@@ -1,11 +1,19 @@
+from __future__ import annotations
+
 import re
 from collections import Counter
 from datetime import datetime
 from os import listdir
+from functools import partial
 from os.path import isdir, isfile, join
+from typing import Optional
+
+import profiling
+from lazy_imports import lazy_import
 
-import bs4
-import pandas as pd
+bs4 = lazy_import('bs4')
+pd = lazy_import('pandas')
+lxml_html = lazy_import('lxml.html')
 
 
 def extract_month_year(sched) -> tuple:
@@ -30,25 +38,32 @@ def extract_day(sched_col) -> int:
     return -1
 
 
+green_rx = re.compile(r'GREEN-D')
+time_extract = re.compile(r'(.*)Dog Care.*')
+
+
+def get_shift_time(text: str) -> Optional[tuple]:
+    text = text.replace("\n", "")
+    time_match = time_extract.match(text)
+    if time_match:
+        shift = time_match.group(1)
+        shift = shift.replace(u"\xa0", u" ")
+        shift = shift.replace("a", "am")
+        shift = shift.replace("p", "pm")
+        begin, end = shift.split('-')
+        begin = begin.strip()
+        end = end.strip()
+        return begin, end
+    return None
+
+
 def get_shift_counts_for_day(sched_entries) -> Counter:
     shift_counts = Counter()
-    rx = re.compile(r'GREEN-D')
-    time_extract = re.compile(r'(.*)Dog Care.*')
     for se in sched_entries:
-        elem = se.find('', text=rx)
+        elem = se.find('', text=green_rx)
         if elem:
-            text = elem.parent.get_text()
-            text = text.replace("\n", "")
-            time_match = time_extract.match(text)
-            if time_match:
-                shift = time_match.group(1)
-                shift = shift.replace(u"\xa0", u" ")
-                shift = shift.replace("a", "am")
-                shift = shift.replace("p", "pm")
-                begin, end = shift.split('-')
-                begin = begin.strip()
-                end = end.strip()
-                shift_time = (begin, end)
+            shift_time = get_shift_time(elem.parent.get_text())
+            if shift_time:
                 shift_counts[shift_time] += 1
     return shift_counts
 
@@ -68,15 +83,69 @@ def map_shift_counts(sched_rows, year, month) -> dict:
     return counts_by_shift
 
 
-def process_dce_html_file(file_name) -> dict:
-    with open(file_name, 'rb') as dce_html:
-        sched = bs4.BeautifulSoup(dce_html.read(), 'html5lib')
+def parse_dce_html5lib(html: bytes) -> dict:
+    sched = bs4.BeautifulSoup(html, 'html5lib')
     month, year = extract_month_year(sched)
     sched_rows = find_sched_rows(sched)
     shift_counts = map_shift_counts(sched_rows, year, month)
     return shift_counts
 
 
+def _with_class(path: str, css_class: str) -> str:
+    return f"{path}[contains(concat(' ', normalize-space(@class), ' '), ' {css_class} ')]"
+
+
+def get_shift_counts_for_day_lxml(sched_entries) -> Counter:
+    shift_counts = Counter()
+    for se in sched_entries:
+        for elem in se.xpath('.//text()'):
+            if green_rx.search(elem):
+                parent = elem.getparent().getparent() if elem.is_tail else elem.getparent()
+                shift_time = get_shift_time(parent.text_content())
+                if shift_time:
+                    shift_counts[shift_time] += 1
+                break
+    return shift_counts
+
+
+def parse_dce_lxml(html: bytes) -> dict:
+    """
+    Same extraction as parse_dce_html5lib using lxml and XPath.  Only the SDM/SDY inputs and the
+    P2_29 schedule table are visited, and no Python object is built for the rest of the page.
+    """
+    if lxml_html is None:
+        raise ImportError('The lxml DCE parser requires the lxml package')
+    root = lxml_html.fromstring(html)
+    month = int(root.xpath('(//input[@name="SDM"])[1]/@value')[0])
+    year = int(root.xpath('(//input[@name="SDY"])[1]/@value')[0])
+    counts_by_shift = {}
+    sched_table = root.xpath('(//table[@id="P2_29"])[1]')[0]
+    for sched_row in sched_table.xpath(_with_class('.//tr', 'vicnet229')):
+        for sched_col in sched_row.xpath(_with_class('td', 'a')):
+            sched_day = sched_col.xpath(_with_class('(.//span', 'e') + ')[1]')
+            day_text = sched_day[0].text_content() if sched_day else ''
+            if not re.fullmatch(r'\d{1,2}', day_text) or int(day_text) < 1:
+                continue
+            sched_entries_table = sched_col.xpath('(.//table[@id="P2_31"])[1]')
+            if not sched_entries_table:
+                continue
+            sched_entries = sched_entries_table[0].xpath(_with_class('.//tr', 'vicnet228'))
+            counts_by_shift[(year, month, int(day_text))] = get_shift_counts_for_day_lxml(sched_entries)
+    return counts_by_shift
+
+
+dce_parsers = {
+    'html5lib': parse_dce_html5lib,
+    'lxml': parse_dce_lxml,
+}
+
+
+@profiling.stage
+def process_dce_html_file(file_name, parser: str = 'html5lib') -> dict:
+    with open(file_name, 'rb') as dce_html:
+        return dce_parsers[parser](dce_html.read())
+
+
 def get_time_component(time: str) -> tuple:
     period_adjust = {'am': 0, 'pm': 12}
     time_pat = re.compile('[: ]')
@@ -88,6 +157,7 @@ def get_time_component(time: str) -> tuple:
     return hour, minute
 
 
+@profiling.stage
 def get_counts_by_shift(shift_counts: dict) -> dict:
     counts_by_shift = []
     for day, counts in shift_counts.items():
@@ -101,16 +171,41 @@ def get_counts_by_shift(shift_counts: dict) -> dict:
     return counts_df.groupby(['Start_Date', 'End_Date']).sum()
 
 
-def load_and_summarize_dce_counts(file_name: str) -> pd.DataFrame:
+def merge_shift_counts(all_shift_counts) -> dict:
+    merged = {}
+    for shift_counts in all_shift_counts:
+        for day, counts in shift_counts.items():
+            merged.setdefault(day, Counter()).update(counts)
+    return merged
+
+
+@profiling.stage
+def process_dce_html_files(files: list, workers: int = None, parser: str = 'html5lib') -> dict:
+    """
+    Parse DCE schedule files in a process pool and merge the per day counts
+    :param files: DCE schedule HTML files
+    :param workers: Number of worker processes, None for one per CPU.  1 parses in the current process.
+    :param parser: Name of the parser backend in dce_parsers
+    :return: shift counts by day for all files
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    process_file = partial(process_dce_html_file, parser=parser)
+    if workers == 1 or len(files) < 2:
+        return merge_shift_counts(process_file(sched) for sched in files)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return merge_shift_counts(executor.map(process_file, files))
+
+
+@profiling.stage
+def load_and_summarize_dce_counts(file_name: str, workers: int = 1, parser: str = 'html5lib') -> pd.DataFrame:
     if isdir(file_name):
-        files = [join(file_name, sched) for sched in listdir(file_name) if isfile(join(file_name, sched))]
-        scs = [load_and_summarize_dce_counts(sched) for sched in files]
-        shift_counts_df = pd.concat(scs)
+        files = [join(file_name, sched) for sched in sorted(listdir(file_name)) if isfile(join(file_name, sched))]
+        shift_counts = process_dce_html_files(files, workers, parser)
     else:
-        shift_counts = process_dce_html_file(file_name)
-        shift_counts_df = get_counts_by_shift(shift_counts)
+        shift_counts = process_dce_html_file(file_name, parser)
 
-    return shift_counts_df
+    return get_counts_by_shift(shift_counts)
 
 
 def main():
@@ -0,0 +1,289 @@
+"""
+Forecast of the number of DBS dogs per day from archived Dog Exercise Lists, to set against the Need of
+the shifts in the shift history.
+
+    python dog_forecast.py ingest ~/Downloads/dog_lists
+    python dog_forecast.py forecast
+
+Ingesting reads only the exports not seen before and keeps one feature vector per report (see FEATURES)
+in a NumPy file.  The model is a ridge regression per forecast horizon of the DBS dogs on a day from
+the features of the last report h days earlier and the weekday.  It keeps only the sums XᵀX and Xᵀy,
+so each completed day of reports is folded in without refitting over the history.  The day of the
+latest report is left out until a report of a later day arrives, as more reports of it may follow.
+Older days are discounted by decay.  refit rebuilds the model from the stored features, e.g. after
+reports older than the last day folded in were ingested.
+"""
+from __future__ import annotations
+
+import os
+from argparse import ArgumentParser
+from os.path import expanduser, isfile, join
+from typing import Optional
+
+import etl_dog_ex_list as dog_list
+import shift_history
+from lazy_imports import lazy_import
+from report_files import find_reports
+from schedule_cache import file_hash
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+DEFAULT_FORECAST_DIR = os.environ.get('SHS_COUNTS_FORECAST', expanduser('~/.local/share/shs_counts/forecast'))
+# Bump when FEATURES changes so stored features and models are rebuilt
+FEATURE_VERSION = 1
+LEVELS = ['Green', 'Blue', 'Purple', 'Red - Team', 'Red', 'Red - BQ', 'Red - Default', 'Orange']
+AGE_BINS = [6, 12, 36, 84]  # Months; the bins are below 6, 6 to 12, ... and 84 or more
+WEIGHT_BINS = [25, 50, 75]  # Pounds
+FEATURES = ['dbs_dogs', 'all_dogs'] + [f'level_{level}' for level in LEVELS] + ['holder', 'kc', 'bite'] + \
+    [f'age_bin_{i}' for i in range(len(AGE_BINS) + 1)] + [f'weight_bin_{i}' for i in range(len(WEIGHT_BINS) + 1)] + \
+    ['age_mean', 'weight_mean']
+
+
+def get_report_features(dogs_df: pd.DataFrame) -> np.ndarray:
+    """
+    :param dogs_df: Dogs by name, as from etl_dog_ex_list.get_dog_dataframe
+    :return: FEATURES of the report; holder, kc, bite, age and weight are of the DBS dogs
+    """
+    dbs_df = dog_list.filter_for_dbs(dogs_df)
+    levels = dogs_df['Level'].value_counts()
+    ages = dbs_df['age'].values.astype(np.float64)
+    weights = dbs_df['weight'].values.astype(np.float64)
+    return np.concatenate([
+        [len(dbs_df), len(dogs_df)],
+        [levels.get(level, 0) for level in LEVELS],
+        [dbs_df['holder'].sum(), dbs_df['kc'].sum(), dbs_df['bite'].sum()],
+        np.bincount(np.searchsorted(AGE_BINS, ages, side='right'), minlength=len(AGE_BINS) + 1),
+        np.bincount(np.searchsorted(WEIGHT_BINS, weights, side='right'), minlength=len(WEIGHT_BINS) + 1),
+        [ages.mean() if len(ages) else 0, weights.mean() if len(weights) else 0],
+    ]).astype(np.float32)
+
+
+def _save_npz(path: str, **arrays):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as npz_out:
+        np.savez(npz_out, **arrays)
+    os.replace(tmp_path, path)
+
+
+class FeatureStore:
+    """
+    Feature vectors of the ingested reports, a row per report in order of report time, with the
+    content hash of each export so it is only ingested once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.times = np.empty(0, dtype='datetime64[ns]')
+        self.hashes = np.empty(0, dtype='U64')
+        self.features = np.empty((0, len(FEATURES)), dtype=np.float32)
+        if isfile(path):
+            with np.load(path) as stored:
+                if int(stored['version']) == FEATURE_VERSION:
+                    self.times, self.hashes, self.features = stored['times'], stored['hashes'], stored['features']
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def add(self, times: np.ndarray, hashes: np.ndarray, features: np.ndarray):
+        order = np.argsort(np.concatenate([self.times, times]), kind='stable')
+        self.times = np.concatenate([self.times, times])[order]
+        self.hashes = np.concatenate([self.hashes, hashes])[order]
+        self.features = np.concatenate([self.features, features])[order]
+
+    def save(self):
+        _save_npz(self.path, version=FEATURE_VERSION, times=self.times, hashes=self.hashes, features=self.features)
+
+    def daily(self) -> tuple:
+        """
+        :return: tuple of (days, features of the last report of each day, DBS dogs of that report)
+        """
+        days = self.times.astype('datetime64[D]')
+        last = len(days) - 1 - np.unique(days[::-1], return_index=True)[1]
+        features = self.features[last].astype(np.float64)
+        return days[last], features, features[:, FEATURES.index('dbs_dogs')]
+
+
+class DemandModel:
+    """
+    Ridge regressions, one per horizon of 1 to horizon days, kept as decayed sums of XᵀX and Xᵀy
+    """
+
+    def __init__(self, horizon: int = 14, ridge: float = 1.0, decay: float = 0.98):
+        self.horizon = horizon
+        self.ridge = ridge
+        self.decay = decay
+        size = len(FEATURES) + 8  # Features, the target weekday and a constant
+        self.xtx = np.zeros((horizon, size, size))
+        self.xty = np.zeros((horizon, size))
+        self.samples = np.zeros(horizon, dtype=np.int64)
+        self.last_day = np.datetime64('NaT', 'D')  # Last target day folded in
+
+    @staticmethod
+    def design(features: np.ndarray, target_days: np.ndarray) -> np.ndarray:
+        """
+        :param features: FEATURES of the source reports, a row each
+        :param target_days: Day forecast from each row, datetime64[D]
+        :return: a design matrix row per source report
+        """
+        weekdays = np.zeros((len(target_days), 7))
+        weekdays[np.arange(len(target_days)), (target_days.astype(np.int64) + 3) % 7] = 1  # 1970-01-01 was a Thursday
+        return np.hstack([features, weekdays, np.ones((len(target_days), 1))])
+
+    def update(self, days: np.ndarray, features: np.ndarray, dbs_dogs: np.ndarray) -> int:
+        """
+        Fold in the days after last_day as targets, each paired with the reports 1 to horizon days before it.
+        The last of days is not folded in, as it may not have its last report yet.
+        :param days: Days with reports, ascending, as from FeatureStore.daily
+        :return: number of days folded in
+        """
+        complete = days < days[-1]
+        new = np.flatnonzero(complete & (days > self.last_day) if not np.isnat(self.last_day) else complete)
+        if len(new) == 0:
+            return 0
+        # Weight of each new day after discounting by the days folded in after it
+        weights = self.decay ** (days[new[-1]] - days[new]).astype(np.float64)
+        discount = self.decay ** (days[new[-1]] - self.last_day).astype(np.float64) \
+            if not np.isnat(self.last_day) else 1.0
+        for h in range(1, self.horizon + 1):
+            sources = np.searchsorted(days, days[new] - h)
+            found = (sources < len(days)) & (days[np.minimum(sources, len(days) - 1)] == days[new] - h)
+            x = self.design(features[sources[found]], days[new][found])
+            w = weights[found]
+            self.xtx[h - 1] = discount * self.xtx[h - 1] + (x * w[:, None]).T @ x
+            self.xty[h - 1] = discount * self.xty[h - 1] + (x * w[:, None]).T @ dbs_dogs[new][found]
+            self.samples[h - 1] += found.sum()
+        self.last_day = days[new[-1]]
+        return len(new)
+
+    def coefficients(self) -> np.ndarray:
+        penalty = self.ridge * np.eye(self.xtx.shape[1])
+        return np.linalg.solve(self.xtx + penalty, self.xty[:, :, None])[:, :, 0]
+
+    def predict(self, day: np.datetime64, features: np.ndarray, dbs_dogs: float) -> pd.DataFrame:
+        """
+        :param day: Day of the latest report
+        :param features: FEATURES of that report
+        :param dbs_dogs: DBS dogs of that report, forecast for horizons the model has no samples for
+        :return: DBS_Dogs forecast for each of the next horizon days, indexed by Date
+        """
+        target_days = day + np.arange(1, self.horizon + 1)
+        x = self.design(np.repeat(features[None, :], self.horizon, axis=0), target_days)
+        forecast = np.einsum('hd,hd->h', x, self.coefficients())
+        forecast = np.where(self.samples > 0, forecast, dbs_dogs)
+        return pd.DataFrame({'DBS_Dogs': np.maximum(forecast, 0).round(1)},
+                            index=pd.DatetimeIndex(target_days, name='Date'))
+
+    def save(self, path: str):
+        _save_npz(path, version=FEATURE_VERSION, horizon=self.horizon, ridge=self.ridge, decay=self.decay,
+                  xtx=self.xtx, xty=self.xty, samples=self.samples, last_day=self.last_day)
+
+    @classmethod
+    def load(cls, path: str) -> Optional[DemandModel]:
+        if not isfile(path):
+            return None
+        with np.load(path) as stored:
+            if int(stored['version']) != FEATURE_VERSION:
+                return None
+            model = cls(int(stored['horizon']), float(stored['ridge']), float(stored['decay']))
+            model.xtx, model.xty, model.samples = stored['xtx'], stored['xty'], stored['samples']
+            model.last_day = stored['last_day'][()]
+        return model
+
+
+def features_file(forecast_dir: str) -> str:
+    return join(forecast_dir, 'features.npz')
+
+
+def model_file(forecast_dir: str) -> str:
+    return join(forecast_dir, 'model.npz')
+
+
+def ingest_dog_lists(patterns: list, forecast_dir: str = DEFAULT_FORECAST_DIR) -> tuple:
+    """
+    Add the features of exports not ingested before and fold the newly completed days into the model
+    :param patterns: Dog Exercise List CSVs, directories holding them or glob patterns
+    :return: tuple of (reports added, days folded into the model)
+    """
+    store = FeatureStore(features_file(forecast_dir))
+    known = set(store.hashes.tolist())
+    times, hashes, features = [], [], []
+    for file_name in find_reports(patterns, '.csv'):
+        source_hash = file_hash(file_name)
+        if source_hash in known:
+            continue
+        known.add(source_hash)
+        dogs, report_time = dog_list.get_dogs(file_name)
+        times.append(np.datetime64(report_time, 'ns'))
+        hashes.append(source_hash)
+        features.append(get_report_features(dog_list.get_dog_dataframe(dogs)))
+    if times:
+        store.add(np.array(times), np.array(hashes, dtype='U64'), np.vstack(features))
+        store.save()
+
+    model = DemandModel.load(model_file(forecast_dir)) or DemandModel()
+    days_folded = model.update(*store.daily()) if len(store) else 0
+    model.save(model_file(forecast_dir))
+    return len(times), days_folded
+
+
+def refit_model(forecast_dir: str = DEFAULT_FORECAST_DIR, horizon: int = 14, ridge: float = 1.0,
+                decay: float = 0.98) -> DemandModel:
+    model = DemandModel(horizon, ridge, decay)
+    store = FeatureStore(features_file(forecast_dir))
+    if len(store):
+        model.update(*store.daily())
+    model.save(model_file(forecast_dir))
+    return model
+
+
+def forecast_dbs_dogs(forecast_dir: str = DEFAULT_FORECAST_DIR,
+                      history_dir: Optional[str] = shift_history.DEFAULT_HISTORY_DIR) -> Optional[pd.DataFrame]:
+    """
+    :return: DBS_Dogs forecast for the days after the latest report, with the total Need and the number of
+    Shifts of each day from the shift history where recorded; None if no reports were ingested
+    """
+    store = FeatureStore(features_file(forecast_dir))
+    model = DemandModel.load(model_file(forecast_dir))
+    if not len(store) or model is None:
+        return None
+    days, features, dbs_dogs = store.daily()
+    forecast_df = model.predict(days[-1], features[-1], dbs_dogs[-1])
+    history_df = shift_history.load_history(forecast_df.index[0], forecast_df.index[-1], history_dir) \
+        if history_dir else None
+    if history_df is not None and len(history_df):
+        need = history_df.groupby(pd.to_datetime(history_df['Start']).dt.normalize())['Need'].agg(['sum', 'size'])
+        forecast_df['Need'] = need['sum'].reindex(forecast_df.index)
+        forecast_df['Shifts'] = need['size'].reindex(forecast_df.index)
+    return forecast_df
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('command', choices=['ingest', 'forecast', 'refit'])
+    parser.add_argument('paths', help='Dog exercise CSVs, directories holding them or glob patterns', nargs='*')
+    parser.add_argument('--horizon', help='Days forecast by refit', type=int, default=14)
+    parser.add_argument('--ridge', help='Ridge penalty used by refit', type=float, default=1.0)
+    parser.add_argument('--decay', help='Weight kept per day by older days, used by refit', type=float, default=0.98)
+    parser.add_argument('--forecast_dir', help='Feature and model store location', default=DEFAULT_FORECAST_DIR)
+    parser.add_argument('--history_dir', help='Shift history store with the Need to compare against',
+                        default=shift_history.DEFAULT_HISTORY_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        reports, days = ingest_dog_lists(args.paths, args.forecast_dir)
+        print(f'Ingested {reports} reports, {days} new days in the model')
+    elif args.command == 'refit':
+        model = refit_model(args.forecast_dir, args.horizon, args.ridge, args.decay)
+        print(f'Refit with {model.samples.sum()} samples through {model.last_day}')
+    else:
+        forecast_df = forecast_dbs_dogs(args.forecast_dir, args.history_dir)
+        if forecast_df is None:
+            print('No reports ingested yet')
+        else:
+            print(forecast_df.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Snapshots of the dog roster from successive Dog Exercise List reports, and the changes between them.
+Each report is stored once, keyed by dog id and report time, with a hash of the tracked fields of each
+dog.  Recording a report compares those hashes with the previous report's and appends only the dogs
+that arrived, left or changed to the change log.  The change log is stored as one Parquet file per
+month, so listing the changes over a range only reads the months involved and never the rosters.
+
+    python dog_snapshots.py import Dog_Exercise_List_*.csv
+    python dog_snapshots.py changes --start 2020-01-06 --end 2020-01-12
+    python dog_snapshots.py roster --at 2020-01-08T12:00
+
+The first report recorded is the baseline and adds no changes.
+"""
+from __future__ import annotations
+
+import os
+from argparse import ArgumentParser
+from datetime import datetime
+from os.path import expanduser, isfile, join
+from typing import Optional
+
+from lazy_imports import lazy_import
+from schedule_cache import file_hash
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get('SHS_COUNTS_SNAPSHOTS', expanduser('~/.local/share/shs_counts/snapshots'))
+# Fields hashed to detect a change.  Weight, age and notes change too often to be of interest.
+TRACKED = ['name', 'Level', 'location', 'holder', 'kc', 'bite', 'team']
+# Fields whose previous values are kept in the change log
+COMPARED = ['Level', 'location', 'holder', 'kc']
+ARRIVED = 'arrived'
+LEFT = 'left'
+CHANGED = 'changed'
+REPORT_COLUMNS = ['Report_Time', 'Dogs', 'Arrived', 'Left', 'Changed', 'Source_Hash']
+CHANGE_COLUMNS = ['Report_Time', 'Previous_Time', 'id', 'name', 'Change', 'Fields'] + \
+                 COMPARED + [f'Previous_{field}' for field in COMPARED]
+
+
+def reports_file(snapshot_dir: str) -> str:
+    return join(snapshot_dir, 'reports.parquet')
+
+
+def roster_file(snapshot_dir: str, report_time: pd.Timestamp) -> str:
+    return join(snapshot_dir, 'rosters', f'{report_time:%Y-%m-%d_%H%M}.parquet')
+
+
+def changes_file(snapshot_dir: str, month: pd.Period) -> str:
+    return join(snapshot_dir, 'changes', f'{month.year:04}-{month.month:02}.parquet')
+
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def get_roster_frame(dogs: dict) -> pd.DataFrame:
+    """
+    :param dogs: Dogs by name, as from etl_dog_ex_list.get_dogs
+    :return: id, the tracked fields and a uint64 Hash of them, one row per dog id, sorted by id
+    """
+    roster_df = pd.DataFrame([{'id': dog['id'], 'name': name, **{field: dog[field] for field in TRACKED[1:]}}
+                              for name, dog in dogs.items()], columns=['id'] + TRACKED)
+    roster_df = roster_df.drop_duplicates(subset=['id'], keep='last').sort_values('id').reset_index(drop=True)
+    for field in ('holder', 'kc', 'bite', 'team'):
+        roster_df[field] = roster_df[field].astype(bool)
+    roster_df['Hash'] = pd.util.hash_pandas_object(roster_df[TRACKED], index=False).values
+    return roster_df
+
+
+def diff_rosters(previous_df: pd.DataFrame, roster_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Dogs that arrived, left or changed between two rosters from get_roster_frame.  Records are matched
+    on id and compared by hash, so only the dogs that differ are compared field by field.
+    :return: one row per dog with the Change, the names of the changed Fields, and the current and
+    previous values of the COMPARED fields
+    """
+    rows = pd.Index(roster_df['id']).get_indexer(previous_df['id'])  # Row of each previous dog, -1 if it left
+    kept = rows >= 0
+    differ = ~kept
+    differ[kept] = previous_df['Hash'].values[kept] != roster_df['Hash'].values[rows[kept]]
+    arrived = np.ones(len(roster_df), dtype=bool)
+    arrived[rows[kept]] = False
+    # Rows of the dogs that differ in each roster, -1 where absent, ordered by id
+    previous_rows = np.concatenate([np.flatnonzero(differ), np.full(arrived.sum(), -1)])
+    rows = np.concatenate([rows[differ], np.flatnonzero(arrived)])
+    ids = np.concatenate([previous_df['id'].values[differ], roster_df['id'].values[arrived]])
+    order = np.argsort(ids, kind='stable')
+    ids, previous_rows, rows = ids[order], previous_rows[order], rows[order]
+    was_present, is_present = previous_rows >= 0, rows >= 0
+
+    previous = previous_df.reset_index(drop=True).reindex(previous_rows).reset_index(drop=True)
+    current = roster_df.reset_index(drop=True).reindex(rows).reset_index(drop=True)
+    changed = was_present & is_present
+    same_fields = pd.DataFrame({field: (current[field] == previous[field])
+                                | (current[field].isna() & previous[field].isna()) for field in TRACKED})
+    differs = ~same_fields.values & changed[:, None]
+    changes_df = pd.DataFrame({
+        'id': ids,
+        'name': np.where(is_present, current['name'].values, previous['name'].values),
+        'Change': np.where(changed, CHANGED, np.where(is_present, ARRIVED, LEFT)),
+        'Fields': [','.join(field for field, d in zip(TRACKED, row) if d) for row in differs],
+    })
+    for field in COMPARED:
+        changes_df[field] = np.where(is_present, current[field].astype(object).values, None)
+        changes_df[f'Previous_{field}'] = np.where(was_present, previous[field].astype(object).values, None)
+    return changes_df
+
+
+def load_reports(snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> pd.DataFrame:
+    if not isfile(reports_file(snapshot_dir)):
+        return pd.DataFrame(columns=REPORT_COLUMNS).astype({'Report_Time': 'datetime64[ns]'})
+    return pd.read_parquet(reports_file(snapshot_dir))
+
+
+def load_roster(report_time: Optional[datetime] = None, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) \
+        -> Optional[pd.DataFrame]:
+    """
+    :param report_time: Roster of the last report at or before this time, the latest report by default
+    :return: roster as from get_roster_frame with its Report_Time, or None if no report is that old
+    """
+    reports_df = load_reports(snapshot_dir)
+    if report_time is not None:
+        reports_df = reports_df[reports_df['Report_Time'] <= pd.Timestamp(report_time)]
+    if reports_df.empty:
+        return None
+    report_time = reports_df['Report_Time'].max()
+    return pd.read_parquet(roster_file(snapshot_dir, report_time)).assign(Report_Time=report_time)
+
+
+def append_changes(changes_df: pd.DataFrame, snapshot_dir: str):
+    for month, month_df in changes_df.groupby(changes_df['Report_Time'].dt.to_period('M')):
+        path = changes_file(snapshot_dir, month)
+        if isfile(path):
+            month_df = pd.concat([pd.read_parquet(path), month_df], ignore_index=True)
+        _write_parquet(month_df.reset_index(drop=True), path)
+
+
+def record_roster(dogs: dict, report_time: datetime, source_hash: str = '',
+                  snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> Optional[pd.DataFrame]:
+    """
+    Store the roster of a report and append its changes from the previous report to the change log.
+    Reports must be recorded in order of report time; a report no newer than the latest is skipped.
+    :param dogs: Dogs by name, as from etl_dog_ex_list.get_dogs
+    :param report_time: Time of the report
+    :param source_hash: Hash of the report file, kept in the report index
+    :return: changes recorded, or None if the report was skipped
+    """
+    report_time = pd.Timestamp(report_time)
+    reports_df = load_reports(snapshot_dir)
+    if len(reports_df) and report_time <= reports_df['Report_Time'].max():
+        return None
+    roster_df = get_roster_frame(dogs)
+    previous_df = load_roster(snapshot_dir=snapshot_dir)
+    if previous_df is None:
+        changes_df = pd.DataFrame(columns=CHANGE_COLUMNS)
+    else:
+        changes_df = diff_rosters(previous_df, roster_df)
+        changes_df.insert(0, 'Report_Time', report_time)
+        changes_df.insert(1, 'Previous_Time', previous_df['Report_Time'].iloc[0])
+        changes_df = changes_df[CHANGE_COLUMNS]
+        append_changes(changes_df, snapshot_dir)
+
+    _write_parquet(roster_df, roster_file(snapshot_dir, report_time))
+    change_counts = changes_df['Change'].value_counts()
+    report_df = pd.DataFrame([{'Report_Time': report_time, 'Dogs': len(roster_df),
+                               'Arrived': change_counts.get(ARRIVED, 0), 'Left': change_counts.get(LEFT, 0),
+                               'Changed': change_counts.get(CHANGED, 0), 'Source_Hash': source_hash}])
+    _write_parquet(pd.concat([reports_df, report_df], ignore_index=True) if len(reports_df) else report_df,
+                   reports_file(snapshot_dir))
+    return changes_df
+
+
+def import_dog_lists(file_names: list, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> int:
+    """
+    Record Dog Exercise List exports in order of their report times.  Reports already recorded, or
+    older than the latest recorded, are skipped.
+    :return: number of reports recorded
+    """
+    import etl_dog_ex_list as dog_list
+
+    recorded_hashes = set(load_reports(snapshot_dir)['Source_Hash'])
+    reports = []
+    for file_name in file_names:
+        source_hash = file_hash(file_name)
+        if source_hash not in recorded_hashes:
+            recorded_hashes.add(source_hash)
+            reports.append((dog_list.get_dogs(file_name), source_hash))
+    recorded = 0
+    for (dogs, report_time), source_hash in sorted(reports, key=lambda report: report[0][1]):
+        recorded += record_roster(dogs, report_time, source_hash, snapshot_dir) is not None
+    return recorded
+
+
+def load_changes(start: datetime, end: datetime, dog_id: Optional[str] = None,
+                 snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> pd.DataFrame:
+    """
+    Changes found by reports from start up to and including end, read from the months covering the range only
+    :param dog_id: Only the changes to this dog
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    months = pd.period_range(start.to_period('M'), end.to_period('M'), freq='M')
+    files = [f for f in (changes_file(snapshot_dir, month) for month in months) if isfile(f)]
+    if not files:
+        return pd.DataFrame(columns=CHANGE_COLUMNS)
+    filters = [('Report_Time', '>=', start), ('Report_Time', '<=', end)]
+    if dog_id is not None:
+        filters.append(('id', '==', dog_id))
+    return pd.concat([pd.read_parquet(f, filters=filters) for f in files], ignore_index=True)
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('command', choices=['import', 'changes', 'reports', 'roster'])
+    parser.add_argument('files', help='Dog Exercise List CSVs to import', nargs='*')
+    parser.add_argument('--start', help='First report time, YYYY-MM-DD[THH:MM]', type=_parse_time,
+                        default=datetime(2000, 1, 1))
+    parser.add_argument('--end', help='Last report time, YYYY-MM-DD[THH:MM]; a date alone includes the whole day',
+                        default=None)
+    parser.add_argument('--at', help='Time of the roster shown, YYYY-MM-DD[THH:MM], the latest by default',
+                        type=_parse_time, default=None)
+    parser.add_argument('--id', help='Only the changes to the dog with this id', required=False)
+    parser.add_argument('--snapshot_dir', help='Snapshot store location', default=DEFAULT_SNAPSHOT_DIR)
+    args = parser.parse_args()
+    end = datetime.now() if args.end is None else _parse_time(args.end)
+    if args.end is not None and len(args.end) == len('YYYY-MM-DD'):
+        end = end.replace(hour=23, minute=59, second=59)
+
+    if args.command == 'import':
+        recorded = import_dog_lists(args.files, args.snapshot_dir)
+        print(f'Recorded {recorded} of {len(args.files)} reports')
+    elif args.command == 'changes':
+        changes_df = load_changes(args.start, end, args.id, args.snapshot_dir)
+        print(changes_df.drop(columns=['Previous_Time']).to_string(index=False))
+    elif args.command == 'reports':
+        reports_df = load_reports(args.snapshot_dir)
+        reports_df = reports_df[(reports_df['Report_Time'] >= args.start) & (reports_df['Report_Time'] <= end)]
+        print(reports_df.drop(columns=['Source_Hash']).to_string(index=False))
+    else:
+        roster_df = load_roster(args.at, args.snapshot_dir)
+        if roster_df is None:
+            print('No reports recorded at or before that time')
+        else:
+            print(f'Roster of {roster_df["Report_Time"].iloc[0]:%A, %b %d, %Y at %I:%M %p}')
+            print(roster_df[TRACKED].set_index('name').sort_index().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,33 @@
+from __future__ import annotations
+
 import csv
 import re
+import sys
 from argparse import ArgumentParser
 from datetime import datetime
+from typing import Iterable, Iterator
+
+import arrow_export
+import daemon_client
+import dog_snapshots
+import profiling
+import table_output
+from lazy_imports import lazy_import
+from schedule_cache import file_hash
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
-import numpy as np
-import pandas as pd
+DBS_LEVELS = ['Green', 'Blue', 'Purple', 'Red - Team']
+
+age_rx = re.compile(r'.*/(\d\d)y (\d\d)m', flags=re.IGNORECASE)
+no_handling_rx = re.compile(r'.*No Handling Level.*', flags=re.IGNORECASE)
+team_rx = re.compile(r'.*Team.*', flags=re.IGNORECASE)
+intake_incident_rx = re.compile(r'(.*intake.*|.*incident.*)', flags=re.IGNORECASE)
 
 
 def get_age_in_months(in_text):
-    match = re.search(r'.*/(\d\d)y (\d\d)m', in_text, flags=re.IGNORECASE)
+    match = age_rx.search(in_text)
     age = match.groups() if match else ('0', '0')
     age_in_months = int(age[0]) * 12 + int(age[1])
     return age_in_months
@@ -34,9 +53,9 @@ def get_level(row):
     if level in ['green', 'blue', 'purple', 'red', 'orange']:
         level = level.capitalize()
         if level == 'Red':
-            if re.match(r'.*No Handling Level.*', row[5], re.IGNORECASE):
+            if no_handling_rx.match(row[5]):
                 level = 'Red - Default'
-            elif re.match(r'.*Team.*', row[5], re.IGNORECASE):
+            elif team_rx.match(row[5]):
                 level = 'Red - Team'
     else:
         level = None
@@ -50,66 +69,143 @@ def extract_report_time(rpt_title):
     return rpt_time
 
 
+class DogRecord:
+    __slots__ = ('name', 'id', 'weight', 'location', 'age', 'holder', 'kc', 'bite', 'Level', 'team', 'diet', 'notes')
+    fields = __slots__[1:]
+
+    def __init__(self, name, id, weight, location, age, keep_notes=True):
+        self.name = name
+        self.id = id
+        self.weight = weight
+        self.location = location
+        self.age = age
+        self.holder = False
+        self.kc = False
+        self.bite = False
+        self.Level = None
+        self.team = False
+        self.diet = [] if keep_notes else None
+        self.notes = [] if keep_notes else None
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.fields}
+
+
+class DogExerciseList:
+    """
+    Streams the dogs in a Dog Exercise List export one record at a time.  A dog is yielded once its
+    notes end or the next dog starts, so only the current dog is held in memory.
+    report_time is set once the report title row has been read.
+    """
+
+    def __init__(self, file_loc, keep_notes=True):
+        self.file_loc = file_loc
+        self.keep_notes = keep_notes
+        self.report_time = None
+
+    def __iter__(self) -> Iterator[DogRecord]:
+        with open(self.file_loc, 'r') as dogs_csv:
+            current_dog = None
+            for row in csv.reader(dogs_csv):
+                row = row[8:]
+                if 'Dog Exercise List' in row[0]:
+                    self.report_time = extract_report_time(row[0])
+                elif row[0] == 'AM':
+                    if current_dog:
+                        yield current_dog
+                    current_dog = DogRecord(get_name(row[5]), row[8], get_weight(row[7]), row[3],
+                                            get_age_in_months(row[6]), self.keep_notes)
+                elif current_dog is None:
+                    continue
+                elif row[0] == 'DIET':
+                    if self.keep_notes:
+                        current_dog.diet.append(row[5])
+                elif len(row) < 2:
+                    # End of dog notes
+                    yield current_dog
+                    current_dog = None
+                elif intake_incident_rx.match(row[4]):
+                    # Intake notes. Skip
+                    pass
+                elif row[0] == 'H':
+                    current_dog.holder = True
+                elif 'Bite Quarantine' in row[4]:
+                    current_dog.bite = True
+                elif 'Kennel Cough' in row[4]:
+                    current_dog.kc = True
+                elif row[0] in ['RDR']:
+                    # Run dog run.  Skip
+                    pass
+                else:
+                    level = get_level(row)
+                    if level:
+                        current_dog.Level = level if current_dog.bite is False else 'Red - BQ'
+                    elif self.keep_notes and len(row[5]) > 0:
+                        current_dog.notes.append(row[5])
+            if current_dog:
+                yield current_dog
+
+
+class DogCounts:
+    """
+    Running Level/Holder/KC tallies equivalent to get_dog_counts_dataframe.  Only the three tallied
+    attributes are kept per dog name, so a later record for the same name replaces the earlier one
+    as it does in get_dogs.
+    """
+
+    def __init__(self):
+        self.by_name = {}
+
+    def add(self, dog: DogRecord):
+        if 'DELETE' in dog.name:
+            return
+        self.by_name[dog.name] = (dog.Level, dog.holder, dog.kc)
+
+    def update(self, dogs: Iterable[DogRecord]):
+        for dog in dogs:
+            self.add(dog)
+        return self
+
+    def as_dataframe(self, dbs=None) -> pd.DataFrame:
+        """
+        :param dbs: True for DBS dogs only, False for Staff/BPA dogs only, None for all dogs
+        :return: counts by level with a Total row
+        """
+        counts = {}
+        for level, holder, kc in self.by_name.values():
+            if level is None or (dbs is not None and (level in DBS_LEVELS) != dbs):
+                continue
+            tally = counts.setdefault(level, [0, 0, 0])
+            tally[0] += 1
+            tally[1] += holder
+            tally[2] += kc
+        dog_counts = pd.DataFrame.from_dict({level: counts[level] for level in sorted(counts)}, orient='index',
+                                            columns=['All', 'Holder', 'KC'], dtype='int64')
+        dog_counts.index.name = 'Level'
+        dog_counts.loc['Total'] = dog_counts.sum()
+        return dog_counts
+
+
+@profiling.stage
+def count_dogs(file_loc) -> tuple:
+    """
+    Level/Holder/KC tallies for an export without building the roster
+    :return: tuple of (DogCounts, report time)
+    """
+    dog_list = DogExerciseList(file_loc, keep_notes=False)
+    return DogCounts().update(dog_list), dog_list.report_time
+
+
+@profiling.stage
 def get_dogs(file_loc):
-    dogs = {}
-    with open(file_loc, 'r') as dogs_csv:
-        current_dog = None
-        k_reader = csv.reader(dogs_csv)
-        for row in k_reader:
-            row = row[8:]
-            if 'Dog Exercise List' in row[0]:
-                report_time = extract_report_time(row[0])
-            elif row[0] == 'AM':
-                name = get_name(row[5])
-                weight = get_weight(row[7])
-                loc = row[3]
-                age = get_age_in_months(row[6])
-                id = row[8]
-                current_dog = name
-                dogs[current_dog] = {
-                    'id': id,
-                    'weight': weight,
-                    'location': loc,
-                    'age': age,
-                    'holder': False,
-                    'kc': False,
-                    'bite': False,
-                    'Level': None,
-                    'team': False,
-                    'diet': [],
-                    'notes': []
-                }
-            elif row[0] == 'DIET':
-                dogs[current_dog]['diet'].append(row[5])
-            elif len(row) < 2:
-                # End of dog notes
-                current_dog = None
-            elif re.match(r'(.*intake.*|.*incident.*)',
-                          row[4],
-                          flags=re.IGNORECASE):
-                # Intake notes. Skip
-                pass
-            elif row[0] == 'H':
-                dogs[current_dog]['holder'] = True
-            elif 'Bite Quarantine' in row[4]:
-                dogs[current_dog]['bite'] = True
-            elif 'Kennel Cough' in row[4]:
-                dogs[current_dog]['kc'] = True
-            elif row[0] in ['RDR']:
-                # Run dog run.  Skip
-                pass
-            else:
-                level = get_level(row)
-                if level:
-                    dogs[current_dog]['Level'] = level if dogs[current_dog]['bite'] is False else 'Red - BQ'
-                elif current_dog and len(row[5]) > 0:
-                    dogs[current_dog]['notes'].append(row[5])
-
+    dog_list = DogExerciseList(file_loc)
+    dogs = {dog.name: dog.as_dict() for dog in dog_list}
     dogs = {k: v for k, v in dogs.items() if 'DELETE' not in k}
 
-    return dogs, report_time
+    return dogs, dog_list.report_time
 
 
+@profiling.stage
 def get_dog_counts_dataframe(dogs_df):
     aggFunc = {'Level': np.count_nonzero,
                'holder': sum,
@@ -121,35 +217,34 @@ def get_dog_counts_dataframe(dogs_df):
     dog_counts = dog_counts.rename(columns={'Level': 'All', 'holder': 'Holder', 'kc': 'KC'})
     dog_counts = dog_counts.astype('int32')
 
-    row_total = dog_counts.sum()
-    row_total.name = 'Total'
-    dog_counts = dog_counts.append(row_total)
+    dog_counts.loc['Total'] = dog_counts.sum()
     return dog_counts
 
 
-def get_dog_counts_as_html(dogs_df):
+def get_dog_counts_table(dogs_df):
     dog_counts_df = get_dog_counts_dataframe(dogs_df)
-    dc_out = dog_counts_df.rename(
+    return dog_counts_df.rename(
         index={'Blue': '3 - Blue', 'Green': '2 - Green', 'Orange': '9 - Orange', 'Purple': '4 - Purple',
                'Red': '8 - Red', 'Red - BQ': '6 - Red - BQ', 'Red - Default': '7 - Red - Default',
                'Red - Team': '5 - Red - Team', 'Total': 'Total'}).sort_index()
-    styles = [
-        dict(selector="tr", props=[('text-align', 'right')]),
-        dict(selector='th', props=[('text-align', 'right')])
-    ]
-    styled = dc_out.style.set_table_styles(styles)
-    return styled.render()
 
 
+@profiling.stage
+def get_dog_counts_as_html(dogs_df, table_id: str = 'dog_counts'):
+    return table_output.render_table(get_dog_counts_table(dogs_df), table_output.HTML, index=True, table_id=table_id)
+
+
+@profiling.stage
 def get_dog_info_as_html(dogs_df):
     return dogs_df[['holder', 'Level', 'location', 'kc', 'id']].rename_axis('name') \
         .sort_values(['holder', 'name'], ascending=[False, True]) \
         .to_html()
 
 
+@profiling.stage
 def get_dog_dataframe(dogs):
     dogs_df = pd.DataFrame.from_dict(dogs, orient='index')
-    dogs_df['dbs'] = dogs_df.Level.apply(lambda l: l in ['Green', 'Blue', 'Purple', 'Red - Team'])
+    dogs_df['dbs'] = dogs_df.Level.isin(DBS_LEVELS)
     return dogs_df
 
 
@@ -161,24 +256,43 @@ def filter_for_non_dbs(dogs_df):
     return dogs_df[(dogs_df['dbs'] == False)]
 
 
-def main():
+def get_arg_parser() -> ArgumentParser:
     parser = ArgumentParser()
     parser.add_argument('filename', help='File containing dog exercise csv', metavar='dog_file')
     parser.add_argument('--html', help='Output as html', required=False, action='store_true')
-    args = parser.parse_args()
-    dogs, report_time = get_dogs(args.filename)
-    output_html = args.html
-    dogs_df = get_dog_dataframe(dogs)
-    if output_html:
+    parser.add_argument('--markdown', help='Output counts as Markdown tables', required=False, action='store_true')
+    parser.add_argument('--slack', help='Output counts as Slack message text', required=False, action='store_true')
+    parser.add_argument('--export', help='Also save the dog roster as an Arrow IPC or Parquet file',
+                        choices=sorted(arrow_export.extensions), required=False)
+    parser.add_argument('--snapshot', help='Record the roster in the dog snapshot store and print the changes since '
+                                           'the previous report', required=False, action='store_true')
+    parser.add_argument('--no_daemon', help='Compute in this process even if the counts daemon is running',
+                        required=False, action='store_true')
+    parser.add_argument('--profile', help='Time each stage and print a table to stderr, or write JSON to the given '
+                                          'file', nargs='?', const='-', metavar='json_file', required=False)
+    return parser
+
+
+def print_dog_counts(args, dogs_df, report_time):
+    if args.html:
         print(f"<h3>{datetime.strftime(report_time, '%A, %b %d, %Y at %I:%M %p ')}</h3>")
         print('<h2>DBS Dog Counts</h2>')
-        print(get_dog_counts_as_html(filter_for_dbs(dogs_df)))
+        print(get_dog_counts_as_html(filter_for_dbs(dogs_df), 'dbs_dog_counts'))
         print('<br><br>')
         print('<h2>Staff/BPA Dog Counts</h2>')
-        print(get_dog_counts_as_html(filter_for_non_dbs(dogs_df)))
+        print(get_dog_counts_as_html(filter_for_non_dbs(dogs_df), 'staff_dog_counts'))
         print('<br><br>')
         print('<h2>Dog Locations</h2>')
         print(get_dog_info_as_html(dogs_df))
+    elif args.markdown or args.slack:
+        fmt = table_output.MARKDOWN if args.markdown else table_output.SLACK
+        heading = '## {}\n' if args.markdown else '*{}*'
+        print(datetime.strftime(report_time, '%A, %b %d, %Y at %I:%M %p '))
+        print(heading.format('DBS Dog Counts'))
+        table_output.write_table(get_dog_counts_table(filter_for_dbs(dogs_df)), sys.stdout, fmt, index=True)
+        print()
+        print(heading.format('Staff/BPA Dog Counts'))
+        table_output.write_table(get_dog_counts_table(filter_for_non_dbs(dogs_df)), sys.stdout, fmt, index=True)
     else:
         print(datetime.strftime(report_time, '%A, %b %d, %Y at %I:%M %p '))
         print('DBS Dog Counts')
@@ -187,5 +301,43 @@ def main():
         print(get_dog_counts_dataframe(filter_for_non_dbs(dogs_df)))
 
 
+def main():
+    argv = sys.argv[1:]
+    args = get_arg_parser().parse_args(argv)
+    if args.profile:
+        profiling.enable()
+    elif not (args.no_daemon or args.export or args.snapshot):
+        output = daemon_client.query('dog_counts', argv)
+        if output is not None:
+            print(output, end='')
+            return
+
+    if args.html or args.markdown or args.slack or args.export or args.snapshot:
+        dogs, report_time = get_dogs(args.filename)
+        dogs_df = get_dog_dataframe(dogs)
+        print_dog_counts(args, dogs_df, report_time)
+        if args.export:
+            out_name = f'Dog_Roster_{report_time.strftime("%Y_%m_%d_%H%M")}{arrow_export.extensions[args.export]}'
+            arrow_export.write_table(arrow_export.dog_roster_table(dogs_df, report_time), out_name)
+            print(f'Dog Roster saved to {out_name}')
+        if args.snapshot:
+            changes_df = dog_snapshots.record_roster(dogs, report_time, file_hash(args.filename))
+            if changes_df is None:
+                print('A report at or after this one is already in the dog snapshot store')
+            else:
+                print(f'{len(changes_df)} dogs arrived, left or changed since the previous report')
+                if len(changes_df):
+                    print(changes_df[['id', 'name', 'Change', 'Fields']].to_string(index=False))
+    else:
+        dog_counts, report_time = count_dogs(args.filename)
+        print(datetime.strftime(report_time, '%A, %b %d, %Y at %I:%M %p '))
+        print('DBS Dog Counts')
+        print(dog_counts.as_dataframe(dbs=True))
+        print('Staff/BPA Dog Counts')
+        print(dog_counts.as_dataframe(dbs=False))
+    if args.profile:
+        profiling.report(args.profile)
+
+
 if __name__ == "__main__":
     main()
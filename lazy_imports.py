@@ -0,0 +1,28 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """
+    Import a module on first attribute access instead of now.  Keeps heavy dependencies such as
+    pandas, tabula and bs4 out of the start up of the command line scripts, so paths that never
+    touch them, e.g. answering from the counts daemon, do not pay for them.
+    Finding a submodule, e.g. pyarrow.parquet, imports its parent package now, so import heavy
+    submodules inside the functions that use them instead.
+    :param name: Fully qualified module name
+    :return: the module, or None if it is not installed
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition('.')
+    if parent:  # find_spec has imported the parent; bind the submodule to it as import does
+        setattr(sys.modules[parent], child, module)
+    loader.exec_module(module)
+    return module
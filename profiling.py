@@ -0,0 +1,94 @@
+import json
+import sys
+import time
+from functools import wraps
+from os.path import basename, splitext
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+_enabled = False
+_depth = 0
+_records = []
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _peak_rss_kib() -> int:
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # Bytes on macOS, KiB elsewhere
+
+
+def _rows(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, (str, bytes)) or not hasattr(value, '__len__'):
+        return None
+    return len(value)
+
+
+def stage(func):
+    """
+    Record wall time, rows in and out and the peak RSS increase of each call once profiling is
+    enabled.  Rows are the length of the first argument and of the result (or of its first element
+    for tuples).  While disabled the wrapper only adds a flag check.
+    """
+    name = f'{splitext(basename(func.__code__.co_filename))[0]}.{func.__name__}'  # Also right when run as __main__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        global _depth
+        record = {'stage': name, 'depth': _depth, 'rows_in': _rows(args[0]) if args else None}
+        _records.append(record)
+        peak_before = _peak_rss_kib()
+        begin = time.perf_counter()
+        _depth += 1
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _depth -= 1
+            record['seconds'] = time.perf_counter() - begin
+            record['peak_rss_delta_kib'] = _peak_rss_kib() - peak_before
+        record['rows_out'] = _rows(result)
+        return result
+
+    return wrapper
+
+
+def get_records() -> list:
+    return list(_records)
+
+
+def format_report(records: list) -> str:
+    lines = [f'{"stage":<60} {"ms":>10} {"rows in":>9} {"rows out":>9} {"peak KiB":>9}']
+    for record in records:
+        name = '  ' * record['depth'] + record['stage']
+        rows_in = '' if record['rows_in'] is None else record['rows_in']
+        rows_out = '' if record.get('rows_out') is None else record['rows_out']
+        lines.append(f'{name:<60} {record["seconds"] * 1000:>10.1f} {rows_in:>9} {rows_out:>9} '
+                     f'{record["peak_rss_delta_kib"]:>+9}')
+    return '\n'.join(lines)
+
+
+def report(destination: str):
+    """
+    :param destination: '-' prints a table to stderr, anything else is a JSON file to write
+    """
+    if destination == '-':
+        print(format_report(_records), file=sys.stderr)
+    else:
+        with open(destination, 'w') as json_out:
+            json.dump(_records, json_out, indent=2)
@@ -0,0 +1,24 @@
+"""
+Finding archived report exports, e.g. the weekly DBS Schedule PDFs or the Dog Exercise List CSVs
+"""
+import glob
+import os
+from os.path import abspath, expanduser, getmtime, isdir, isfile, join
+from typing import List
+
+
+def find_reports(patterns: List[str], extension: str = '.pdf') -> List[str]:
+    """
+    :param patterns: Report files, directories holding reports or glob patterns
+    :param extension: Extension of the reports found in directories
+    :return: distinct report files, oldest modification time first
+    """
+    files = []
+    for pattern in patterns:
+        pattern = expanduser(pattern)
+        if isdir(pattern):
+            files.extend(join(pattern, f) for f in os.listdir(pattern) if f.lower().endswith(extension))
+        else:
+            files.extend(glob.glob(pattern) or [pattern])
+    files = list(dict.fromkeys(abspath(f) for f in files if isfile(f)))
+    return sorted(files, key=lambda f: (getmtime(f), f))
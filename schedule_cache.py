@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import time
+from os.path import abspath, dirname, expanduser, getmtime, getsize, isdir, isfile, join
+from typing import List, Optional
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+# Through lazy_import as find_spec would load a pyarrow already registered lazily, e.g. by arrow_export
+pa = lazy_import('pyarrow')
+
+_frame_format = 'parquet' if pa is not None else 'pickle'
+
+DEFAULT_CACHE_DIR = os.environ.get('SHS_COUNTS_CACHE', expanduser('~/.cache/shs_counts/schedules'))
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+# Entries without a readable meta.json are left this long, as another process may still be writing them
+INCOMPLETE_ENTRY_SECONDS = 3600
+
+# Raised when reading an entry that is missing, being removed or was left truncated
+_read_errors = (OSError, ValueError, EOFError, pickle.UnpicklingError)
+
+_page_pattern = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+_object_pattern = re.compile(rb'(\d+)\s+\d+\s+obj\b(.*?)endobj', re.DOTALL)
+_reference_pattern = re.compile(rb'(\d+)\s+\d+\s+R\b')
+_pages_pattern = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R\b')
+_kids_pattern = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+_contents_pattern = re.compile(rb'/Contents\s*(\[[^\]]*\]|\d+\s+\d+\s+R\b)')
+
+
+def file_hash(file_name: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as in_file:
+        for block in iter(lambda: in_file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_pdf_pages(file_name: str) -> int:
+    """
+    Cheap page count from the page objects in the PDF.  Returns 0 when the pages are not visible,
+    e.g. in compressed object streams, in which case no incremental extraction is attempted.
+    """
+    with open(file_name, 'rb') as pdf:
+        return len(_page_pattern.findall(pdf.read()))
+
+
+def pdf_page_hashes(file_name: str) -> List[str]:
+    """
+    Hash of the content streams of each page, in page order, to tell which pages of a re-exported PDF
+    are unchanged.  Returns an empty list when the page tree is not visible, as for count_pdf_pages.
+    """
+    with open(file_name, 'rb') as pdf:
+        data = pdf.read()
+    objects = {int(number): body for number, body in _object_pattern.findall(data)}  # Later updates win
+    catalog = next((body for body in objects.values() if re.search(rb'/Type\s*/Catalog\b', body)), None)
+    root = _pages_pattern.search(catalog) if catalog else None
+    if not root:
+        return []
+
+    hashes = []
+    pending = [int(root.group(1))]
+    while pending:
+        body = objects.get(pending.pop())
+        if body is None:
+            return []
+        kids = _kids_pattern.search(body)
+        if kids:
+            pending.extend(reversed([int(kid) for kid in _reference_pattern.findall(kids.group(1))]))
+            continue
+        contents = _contents_pattern.search(body)
+        digest = hashlib.sha256()
+        for number in _reference_pattern.findall(contents.group(1)) if contents else []:
+            if int(number) not in objects:
+                return []
+            digest.update(objects[int(number)])
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def _replace_atomically(path: str, write):
+    """
+    Call write with a temporary file name next to path, then move the file into place, so processes
+    sharing the cache never see a partly written file
+    """
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=dirname(path), suffix='.tmp')
+    os.close(tmp_fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_frame(df: pd.DataFrame, path: str):
+    if _frame_format == 'parquet':
+        _replace_atomically(path, df.to_parquet)
+    else:
+        _replace_atomically(path, df.to_pickle)
+
+
+def _write_json(data, path: str):
+    def write(tmp_path):
+        with open(tmp_path, 'w') as json_out:
+            json.dump(data, json_out)
+
+    _replace_atomically(path, write)
+
+
+def _read_json(path: str):
+    """
+    :return: the decoded file, or None if it is missing or not valid JSON
+    """
+    try:
+        with open(path) as json_in:
+            return json.load(json_in)
+    except _read_errors:
+        return None
+
+
+def _read_frame(path: str) -> pd.DataFrame:
+    if _frame_format == 'parquet':
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+class ScheduleCache:
+    """
+    On disk cache of extracted schedules keyed by the content hash of the source PDF.  Each entry
+    holds the raw extracted table, the cleaned schedule and the content hash of each page, so a
+    re-exported PDF can be brought up to date by extracting just the pages after those unchanged.
+    Entries older than max_age_days are removed, then the least recently used entries until the
+    cache fits in max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+
+    def _entry_dir(self, key: str) -> str:
+        return join(self.cache_dir, key)
+
+    def _frame_path(self, key: str, name: str) -> str:
+        return join(self._entry_dir(key), f'{name}.{_frame_format}')
+
+    def _meta_path(self, key: str) -> str:
+        return join(self._entry_dir(key), 'meta.json')
+
+    def _paths_index(self) -> str:
+        return join(self.cache_dir, 'paths.json')
+
+    def _read_meta(self, key: str) -> Optional[dict]:
+        meta = _read_json(self._meta_path(key))
+        return meta if isinstance(meta, dict) else None
+
+    def get_schedule(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        :return: the cached schedule, or None if the entry is missing or unreadable
+        """
+        try:
+            schedule_df = _read_frame(self._frame_path(key, 'schedule'))
+        except _read_errors:
+            return None
+        try:
+            os.utime(self._meta_path(key))  # Mark as recently used
+        except OSError:  # Evicted meanwhile
+            pass
+        return schedule_df
+
+    def get_previous(self, file_name: str) -> Optional[tuple]:
+        """
+        Most recent entry cached for the same file path
+        :return: tuple of (raw extracted table, page hashes) or None.  Entries cached without page hashes
+        are not returned, as their pages cannot be checked.
+        """
+        paths = _read_json(self._paths_index())
+        key = paths.get(abspath(file_name)) if isinstance(paths, dict) else None
+        meta = self._read_meta(key) if key else None
+        if not meta or not meta.get('page_hashes'):
+            return None
+        try:
+            return _read_frame(self._frame_path(key, 'raw')), meta['page_hashes']
+        except _read_errors:
+            return None
+
+    def put(self, key: str, file_name: str, raw_df: Optional[pd.DataFrame], schedule_df: pd.DataFrame, pages: int,
+            page_hashes: Optional[List[str]] = None):
+        """
+        Files are written whole through temporary files, meta.json last, so concurrent readers see the
+        previous entry or none rather than a partial one.  Nothing is cached if another process evicts
+        the entry meanwhile.
+        :param raw_df: Raw extracted table, None when the source is not extracted incrementally
+        :param page_hashes: Content hash of each page, see pdf_page_hashes
+        """
+        try:
+            os.makedirs(self._entry_dir(key), exist_ok=True)
+            if raw_df is not None:
+                _write_frame(raw_df, self._frame_path(key, 'raw'))
+            _write_frame(schedule_df, self._frame_path(key, 'schedule'))
+            _write_json({'source': abspath(file_name), 'pages': pages, 'page_hashes': page_hashes or [],
+                         'created': time.time()}, self._meta_path(key))
+        except OSError as error:
+            if not isinstance(error, FileNotFoundError) and isdir(self._entry_dir(key)):
+                raise
+            return  # Evicted by another process while written; it is just not cached
+
+        paths = _read_json(self._paths_index())
+        paths = paths if isinstance(paths, dict) else {}
+        paths[abspath(file_name)] = key
+        _write_json(paths, self._paths_index())
+        self.evict()
+
+    def evict(self):
+        if not isdir(self.cache_dir):
+            return
+        entries = []
+        now = time.time()
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            try:
+                if not isdir(entry_dir):
+                    continue
+                meta = self._read_meta(key)
+                if meta is None and now - getmtime(entry_dir) <= INCOMPLETE_ENTRY_SECONDS:
+                    continue
+                if meta is None or now - meta.get('created', 0) > self.max_age_days * 86400:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                size = sum(getsize(join(entry_dir, f)) for f in os.listdir(entry_dir))
+                entries.append((getmtime(self._meta_path(key)), size, entry_dir))
+            except OSError:  # Removed by another process meanwhile
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
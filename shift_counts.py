@@ -1,13 +1,37 @@
-import re
+from __future__ import annotations
+
+import sys
 from argparse import ArgumentParser
 from datetime import date, datetime, timedelta
-from typing import Tuple, List
-
-import pandas as pd
-import tabula
-
+from collections.abc import Sequence
+from functools import lru_cache
+from os.path import join
+from typing import Iterable, Iterator, Tuple, List, Optional
+
+import arrow_export
+import daemon_client
+import date_parsing as dates
+from schedule_cache import ScheduleCache, count_pdf_pages, file_hash, pdf_page_hashes
 import shift_exceptions as exceptions
+import shift_history
 import dce_shift_counts_from_html as dce_html
+import dce_shift_counts_from_excel as dce_excel
+import profiling
+import table_output
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+tabula = lazy_import('tabula')
+
+# Bits of the level_code column of the compact schedule
+level_bits = {'Green': 1, 'Blue': 2, 'Purple': 4}
+
+# Pages extracted at a time by load_and_summarize_dbs_counts_chunked
+DEFAULT_CHUNK_PAGES = 25
+
+# Bump when shift_times changes so memoized calendars are rebuilt
+SHIFT_TABLE_VERSION = 1
 
 shift_times = {
     1: (((7, 30), (10, 30)), ((13, 0), (16, 0)), ((16, 0), (18, 0))),
@@ -20,114 +44,289 @@ shift_times = {
 }
 
 
-def etl_shift_schedule(file_name: str) -> pd.DataFrame:
-    schedule_df = tabula.read_pdf(file_name, pages='all', pandas_options={'header': [1]}, lattice=True)
+@profiling.stage
+def read_schedule_pdf(file_name: str, pages='all', pandas_options: dict = None) -> pd.DataFrame:
+    pandas_options = pandas_options or {'header': [1]}
+    schedule_df = tabula.read_pdf(file_name, pages=pages, pandas_options=pandas_options, lattice=True)
     if len(schedule_df.columns) != 6:
         raise Exception('Format of file is wrong.  Expected 6 columns.  Actual: ', len(schedule_df.columns))
+    return schedule_df
+
+
+@profiling.stage
+def clean_shift_schedule(schedule_df: pd.DataFrame) -> pd.DataFrame:
     schedule_df = schedule_df[(schedule_df.Volunteer != 'Volunteer')]  # Remove repeated header rows
     schedule_df = schedule_df.fillna(method='ffill')
     schedule_df = schedule_df[(schedule_df.Volunteer != 'Open')]
     return schedule_df
 
 
+def get_page_starts(raw_df: pd.DataFrame) -> np.ndarray:
+    """
+    Row of the raw schedule table at which each page starts.  Every page after the first starts with the
+    repeated header row, the header of the first page is taken as the columns.
+    """
+    return np.concatenate([[0], np.flatnonzero((raw_df.Volunteer == 'Volunteer').values)])
+
+
+def extract_shift_schedule(file_name: str, cache: ScheduleCache) -> tuple:
+    """
+    Extract the raw schedule table, reusing the rows of the previous extraction of the same file for the
+    leading pages whose content is unchanged.  The last page of the previous extraction is always extracted
+    again, as are all pages when the page contents or the page boundaries of the cached table are not known.
+    :return: tuple of (raw schedule table, page hashes)
+    """
+    page_hashes = pdf_page_hashes(file_name)
+    previous = cache.get_previous(file_name)
+    if previous and page_hashes:
+        prev_raw, prev_hashes = previous
+        page_starts = get_page_starts(prev_raw)
+        reused = 0
+        while reused < len(prev_hashes) - 1 and reused < len(page_hashes) - 1 \
+                and prev_hashes[reused] == page_hashes[reused]:
+            reused += 1
+        if reused and len(page_starts) == len(prev_hashes):
+            new_raw = read_schedule_pdf(file_name, pages=list(range(reused + 1, len(page_hashes) + 1)),
+                                        pandas_options={'header': None})
+            new_raw.columns = prev_raw.columns
+            return pd.concat([prev_raw.iloc[:page_starts[reused]], new_raw], ignore_index=True), page_hashes
+    return read_schedule_pdf(file_name), page_hashes
+
+
+@profiling.stage
+def etl_shift_schedule(file_name: str, cache: Optional[ScheduleCache] = None) -> pd.DataFrame:
+    if cache is None:
+        return clean_shift_schedule(read_schedule_pdf(file_name))
+
+    key = file_hash(file_name)
+    schedule_df = cache.get_schedule(key)
+    if schedule_df is None:
+        raw_df, page_hashes = extract_shift_schedule(file_name, cache)
+        schedule_df = clean_shift_schedule(raw_df)
+        cache.put(key, file_name, raw_df, schedule_df, count_pdf_pages(file_name), page_hashes)
+    return schedule_df
+
+
+def read_schedule_chunks(file_name: str, chunk_pages: int = DEFAULT_CHUNK_PAGES) -> Iterator[pd.DataFrame]:
+    """
+    Extract the raw schedule table chunk_pages pages at a time.  Later chunks are read without a header
+    and given the columns of the first, as extract_shift_schedule does for added pages.  The whole file
+    is read at once when its page count is not visible, see count_pdf_pages.
+    """
+    pages = count_pdf_pages(file_name)
+    if pages <= chunk_pages:
+        yield read_schedule_pdf(file_name)
+        return
+    columns = None
+    for first_page in range(1, pages + 1, chunk_pages):
+        page_range = list(range(first_page, min(first_page + chunk_pages, pages + 1)))
+        if columns is None:
+            raw_df = read_schedule_pdf(file_name, pages=page_range)
+            columns = raw_df.columns
+        else:
+            raw_df = read_schedule_pdf(file_name, pages=page_range, pandas_options={'header': None})
+            raw_df.columns = columns
+        yield raw_df
+
+
+def clean_shift_schedule_chunks(raw_chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    clean_shift_schedule over consecutive chunks of the raw table.  The last forward filled row of each
+    chunk is carried into the next, so a Date/From/To spanning a chunk boundary is filled as in one table.
+    """
+    carry = None
+    for raw_df in raw_chunks:
+        schedule_df = raw_df[(raw_df.Volunteer != 'Volunteer')]  # Remove repeated header rows
+        if carry is None:
+            schedule_df = schedule_df.fillna(method='ffill')
+        else:
+            schedule_df = pd.concat([carry, schedule_df]).fillna(method='ffill').iloc[1:]
+        if len(schedule_df):
+            carry = schedule_df.iloc[-1:]
+        yield schedule_df[(schedule_df.Volunteer != 'Open')]
+
+
+def get_level_codes(levels: pd.Series) -> np.ndarray:
+    """
+    Bit mask of the levels named in each LEVEL value, see level_bits.  The case insensitive match
+    runs once per distinct LEVEL value rather than once per row.
+    """
+    levels = levels.astype('category')
+    upper_levels = levels.cat.categories.str.upper()
+    category_codes = np.zeros(len(upper_levels) + 1, dtype=np.uint8)  # Last entry for missing values (code -1)
+    for level, bit in level_bits.items():
+        category_codes[:-1] |= np.where(upper_levels.str.contains(level.upper(), regex=False), bit, 0).astype(np.uint8)
+    return category_codes[levels.cat.codes.values]
+
+
 def set_level_indicator_vars(schedule_df: pd.DataFrame) -> pd.DataFrame:
-    schedule_df['Green'] = schedule_df.LEVEL.apply(lambda l: 'GREEN' in l.upper())
-    schedule_df['Blue'] = schedule_df.LEVEL.apply(lambda l: 'BLUE' in l.upper())
-    schedule_df['Purple'] = schedule_df.LEVEL.apply(lambda l: 'PURPLE' in l.upper())
+    level_codes = get_level_codes(schedule_df.LEVEL)
+    for level, bit in level_bits.items():
+        schedule_df[level] = (level_codes & bit) != 0
     return schedule_df
 
 
 def transform_dates(schedule_df: pd.DataFrame) -> pd.DataFrame:
-    schedule_df['Begin'] = schedule_df.apply(lambda l: re.sub(' \(.*\)', '', l['Date']) + ' ' + l['From'], axis=1)
-    schedule_df['Start_Date'] = pd.to_datetime(schedule_df['Begin'], infer_datetime_format=True)
-    schedule_df['End'] = schedule_df.apply(lambda l: re.sub(' \(.*\)', '', l['Date']) + ' ' + l['To'], axis=1)
-    schedule_df['End_Date'] = pd.to_datetime(schedule_df['End'], infer_datetime_format=True)
-    schedule_df = schedule_df.drop(['Begin', 'From', 'End'], axis=1)
+    schedule_df['Start_Date'] = dates.parse_date_times(
+        dates.combine_date_time(schedule_df['Date'], schedule_df['From'], r' \(.*\)'), dates.DBS_PDF)
+    schedule_df['End_Date'] = dates.parse_date_times(
+        dates.combine_date_time(schedule_df['Date'], schedule_df['To'], r' \(.*\)'), dates.DBS_PDF)
+    schedule_df = schedule_df.drop(['From'], axis=1)
     return schedule_df
 
 
+@profiling.stage
+def compact_schedule(schedule_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compact form of the extracted schedule used by the rest of the pipeline: categorical Volunteer
+    and LEVEL, a level_code bit mask (see level_bits) and shift start/end as int64 nanoseconds since
+    the epoch.  The Date/From/To strings and the per level boolean columns are not kept.
+    :param schedule_df: Schedule as returned by etl_shift_schedule
+    :return: compact schedule with a RangeIndex
+    """
+    schedule_df = transform_dates(schedule_df.reset_index(drop=True))
+    levels = schedule_df['LEVEL'].astype('category')
+    return pd.DataFrame({
+        'Volunteer': schedule_df['Volunteer'].astype('category'),
+        'LEVEL': levels,
+        'level_code': get_level_codes(levels),
+        'Start_Epoch': schedule_df['Start_Date'].values.astype('datetime64[ns]').view(np.int64),
+        'End_Epoch': schedule_df['End_Date'].values.astype('datetime64[ns]').view(np.int64),
+    })
+
+
+def get_level_counts(schedule_df: pd.DataFrame) -> dict:
+    level_codes = schedule_df['level_code'].values
+    return {level: (level_codes & bit) != 0 for level, bit in level_bits.items()}
+
+
+@profiling.stage
 def get_dbs_shift_counts(schedule_df: pd.DataFrame) -> pd.DataFrame:
-    shifts_minimal = schedule_df[['Start_Date', 'End_Date', 'Green', 'Blue', 'Purple']]
+    shifts_minimal = pd.DataFrame({
+        'Start_Date': schedule_df['Start_Epoch'].values.view('datetime64[ns]'),
+        'End_Date': schedule_df['End_Epoch'].values.view('datetime64[ns]'),
+        **get_level_counts(schedule_df)
+    })
     shift_counts = shifts_minimal.groupby(['Start_Date', 'End_Date']).sum()
     return shift_counts
 
 
-def apply_exceptions(schedule_df: pd.DataFrame) -> pd.DataFrame:
+@profiling.stage
+def apply_exceptions(schedule_df: pd.DataFrame, rules: Optional[exceptions.ExceptionRules] = None) -> pd.DataFrame:
     """
-    Apply a hard coded group of exceptions to the schedule attributes
+    Apply the exception rules, see shift_exceptions, to the schedule attributes
     Example: Remove from schedule persistent no-shows
     :param schedule_df: Current schedule
+    :param rules: Rules to apply, shift_exceptions.get_rules() by default
     :return: updated schedule dataframe with exceptions applied
     """
-    return exceptions.apply_exceptions(schedule_df)
+    return exceptions.apply_exceptions(schedule_df, level_bits, rules)
+
+
+# Highlighting of the shift count tables: shifts short of volunteers and shifts with few Purples
+shift_highlights = {
+    'Need': table_output.Highlight(lambda values: values > 7, 'color: red;font-weight: bold'),
+    'Purple': table_output.Highlight(lambda values: values < 4, 'color: purple;font-weight: bold'),
+}
 
 
 def color_need(value):
-    high_need = value > 7
-    highlight = 'color: red;font-weight: bold'
-    return [highlight if h else '' for h in high_need]
+    highlight = shift_highlights['Need']
+    return [highlight.style if h else '' for h in highlight.test(value)]
 
 
 def color_purples(value):
-    high_need = value < 4
-    highlight = 'color: purple;font-weight: bold'
-    return [highlight if h else '' for h in high_need]
+    highlight = shift_highlights['Purple']
+    return [highlight.style if h else '' for h in highlight.test(value)]
 
 
+@profiling.stage
 def get_shift_counts_as_html(shift_counts_df: pd.DataFrame) -> str:
-    styles = [
-        dict(selector="tr", props=[('text-align', 'right')]),
-        dict(selector='th', props=[('text-align', 'right')])
-    ]
-    styled = shift_counts_df.style \
-        .set_table_styles(styles) \
-        .hide_index() \
-        .apply(color_need, subset=['Need']) \
-        .apply(color_purples, subset=['Purple'])
+    return table_output.render_table(shift_counts_df, table_output.HTML, shift_highlights, table_id='shift_counts')
 
-    return styled.render()
 
+def write_shift_counts(shift_counts_df: pd.DataFrame, out, fmt: str = table_output.HTML):
+    """
+    Stream the formatted shift counts to out as HTML, Markdown or Slack text, see table_output
+    """
+    table_output.write_table(shift_counts_df, out, fmt, shift_highlights, table_id='shift_counts')
 
+
+@profiling.stage
 def format_combined_shift_counts(assigned: pd.DataFrame) -> pd.DataFrame:
-    a_df = pd.DataFrame(assigned.to_records())  # Flatten out multi index
-    a_df['Date'] = a_df['shift'].apply(shift_date_str)
-    a_df['Time'] = a_df['shift'].apply(shift_time_str)
-    # Drop unneeded columns and reorder
-    a_out = a_df[['Date', 'Time', 'Green', 'Blue', 'Purple', 'Need']]
-    return a_out
+    return format_shift_counts(assigned)
 
 
+@profiling.stage
 def format_shift_counts(assigned: pd.DataFrame) -> pd.DataFrame:
-    a_df = pd.DataFrame(assigned.to_records())  # Flatten out multi index
-    a_df['Date'] = a_df['shift'].apply(shift_date_str)
-    a_df['Time'] = a_df['shift'].apply(shift_time_str)
+    date_labels, time_labels = get_shift_labels(assigned.index)
     # Drop unneeded columns and reorder
-    a_out = a_df[['Date', 'Time', 'Green', 'Blue', 'Purple', 'Need']]
+    a_out = pd.DataFrame({'Date': date_labels, 'Time': time_labels})
+    for column in ['Green', 'Blue', 'Purple', 'Need']:
+        a_out[column] = assigned[column].values
     return a_out
 
 
-def load_and_summarize_dbs_counts(file_name: str) -> pd.DataFrame:
-    shifts_df = etl_shift_schedule(file_name)
-    shifts_df = set_level_indicator_vars(shifts_df)
-    shifts_df = apply_exceptions(shifts_df)
-    shifts_df = transform_dates(shifts_df)
+@profiling.stage
+def load_and_summarize_dbs_counts(file_name: str, cache: Optional[ScheduleCache] = None) -> pd.DataFrame:
+    return summarize_dbs_schedule(etl_shift_schedule(file_name, cache))
+
+
+def summarize_dbs_schedule(schedule_df: pd.DataFrame, rules: Optional[exceptions.ExceptionRules] = None) \
+        -> pd.DataFrame:
+    """
+    :param schedule_df: Cleaned schedule as returned by etl_shift_schedule
+    :param rules: Exception rules, shift_exceptions.get_rules() by default
+    :return: counts by level for each distinct shift start and end
+    """
+    shifts_df = compact_schedule(schedule_df)
+    shifts_df = apply_exceptions(shifts_df, rules)
     return get_dbs_shift_counts(shifts_df)
 
 
+@profiling.stage
+def summarize_dbs_schedule_chunks(schedule_chunks: Iterable[pd.DataFrame],
+                                  rules: Optional[exceptions.ExceptionRules] = None) -> pd.DataFrame:
+    """
+    summarize_dbs_schedule over consecutive chunks of the cleaned schedule.  The counts of each chunk
+    are added to the running counts by shift, after which the chunk is dropped.
+    :return: counts by level for each distinct shift start and end
+    """
+    shift_counts = None
+    for schedule_df in schedule_chunks:
+        if schedule_df.empty:
+            continue
+        chunk_counts = summarize_dbs_schedule(schedule_df, rules)
+        if shift_counts is None:
+            shift_counts = chunk_counts
+        else:
+            shift_counts = pd.concat([shift_counts, chunk_counts]).groupby(level=['Start_Date', 'End_Date']).sum()
+    if shift_counts is None:
+        raise ValueError('No volunteer shifts found in the schedule')
+    return shift_counts
+
+
+def load_and_summarize_dbs_counts_chunked(file_name: str, chunk_pages: int = DEFAULT_CHUNK_PAGES,
+                                          rules: Optional[exceptions.ExceptionRules] = None) -> pd.DataFrame:
+    """
+    Same counts as load_and_summarize_dbs_counts, with memory bounded by chunk_pages rather than the
+    size of the PDF.  The schedule cache is not used, as it would hold the whole schedule.
+    """
+    raw_chunks = read_schedule_chunks(file_name, chunk_pages)
+    return summarize_dbs_schedule_chunks(clean_shift_schedule_chunks(raw_chunks), rules)
+
+
 def save_shift_counts_as_html(shift_counts_df: pd.DataFrame, output_file: str):
-    html_text = get_shift_counts_as_html(shift_counts_df)
     with open(output_file, 'w') as html_out:
-        html_out.write(html_text)
+        write_shift_counts(shift_counts_df, html_out)
 
 
+@profiling.stage
 def save_shift_counts_as_csv(shift_counts_df: pd.DataFrame, output_file: str):
-    a_df = pd.DataFrame(shift_counts_df.to_records())  # Flatten out multi index
-    a_df['Start'] = a_df['shift'].apply(lambda s: s[0])
-    a_df['End'] = a_df['shift'].apply(lambda s: s[1])
-    if 'Green' in shift_counts_df.columns:
-        a_df = a_df[['Start', 'End', 'Green', 'Blue', 'Purple']]
-    else:
-        a_df = a_df[['Start', 'End', 'Blue', 'Purple']]
+    slot_starts, slot_ends = get_slot_bounds(list(shift_counts_df.index))
+    a_df = pd.DataFrame({'Start': slot_starts, 'End': slot_ends})
+    for column in ['Green', 'Blue', 'Purple'] if 'Green' in shift_counts_df.columns else ['Blue', 'Purple']:
+        a_df[column] = shift_counts_df[column].values
     a_df.to_csv(output_file, index=False)
 
 
@@ -139,14 +338,75 @@ def get_shift_schedule(for_date: date, start: tuple, end: tuple) -> tuple:
     return start_shift, end_shift
 
 
-def generate_schedule(start_date: date, num_of_days=14) -> List[tuple]:
+class ShiftCalendar(Sequence):
+    """
+    Standard shifts for a run of days.  A sequence of (start, end) datetime tuples, like the list
+    generate_schedule used to return, backed by start/end datetime64 arrays for slot matching and
+    pre-rendered Date and Time labels so formatting does not call strftime per row.
+    """
+
+    def __init__(self, slots: List[tuple]):
+        self.slots = tuple(slots)
+        self.slot_array = np.empty(len(slots), dtype=object)
+        for i, slot in enumerate(slots):
+            self.slot_array[i] = slot
+        self.starts = np.array([slot[0] for slot in slots], dtype='datetime64[ns]')
+        self.ends = np.array([slot[1] for slot in slots], dtype='datetime64[ns]')
+        self.positions = {slot: i for i, slot in enumerate(slots)}
+
+        # Render each distinct day and time range once
+        date_labels = {}
+        time_labels = {}
+        self.date_labels = np.array([date_labels.setdefault(slot[0].date(), shift_date_str(slot))
+                                     for slot in slots], dtype=object)
+        self.time_labels = np.array([time_labels.setdefault((slot[0].time(), slot[1].time()), shift_time_str(slot))
+                                     for slot in slots], dtype=object)
+
+    def __getitem__(self, item):
+        return self.slots[item]
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def labels(self, shifts) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param shifts: Slots of this calendar
+        :return: tuple of (Date labels, Time labels) for the slots
+        :raises KeyError: if a shift is not a slot of this calendar
+        """
+        positions = np.array([self.positions[shift] for shift in shifts], dtype=np.intp)
+        return self.date_labels[positions], self.time_labels[positions]
+
+
+@lru_cache(maxsize=32)
+def get_shift_calendar(start_date: date, num_of_days: int, version: int = SHIFT_TABLE_VERSION) -> ShiftCalendar:
     schedule = list()
     for day in range(num_of_days):
         curr_date = start_date + timedelta(day)
         shifts = shift_times[curr_date.isoweekday()]
         for shift in shifts:
             schedule.append(get_shift_schedule(curr_date, shift[0], shift[1]))
-    return schedule
+    return ShiftCalendar(schedule)
+
+
+def generate_schedule(start_date: date, num_of_days=14) -> ShiftCalendar:
+    start_date = date(start_date.year, start_date.month, start_date.day)  # Same cache entry for any time of day
+    return get_shift_calendar(start_date, num_of_days, SHIFT_TABLE_VERSION)
+
+
+def get_shift_labels(shifts) -> tuple:
+    """
+    Date and Time labels for standard shifts, looked up in the memoized calendar covering them
+    :return: tuple of (Date labels, Time labels)
+    """
+    if len(shifts) == 0:
+        return [], []
+    first = min(shift[0] for shift in shifts).date()
+    last = max(shift[0] for shift in shifts).date()
+    try:
+        return generate_schedule(first, (last - first).days + 1).labels(shifts)
+    except KeyError:
+        return [shift_date_str(shift) for shift in shifts], [shift_time_str(shift) for shift in shifts]
 
 
 def is_within_timeframe(timeframe: Tuple[datetime, datetime], time: datetime):
@@ -179,25 +439,160 @@ def shift_time_str(shift: Tuple[datetime, datetime]) -> str:
     return '{} - {}'.format(shift[0].strftime('%-I:%M'), shift[1].strftime('%-I:%M %p'))
 
 
-def assign_dbs_to_shift(shift_counts_df: pd.DataFrame, schedule: dict):
-    # Create datafame for standard shifts
-    assigned_counts = shift_counts_df.reset_index()
-    assigned_counts['shift'] = assigned_counts.apply(
-        lambda row: get_shift((row['Start_Date'], row['End_Date']), schedule), axis=1)
-    assigned_counts = assigned_counts.groupby(['shift']).sum()
-    assigned_counts['Need'] = assigned_counts.apply(lambda r: 15 - r['Green'] - r['Blue'] - r['Purple'], axis=1)
+def get_slot_bounds(schedule: Sequence[tuple]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert the standard shift slots into sorted start and end arrays suitable for binary search
+    :param schedule: Standard shifts as generated by generate_schedule
+    :return: tuple of (slot starts, slot ends) as datetime64[ns] arrays
+    """
+    if isinstance(schedule, ShiftCalendar):
+        return schedule.starts, schedule.ends
+    slot_starts = np.array([slot[0] for slot in schedule], dtype='datetime64[ns]')
+    slot_ends = np.array([slot[1] for slot in schedule], dtype='datetime64[ns]')
+    return slot_starts, slot_ends
+
+
+def get_shift_positions(start_dates: pd.Series, end_dates: pd.Series, schedule: Sequence[tuple]) -> np.ndarray:
+    """
+    Vectorized equivalent of get_shift.  Match every volunteer shift to the first standard slot
+    it overlaps by at least 50%.  Slots are sorted and do not overlap, so the candidates for a shift
+    form a contiguous run located with searchsorted; only that short run is evaluated.
+    :param start_dates: Volunteer shift start times
+    :param end_dates: Volunteer shift end times
+    :param schedule: Standard shifts as generated by generate_schedule
+    :return: position of the assigned slot within schedule for each shift, -1 if no slot matched
+    """
+    slot_starts, slot_ends = get_slot_bounds(schedule)
+    tf_start = np.asarray(start_dates, dtype='datetime64[ns]')
+    tf_end = np.asarray(end_dates, dtype='datetime64[ns]')
+    positions = np.full(len(tf_start), -1, dtype=np.int64)
+    if len(schedule) == 0 or len(tf_start) == 0:
+        return positions
+
+    # Candidate slots end at or after the shift start and start at or before the shift end
+    first = np.searchsorted(slot_ends, tf_start, side='left')
+    last = np.searchsorted(slot_starts, tf_end, side='right')
+    tf_duration = (tf_end - tf_start).astype(np.float64)
+    unassigned = np.ones(len(tf_start), dtype=bool)
+    for offset in range(int((last - first).max(initial=0))):
+        candidate = first + offset
+        in_range = unassigned & (candidate < last)
+        if not in_range.any():
+            break
+        slot = np.minimum(candidate, len(schedule) - 1)
+        s_start = slot_starts[slot]
+        s_end = slot_ends[slot]
+        # Same rules as is_within_or_overlap and get_shift_overlap
+        within = ((tf_start <= s_start) & (s_start <= tf_end)) | ((tf_start <= s_end) & (s_end <= tf_end))
+        in_duration = (np.minimum(s_end, tf_end) - np.maximum(s_start, tf_start)).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            matched = in_range & within & (in_duration / tf_duration >= .5)
+        positions[matched] = slot[matched]
+        unassigned &= ~matched
+    return positions
+
+
+def get_slot_index(schedule: Sequence[tuple], positions: np.ndarray) -> pd.Index:
+    if isinstance(schedule, ShiftCalendar):
+        slots = schedule.slot_array
+    else:
+        slots = np.empty(len(schedule), dtype=object)
+        for i, slot in enumerate(schedule):
+            slots[i] = slot
+    return pd.Index(slots[positions], name='shift', tupleize_cols=False)
+
+
+def assign_to_shift(shift_counts_df: pd.DataFrame, schedule: Sequence[tuple]) -> pd.DataFrame:
+    """
+    Sum shift counts by the standard shift each volunteer shift is assigned to
+    :param shift_counts_df: Counts indexed by Start_Date and End_Date
+    :param schedule: Standard shifts as generated by generate_schedule
+    :return: counts indexed by standard shift tuple
+    """
+    counts = shift_counts_df.reset_index()
+    positions = get_shift_positions(counts['Start_Date'], counts['End_Date'], schedule)
+    counts = counts.drop(columns=['Start_Date', 'End_Date'])
+    assigned_counts = counts[positions >= 0].groupby(positions[positions >= 0]).sum()
+    assigned_counts.index = get_slot_index(schedule, assigned_counts.index.values)
     return assigned_counts
 
 
-def assign_dce_to_shift(shift_counts_df: pd.DataFrame, schedule: dict):
-    # Create datafame for standard shifts
-    assigned_counts = shift_counts_df.reset_index()
-    assigned_counts['shift'] = assigned_counts.apply(
-        lambda row: get_shift((row['Start_Date'], row['End_Date']), schedule), axis=1)
-    assigned_counts = assigned_counts.groupby(['shift']).sum()
+def sum_by_slot(positions: np.ndarray, level_counts: dict, schedule: Sequence[tuple]) -> pd.DataFrame:
+    """
+    :param positions: Slot position of each row, as from get_shift_positions
+    :param level_counts: Count arrays aligned with positions by level name
+    :param schedule: Standard shifts as generated by generate_schedule
+    :return: level counts and Need indexed by standard shift tuple, for slots with at least one row
+    """
+    assigned = positions >= 0
+    used_slots = np.unique(positions[assigned])
+    assigned_counts = pd.DataFrame({
+        level: np.bincount(positions[assigned], weights=counts[assigned],
+                           minlength=len(schedule))[used_slots].astype(np.int64)
+        for level, counts in level_counts.items()
+    }, index=get_slot_index(schedule, used_slots))
+    assigned_counts['Need'] = 15 - assigned_counts['Green'] - assigned_counts['Blue'] - assigned_counts['Purple']
     return assigned_counts
 
 
+@profiling.stage
+def assign_dbs_to_shift(shift_counts_df: pd.DataFrame, schedule: Sequence[tuple]):
+    """
+    Green/Blue/Purple counts and Need by standard shift
+    :param shift_counts_df: Counts from get_dbs_shift_counts or the compact schedule itself
+    :param schedule: Standard shifts as generated by generate_schedule
+    :return: counts indexed by standard shift tuple
+    """
+    if 'level_code' in shift_counts_df.columns:
+        start_dates = shift_counts_df['Start_Epoch'].values.view('datetime64[ns]')
+        end_dates = shift_counts_df['End_Epoch'].values.view('datetime64[ns]')
+        level_counts = get_level_counts(shift_counts_df)
+    else:
+        start_dates = shift_counts_df.index.get_level_values('Start_Date')
+        end_dates = shift_counts_df.index.get_level_values('End_Date')
+        level_counts = {level: shift_counts_df[level].values for level in level_bits}
+
+    return sum_by_slot(get_shift_positions(start_dates, end_dates, schedule), level_counts, schedule)
+
+
+@profiling.stage
+def stack_sources(sources: dict) -> pd.DataFrame:
+    """
+    Stack the shift counts of several sources, e.g. DBS and DCE, into one frame so they are assigned
+    to slots together.  Levels a source does not count are 0 for it.
+    :param sources: Counts indexed by Start_Date and End_Date, by source name
+    :return: Start_Date, End_Date and a column per level, with a RangeIndex
+    """
+    frames = list(sources.values())
+    stacked = {
+        'Start_Date': np.concatenate([df.index.get_level_values('Start_Date').values for df in frames]),
+        'End_Date': np.concatenate([df.index.get_level_values('End_Date').values for df in frames]),
+    }
+    for level in level_bits:
+        stacked[level] = np.concatenate([df[level].values.astype(np.int64) if level in df.columns
+                                         else np.zeros(len(df), dtype=np.int64) for df in frames])
+    return pd.DataFrame(stacked)
+
+
+@profiling.stage
+def assign_sources_to_shift(sources: dict, schedule: Sequence[tuple]) -> pd.DataFrame:
+    """
+    Green/Blue/Purple counts and Need by standard shift over all sources.  Slots are assigned once for
+    the stacked counts and each level is summed in one pass, so another source only adds rows.
+    :param sources: Counts indexed by Start_Date and End_Date, by source name, e.g. {'DBS': ..., 'DCE': ...}
+    :param schedule: Standard shifts as generated by generate_schedule
+    :return: counts indexed by standard shift tuple
+    """
+    stacked = stack_sources(sources)
+    positions = get_shift_positions(stacked['Start_Date'].values, stacked['End_Date'].values, schedule)
+    return sum_by_slot(positions, {level: stacked[level].values for level in level_bits}, schedule)
+
+
+@profiling.stage
+def assign_dce_to_shift(shift_counts_df: pd.DataFrame, schedule: Sequence[tuple]):
+    return assign_to_shift(shift_counts_df, schedule)
+
+
 def get_shift(shift_time: tuple, schedule: list) -> tuple:
     for slot in schedule:
         if get_shift_overlap(shift_time, slot) >= .5:
@@ -206,49 +601,140 @@ def get_shift(shift_time: tuple, schedule: list) -> tuple:
         return None
 
 
-def get_schedule(shift_counts: pd.DataFrame) -> List[tuple]:
+@profiling.stage
+def get_schedule(shift_counts: pd.DataFrame) -> ShiftCalendar:
     start = shift_counts.index[0][0]
     end = shift_counts.index[-1][0]
     num_days = (end - start).days + 1
     return generate_schedule(start, num_days)
 
 
-def main():
+def get_arg_parser() -> ArgumentParser:
     parser = ArgumentParser()
     parser.add_argument('dbs_report', help='File containing DBS Shift report PDF', metavar='dbs_file')
     parser.add_argument('--dce_html_dir', help='Directory containing DCE Schedules as HTML', metavar='dce_html_dir',
                         required=False)
+    parser.add_argument('--dce_excel', help='DCE Schedule workbook, instead of --dce_html_dir', metavar='dce_excel',
+                        required=False)
+    parser.add_argument('--workers', help='Number of processes used to parse the DCE schedules', type=int, default=1,
+                        required=False)
+    parser.add_argument('--dce_parser', help='HTML parser used for the DCE schedules', default='html5lib',
+                        choices=sorted(dce_html.dce_parsers), required=False)
     parser.add_argument('--html', help='Output as html', required=False, action='store_true')
     parser.add_argument('--csv', help='Output as csv', required=False, action='store_true')
-    args = parser.parse_args()
-    shift_counts_df = load_and_summarize_dbs_counts(args.dbs_report)
+    parser.add_argument('--markdown', help='Output as a Markdown table', required=False, action='store_true')
+    parser.add_argument('--slack', help='Output as Slack message text', required=False, action='store_true')
+    parser.add_argument('--export', help='Also save the counts and the schedule as Arrow IPC or Parquet files',
+                        choices=sorted(arrow_export.extensions), required=False)
+    parser.add_argument('--history', help='Add the counts to the shift history store', required=False,
+                        action='store_true')
+    parser.add_argument('--exceptions', help='Exception rules file, YAML or JSON, instead of the default '
+                                             f'{exceptions.DEFAULT_RULES_FILE}', metavar='rules_file', required=False)
+    parser.add_argument('--exceptions_report', help='Print the rows touched by each exception rule to stderr',
+                        required=False, action='store_true')
+    parser.add_argument('--chunk_pages', help='Extract and count the PDF this many pages at a time, bounding memory '
+                                              'for long schedules; bypasses the schedule cache and is ignored with '
+                                              '--export', type=int, metavar='pages', required=False)
+    parser.add_argument('--no_cache', help='Always extract the PDF, bypassing the schedule cache', required=False,
+                        action='store_true')
+    parser.add_argument('--no_daemon', help='Compute in this process even if the counts daemon is running',
+                        required=False, action='store_true')
+    parser.add_argument('--profile', help='Time each stage and print a table to stderr, or write JSON to the given '
+                                          'file', nargs='?', const='-', metavar='json_file', required=False)
+    return parser
+
+
+def print_shift_counts(args, shift_counts_df: pd.DataFrame, dce_counts_df: Optional[pd.DataFrame] = None,
+                       output_dir: str = '.', csv_suffix: Optional[str] = None):
+    """
+    :param csv_suffix: Added to the CSV file name after the date range, e.g. to tell apart reports covering the
+    same days
+    """
     schedule = get_schedule(shift_counts_df)
-    dbs_assigned = assign_dbs_to_shift(shift_counts_df, schedule)
-    dbs_assigned_fmt = format_shift_counts(dbs_assigned)
-
-    if args.dce_html_dir:
-        dce_counts_df = dce_html.load_and_summarize_dce_counts(args.dce_html_dir)
-        dce_assigned = assign_dce_to_shift(dce_counts_df, schedule)
-        all_assigned = dbs_assigned.merge(dce_assigned, how='left', left_index=True, right_index=True)
-        all_assigned.fillna(0, inplace=True)
-        all_assigned_fmt = format_combined_shift_counts(all_assigned)
-    else:
-        all_assigned = dbs_assigned
-        all_assigned_fmt = dbs_assigned_fmt
+    sources = {'DBS': shift_counts_df}
+    if dce_counts_df is not None:
+        sources['DCE'] = dce_counts_df
+    all_assigned = assign_sources_to_shift(sources, schedule)
+    all_assigned_fmt = format_shift_counts(all_assigned)
 
     output_html = args.html
     output_csv = args.csv
     if output_html:
         print('<h2>DBS Shift Counts</h2>')
-        print(get_shift_counts_as_html(all_assigned_fmt))
+        write_shift_counts(all_assigned_fmt, sys.stdout)
+    if args.markdown:
+        print('## DBS Shift Counts\n')
+        write_shift_counts(all_assigned_fmt, sys.stdout, table_output.MARKDOWN)
+    if args.slack:
+        print('*DBS Shift Counts*')
+        write_shift_counts(all_assigned_fmt, sys.stdout, table_output.SLACK)
     if output_csv:
         csv_out_name = \
-            f'DBS_Shift_Counts_{schedule[0][0].strftime("%Y_%m_%d")}_{schedule[-1][1].strftime("%Y_%m_%d")}.csv'
-        save_shift_counts_as_csv(all_assigned, csv_out_name)
+            f'DBS_Shift_Counts_{schedule[0][0].strftime("%Y_%m_%d")}_{schedule[-1][1].strftime("%Y_%m_%d")}'
+        csv_out_name += f'_{csv_suffix}.csv' if csv_suffix else '.csv'
+        save_shift_counts_as_csv(all_assigned, join(output_dir, csv_out_name))
         print(f'Shift Counts saved to {csv_out_name}')
-    if not output_html and not output_csv:
+    if not (output_html or output_csv or args.markdown or args.slack):
         print('DBS Shift Counts')
         print(all_assigned_fmt)
+    if args.history:
+        shift_history.record_shift_counts(all_assigned)
+    return all_assigned
+
+
+def export_shift_counts(fmt: str, all_assigned: pd.DataFrame, schedule_df: pd.DataFrame,
+                        dce_counts_df: Optional[pd.DataFrame] = None, output_dir: str = '.'):
+    """
+    Save the assigned counts, the compact schedule and the DCE counts as Arrow IPC or Parquet files
+    :param fmt: arrow_export.ARROW or arrow_export.PARQUET
+    """
+    first_shift, last_shift = all_assigned.index[0], all_assigned.index[-1]
+    date_range = f'{first_shift[0].strftime("%Y_%m_%d")}_{last_shift[1].strftime("%Y_%m_%d")}'
+    tables = [('DBS_Shift_Counts', arrow_export.shift_counts_table(all_assigned)),
+              ('DBS_Schedule', arrow_export.schedule_table(schedule_df))]
+    if dce_counts_df is not None:
+        tables.append(('DCE_Counts', arrow_export.dce_counts_table(dce_counts_df)))
+    for name, table in tables:
+        out_name = f'{name}_{date_range}{arrow_export.extensions[fmt]}'
+        arrow_export.write_table(table, join(output_dir, out_name))
+        print(f'{name.replace("_", " ")} saved to {out_name}')
+
+
+def main():
+    argv = sys.argv[1:]
+    args = get_arg_parser().parse_args(argv)
+    if args.profile:
+        profiling.enable()
+    elif not (args.no_daemon or args.no_cache or args.exceptions or args.exceptions_report or args.export
+               or args.chunk_pages):
+        output = daemon_client.query('shift_counts', argv)
+        if output is not None:
+            print(output, end='')
+            return
+
+    if args.exceptions:
+        exceptions.use_rules(exceptions.load_rules(args.exceptions))
+    cache = None if args.no_cache else ScheduleCache()
+    schedule_df = None
+    if args.export:
+        schedule_df = apply_exceptions(compact_schedule(etl_shift_schedule(args.dbs_report, cache)))
+        shift_counts_df = get_dbs_shift_counts(schedule_df)
+    elif args.chunk_pages:
+        shift_counts_df = load_and_summarize_dbs_counts_chunked(args.dbs_report, args.chunk_pages)
+    else:
+        shift_counts_df = load_and_summarize_dbs_counts(args.dbs_report, cache)
+    dce_counts_df = None
+    if args.dce_html_dir:
+        dce_counts_df = dce_html.load_and_summarize_dce_counts(args.dce_html_dir, args.workers, args.dce_parser)
+    elif args.dce_excel:
+        dce_counts_df = dce_excel.load_and_summarize_dce_counts(args.dce_excel, cache)
+    all_assigned = print_shift_counts(args, shift_counts_df, dce_counts_df)
+    if args.export:
+        export_shift_counts(args.export, all_assigned, schedule_df, dce_counts_df)
+    if args.exceptions_report:
+        print(exceptions.get_rules().format_report(), file=sys.stderr)
+    if args.profile:
+        profiling.report(args.profile)
 
 
 if __name__ == '__main__':
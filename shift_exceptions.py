@@ -1,11 +1,247 @@
-import pandas as pd
+"""
+Exceptions to the volunteer schedules, loaded from a YAML or JSON rules file:
 
+    exclusions:             # Sign ups removed, e.g. persistent no-shows
+      - names: [Pat Doe, Sam Roe]
+        reason: No shows
+      - name: Lee Poe
+        from: 2020-06-01
+        to: 2020-06-30
+    overrides:              # Changes on given dates, for everyone unless names are given
+      - dates: [2020-07-04]
+        exclude: true
+      - dates: [2020-01-11, 2020-01-12]
+        names: [Kim Moe]
+        level: Blue
+    reclassifications:      # Level changes, optionally limited by from/to
+      - names: [Ash Loe]
+        level: Purple
+        from: 2020-03-01
 
-def apply_exceptions(schedule_df: pd.DataFrame) -> pd.DataFrame:
+Rules are compiled once into indexes: named rules into a table hash joined to the schedule on the
+volunteer's name, whole day rules into a table joined on the day of the shift and unnamed date ranges
+into intervals.  Names match ignoring case and surrounding spaces.  An exclusion wins over a level
+change, and of several level changes the last in the file wins.  Each rule counts the rows it touched.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from os.path import expanduser, getmtime, isfile
+from typing import Optional, Tuple
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+yaml = lazy_import('yaml')
+
+DEFAULT_RULES_FILE = os.environ.get('SHS_COUNTS_EXCEPTIONS', expanduser('~/.config/shs_counts/exceptions.yaml'))
+LEVELS = ('Green', 'Blue', 'Purple')
+SECTIONS = ('exclusions', 'overrides', 'reclassifications')
+DAY_NS = 86400 * 10 ** 9
+MIN_NS = -2 ** 63
+MAX_NS = 2 ** 63 - 1
+
+
+def _to_ns(value) -> int:
+    return pd.Timestamp(value).normalize().value
+
+
+def _name_keys(names) -> pd.Index:
+    return pd.Index(names, dtype=object).str.strip().str.casefold()
+
+
+class ExceptionRule:
+    __slots__ = ('label', 'names', 'start', 'end', 'dates', 'exclude', 'level')
+
+    def __init__(self, section: str, position: int, spec: dict):
+        self.label = f'{section}[{position}]' + (f' {spec["reason"]}' if spec.get('reason') else '')
+        names = spec.get('names', [spec['name']] if 'name' in spec else [])
+        self.names = [names] if isinstance(names, str) else list(names)
+        self.start = _to_ns(spec['from']) if spec.get('from') else MIN_NS
+        self.end = _to_ns(spec['to']) + DAY_NS if spec.get('to') else MAX_NS  # to is inclusive
+        self.dates = [_to_ns(d) for d in spec.get('dates', [])]
+        self.exclude = section == 'exclusions' or bool(spec.get('exclude'))
+        self.level = None if self.exclude else spec.get('level')
+        if section == 'overrides' and not self.dates:
+            raise ValueError(f'Exception rule {self.label} needs dates')
+        if not self.exclude and self.level not in LEVELS:
+            raise ValueError(f'Exception rule {self.label} needs exclude or a level of {", ".join(LEVELS)}')
+
+    def intervals(self) -> list:
+        if self.dates:
+            return [(day, day + DAY_NS) for day in self.dates]
+        return [(self.start, self.end)]
+
+
+class ExceptionRules:
+    """
+    Compiled rules.  touched holds the number of rows each rule has matched so far, by rule label.
     """
-    Apply a hard coded group of exceptions to the schedule attributes
+
+    def __init__(self, spec: Optional[dict] = None):
+        spec = spec or {}
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        self.rules = [ExceptionRule(section, i, rule_spec)
+                      for section in SECTIONS for i, rule_spec in enumerate(spec.get(section) or [])]
+        self.touched = {rule.label: 0 for rule in self.rules}
+        self._exclude = np.array([rule.exclude for rule in self.rules], dtype=bool)
+        self._level = np.array([LEVELS.index(rule.level) if rule.level else -1 for rule in self.rules],
+                               dtype=np.int8)
+
+        named, by_day, self._ranges = [], [], []
+        for i, rule in enumerate(self.rules):
+            if rule.names:
+                named.extend((name, start, end, i) for name in rule.names for start, end in rule.intervals())
+            elif rule.dates:
+                by_day.extend((day // DAY_NS, i) for day in rule.dates)
+            else:
+                self._ranges.append((rule.start, rule.end, i))
+        self._named = pd.DataFrame(named, columns=['name', 'start', 'end', 'rule'])
+        self._named['key'] = _name_keys(self._named['name'])
+        self._by_day = pd.DataFrame(by_day, columns=['day', 'rule'])
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def match(self, names: pd.Series, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param names: Volunteer name of each row, ideally categorical
+        :param starts: Shift start of each row as int64 nanoseconds since the epoch
+        :return: tuple of (row positions, rule positions) of every row and rule that match
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        row_parts, rule_parts = [], []
+        if len(self._named):
+            names = names if isinstance(names.dtype, pd.CategoricalDtype) else names.astype('category')
+            category_keys, keys = pd.factorize(_name_keys(names.cat.categories))
+            row_keys = np.append(category_keys, -1)[names.cat.codes.values]  # Last entry for missing names
+            rule_keys = keys.get_indexer(self._named['key'])
+            rows = np.flatnonzero(np.isin(row_keys, rule_keys[rule_keys >= 0]))
+            pairs = pd.DataFrame({'key': row_keys[rows], 'row': rows, 'time': starts[rows]}) \
+                .merge(self._named.assign(key=rule_keys), on='key')
+            pairs = pairs[(pairs['start'] <= pairs['time']) & (pairs['time'] < pairs['end'])]
+            row_parts.append(pairs['row'].values)
+            rule_parts.append(pairs['rule'].values)
+        if len(self._by_day):
+            pairs = pd.DataFrame({'day': starts // DAY_NS, 'row': np.arange(len(starts))}) \
+                .merge(self._by_day, on='day')
+            row_parts.append(pairs['row'].values)
+            rule_parts.append(pairs['rule'].values)
+        for start, end, rule in self._ranges:
+            rows = np.flatnonzero((start <= starts) & (starts < end))
+            row_parts.append(rows)
+            rule_parts.append(np.full(len(rows), rule))
+        if not row_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(row_parts).astype(np.int64), np.concatenate(rule_parts).astype(np.int64)
+
+    def evaluate(self, names: pd.Series, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Match the rows and count the rows touched by each rule
+        :return: tuple of (excluded mask, index into LEVELS of the new level or -1) for each row
+        """
+        rows, rules = self.match(names, starts)
+        for rule, count in zip(*np.unique(rules, return_counts=True)):
+            self.touched[self.rules[rule].label] += int(count)
+
+        excluded = np.zeros(len(starts), dtype=bool)
+        excluded[rows[self._exclude[rules]]] = True
+        levels = np.full(len(starts), -1, dtype=np.int8)
+        changes = np.flatnonzero(self._level[rules] >= 0)
+        changes = changes[np.argsort(rules[changes], kind='stable')]  # Later rules assigned last
+        levels[rows[changes]] = self._level[rules[changes]]
+        return excluded, levels
+
+    def format_report(self) -> str:
+        width = max([len(label) for label in self.touched] + [4])
+        lines = [f'{"rule":<{width}} {"rows":>8}']
+        lines.extend(f'{label:<{width}} {count:>8}' for label, count in self.touched.items())
+        return '\n'.join(lines)
+
+
+def load_rules(file_name: str) -> ExceptionRules:
+    with open(file_name) as rules_in:
+        if file_name.lower().endswith('.json'):
+            spec = json.load(rules_in)
+        elif yaml is None:
+            raise ImportError(f'PyYAML is needed to read {file_name}, or use a JSON rules file')
+        else:
+            spec = yaml.safe_load(rules_in)
+    return ExceptionRules(spec)
+
+
+_rules = None
+_rules_mtime = None  # Modification time of DEFAULT_RULES_FILE when _rules was loaded from it, 0 if absent
+
+
+def use_rules(rules: ExceptionRules):
+    global _rules, _rules_mtime
+    _rules = rules
+    _rules_mtime = None
+
+
+def get_rules() -> ExceptionRules:
+    """
+    Rules set by use_rules, otherwise those in DEFAULT_RULES_FILE if it exists.  The file is loaded again
+    when its modification time changes, so long running processes pick up edits.
+    """
+    global _rules, _rules_mtime
+    if _rules is None or _rules_mtime is not None:
+        mtime = getmtime(DEFAULT_RULES_FILE) if isfile(DEFAULT_RULES_FILE) else 0
+        if _rules is None or mtime != _rules_mtime:
+            _rules = load_rules(DEFAULT_RULES_FILE) if mtime else ExceptionRules()
+            _rules_mtime = mtime
+    return _rules
+
+
+def apply_exceptions(schedule_df: pd.DataFrame, level_bits: dict, rules: Optional[ExceptionRules] = None) \
+        -> pd.DataFrame:
+    """
+    Apply the exception rules to the schedule attributes
     Example: Remove from schedule persistent no-shows
-    :param schedule_df: Current schedule
+    :param schedule_df: Compact schedule, see shift_counts.compact_schedule
+    :param level_bits: Bit of each level in the level_code column
+    :param rules: Rules to apply, get_rules() by default
     :return: updated schedule dataframe with exceptions applied
     """
+    rules = get_rules() if rules is None else rules
+    if not rules:
+        return schedule_df
+    excluded, levels = rules.evaluate(schedule_df['Volunteer'], schedule_df['Start_Epoch'].values)
+    changed = levels >= 0
+    if changed.any():
+        level_codes = np.array([level_bits[level] for level in LEVELS], dtype=np.uint8)
+        level_names = schedule_df['LEVEL'].cat.add_categories(
+            [level for level in LEVELS if level not in schedule_df['LEVEL'].cat.categories])
+        level_names[changed] = np.array(LEVELS, dtype=object)[levels[changed]]
+        schedule_df = schedule_df.assign(
+            LEVEL=level_names,
+            level_code=np.where(changed, level_codes[levels], schedule_df['level_code'].values).astype(np.uint8))
+    if excluded.any():
+        schedule_df = schedule_df[~excluded].reset_index(drop=True)
     return schedule_df
+
+
+def apply_exceptions_to_counts(counts_df: pd.DataFrame, level: str, rules: Optional[ExceptionRules] = None) \
+        -> pd.DataFrame:
+    """
+    Apply the exception rules to sign up counts of a single level, as the DCE loaders produce
+    :param counts_df: Name and Start_Date columns and a count column named by level
+    :param level: Level counted, e.g. Green
+    :param rules: Rules to apply, get_rules() by default
+    :return: counts without excluded rows; counts of reclassified rows move to a column of their new level
+    """
+    rules = get_rules() if rules is None else rules
+    if not rules:
+        return counts_df
+    excluded, levels = rules.evaluate(counts_df['Name'], counts_df['Start_Date'].values.view(np.int64))
+    counts = counts_df[level].values
+    counts_df = counts_df.drop(columns=[level])
+    new_levels = np.where(levels >= 0, levels, LEVELS.index(level))
+    for i, new_level in enumerate(LEVELS):
+        if new_level == level or (new_levels == i).any():
+            counts_df[new_level] = np.where(new_levels == i, counts, 0)
+    return counts_df[~excluded].reset_index(drop=True)
@@ -0,0 +1,186 @@
+"""
+Append only history of assigned shift counts, stored as one Parquet file per month so range queries
+only read the months involved.  Each standard shift slot appears once; a later run replaces the
+counts recorded for the same slot by an earlier one.
+
+    python shift_history.py import DBS_Shift_Counts_*.csv
+    python shift_history.py heatmap --start 2020-01-01 --end 2020-06-30
+"""
+from __future__ import annotations
+
+import os
+from argparse import ArgumentParser
+from datetime import date, datetime
+from os.path import expanduser, isfile, join
+from typing import Optional
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+
+DEFAULT_HISTORY_DIR = os.environ.get('SHS_COUNTS_HISTORY', expanduser('~/.local/share/shs_counts/history'))
+SHIFT_TARGET = 15  # Volunteers wanted per shift, as in the Need column of shift_counts.assign_dbs_to_shift
+LEVELS = ['Green', 'Blue', 'Purple']
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def partition_file(history_dir: str, month: pd.Period) -> str:
+    return join(history_dir, f'{month.year:04}-{month.month:02}.parquet')
+
+
+def partitions_between(history_dir: str, start: date, end: date) -> list:
+    months = pd.period_range(pd.Timestamp(start).to_period('M'), pd.Timestamp(end).to_period('M'), freq='M')
+    return [f for f in (partition_file(history_dir, month) for month in months) if isfile(f)]
+
+
+def get_history_frame(assigned: pd.DataFrame, run_time: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    :param assigned: Counts indexed by standard shift tuple, as from assign_dbs_to_shift
+    :param run_time: When the counts were taken, defaults to now
+    :return: one row per slot with Start, End, level counts, Need and Run_Time
+    """
+    history_df = pd.DataFrame({
+        'Start': pd.to_datetime([shift[0] for shift in assigned.index]),
+        'End': pd.to_datetime([shift[1] for shift in assigned.index]),
+    })
+    for level in LEVELS:
+        history_df[level] = assigned[level].values.astype('int32') if level in assigned.columns else 0
+    history_df['Need'] = (SHIFT_TARGET - history_df[LEVELS].sum(axis=1)).astype('int32')
+    history_df['Run_Time'] = pd.Timestamp(run_time or datetime.now())
+    return history_df
+
+
+def append_history(history_df: pd.DataFrame, history_dir: str = DEFAULT_HISTORY_DIR) -> int:
+    """
+    Merge rows into their month partitions, keeping the latest run for each slot
+    :return: number of partitions written
+    """
+    os.makedirs(history_dir, exist_ok=True)
+    history_df = history_df.sort_values('Run_Time', kind='stable')
+    months = history_df['Start'].dt.to_period('M')
+    for month, month_df in history_df.groupby(months):
+        path = partition_file(history_dir, month)
+        if isfile(path):
+            month_df = pd.concat([pd.read_parquet(path), month_df], ignore_index=True)
+        month_df = month_df.sort_values('Run_Time', kind='stable') \
+            .drop_duplicates(subset=['Start'], keep='last') \
+            .sort_values('Start') \
+            .reset_index(drop=True)
+        tmp_path = path + '.tmp'
+        month_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return months.nunique()
+
+
+def record_shift_counts(assigned: pd.DataFrame, run_time: Optional[datetime] = None,
+                        history_dir: str = DEFAULT_HISTORY_DIR) -> int:
+    return append_history(get_history_frame(assigned, run_time), history_dir)
+
+
+def import_shift_counts_csvs(file_names: list, history_dir: str = DEFAULT_HISTORY_DIR) -> int:
+    """
+    Load CSVs written by shift_counts --csv into the history.  The file modification time, in local time
+    as the run time of live runs, is used as the run time, so newer files win for slots they share.
+    :return: number of slots imported
+    """
+    frames = []
+    for file_name in file_names:
+        csv_df = pd.read_csv(file_name, parse_dates=['Start', 'End'])
+        history_df = csv_df[['Start', 'End']].copy()
+        for level in LEVELS:
+            history_df[level] = csv_df[level].astype('int32') if level in csv_df.columns else 0
+        history_df['Need'] = (SHIFT_TARGET - history_df[LEVELS].sum(axis=1)).astype('int32')
+        history_df['Run_Time'] = pd.Timestamp(datetime.fromtimestamp(os.path.getmtime(file_name)))
+        frames.append(history_df)
+    if not frames:
+        return 0
+    all_df = pd.concat(frames, ignore_index=True)
+    append_history(all_df, history_dir)
+    return all_df['Start'].nunique()
+
+
+def empty_history() -> pd.DataFrame:
+    """
+    History with no rows and the column types of get_history_frame
+    """
+    return pd.DataFrame({
+        'Start': pd.Series(dtype='datetime64[ns]'),
+        'End': pd.Series(dtype='datetime64[ns]'),
+        **{level: pd.Series(dtype='int32') for level in LEVELS},
+        'Need': pd.Series(dtype='int32'),
+        'Run_Time': pd.Series(dtype='datetime64[ns]'),
+    })
+
+
+def load_history(start: date, end: date, history_dir: str = DEFAULT_HISTORY_DIR) -> pd.DataFrame:
+    """
+    Slots starting on or between start and end, read from the partitions covering the range only
+    """
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end) + pd.Timedelta(days=1)
+    files = partitions_between(history_dir, start, end)
+    if not files:
+        return empty_history()
+    history_df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+    return history_df[(history_df['Start'] >= start) & (history_df['Start'] < end)].reset_index(drop=True)
+
+
+def add_slot_columns(history_df: pd.DataFrame) -> pd.DataFrame:
+    history_df = history_df.copy()
+    history_df['Weekday'] = pd.Categorical(history_df['Start'].dt.dayofweek.map(dict(enumerate(WEEKDAYS))),
+                                           categories=WEEKDAYS, ordered=True)
+    history_df['Slot'] = history_df['Start'].dt.strftime('%H:%M') + '-' + history_df['End'].dt.strftime('%H:%M')
+    return history_df
+
+
+def get_fill_rates(start: date, end: date, history_dir: str = DEFAULT_HISTORY_DIR) -> pd.DataFrame:
+    """
+    :return: by weekday and slot, the number of shifts seen and the mean share of SHIFT_TARGET filled
+    """
+    history_df = add_slot_columns(load_history(start, end, history_dir))
+    history_df['Fill_Rate'] = history_df[LEVELS].sum(axis=1) / SHIFT_TARGET
+    return history_df.groupby(['Weekday', 'Slot'], observed=True) \
+        .agg(Shifts=('Fill_Rate', 'size'), Fill_Rate=('Fill_Rate', 'mean'))
+
+
+def get_need_trend(start: date, end: date, freq: str = 'W', history_dir: str = DEFAULT_HISTORY_DIR) -> pd.DataFrame:
+    """
+    :return: total and mean Need per period of freq
+    """
+    history_df = load_history(start, end, history_dir)
+    return history_df.set_index('Start')['Need'].resample(freq).agg(['sum', 'mean']) \
+        .rename(columns={'sum': 'Need', 'mean': 'Mean_Need'})
+
+
+def get_heatmap(start: date, end: date, value: str = 'Need', history_dir: str = DEFAULT_HISTORY_DIR) -> pd.DataFrame:
+    """
+    :return: mean of value with a row per slot and a column per weekday
+    """
+    history_df = add_slot_columns(load_history(start, end, history_dir))
+    return history_df.pivot_table(index='Slot', columns='Weekday', values=value, aggfunc='mean', observed=True)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('command', choices=['import', 'fill_rates', 'need_trend', 'heatmap'])
+    parser.add_argument('files', help='Shift count CSVs to import', nargs='*')
+    parser.add_argument('--start', help='First day, YYYY-MM-DD', type=date.fromisoformat, default=date(2000, 1, 1))
+    parser.add_argument('--end', help='Last day, YYYY-MM-DD', type=date.fromisoformat, default=date.today())
+    parser.add_argument('--value', help='Column shown by heatmap', default='Need', choices=LEVELS + ['Need'])
+    parser.add_argument('--freq', help='Period of need_trend, e.g. W or M', default='W')
+    parser.add_argument('--history_dir', help='History store location', default=DEFAULT_HISTORY_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        slots = import_shift_counts_csvs(args.files, args.history_dir)
+        print(f'Imported {slots} shifts from {len(args.files)} files')
+    elif args.command == 'fill_rates':
+        print(get_fill_rates(args.start, args.end, args.history_dir))
+    elif args.command == 'need_trend':
+        print(get_need_trend(args.start, args.end, args.freq, args.history_dir))
+    else:
+        print(get_heatmap(args.start, args.end, args.value, args.history_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+Suggested volunteer moves and recruits that even out the Need of the standard shifts.
+
+    python shift_staffing.py "DBS Schedule.pdf" --dogs Dog_Exercise_List.csv --window_days 14
+
+Each shift wants shift_history.SHIFT_TARGET volunteers, of whom enough must be Blue or Purple, and
+enough Purple, for the mix of DBS dogs in the dog list (never fewer than MIN_PURPLE Purples, the level
+at which shift_counts highlights a shift).  A volunteer counts once per shift, towards their highest
+level and every level below it.  Within each window of days, the shift with the largest shortfall is repeatedly given a
+volunteer of the level it lacks most from the shift that can spare one most easily, each kept in a
+heap.  Moves never open a new shortfall, so each one closes one.  Shortfalls no shift can cover are
+suggested as recruits.
+"""
+from __future__ import annotations
+
+import heapq
+import sys
+from argparse import ArgumentParser
+from collections.abc import Sequence
+from math import ceil
+from typing import Optional
+
+import dce_shift_counts_from_excel as dce_excel
+import dce_shift_counts_from_html as dce_html
+import etl_dog_ex_list as dog_list
+import shift_counts as sc
+import shift_exceptions as exceptions
+import table_output
+from lazy_imports import lazy_import
+from schedule_cache import ScheduleCache
+from shift_history import SHIFT_TARGET
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+MIN_PURPLE = 4
+RANKS = ['Green', 'Blue', 'Purple']  # Targets are for volunteers at or above each level
+DOG_RANKS = {'Green': 0, 'Blue': 1, 'Purple': 2, 'Red - Team': 2}  # Lowest level handling each DBS dog level
+MOVE = 'move'
+RECRUIT = 'recruit'
+
+
+def get_level_targets(dog_counts_df: Optional[pd.DataFrame] = None, shift_target: int = SHIFT_TARGET,
+                      min_purple: int = MIN_PURPLE) -> np.ndarray:
+    """
+    Volunteers wanted per shift at or above each of RANKS, in proportion to the dogs needing that level
+    :param dog_counts_df: DBS dog counts by Level, as from etl_dog_ex_list.get_dog_counts_dataframe
+    :return: array of the targets for all volunteers, Blue or Purple volunteers and Purple volunteers
+    """
+    shares = np.zeros(len(RANKS))
+    if dog_counts_df is not None:
+        dogs = dog_counts_df['All'].drop('Total', errors='ignore')
+        dogs = dogs[dogs.index.isin(list(DOG_RANKS))]
+        if dogs.sum() > 0:
+            for level, count in dogs.items():
+                shares[:DOG_RANKS[level] + 1] += count / dogs.sum()
+    targets = [ceil(round(shift_target * share, 6)) for share in shares]
+    targets[0] = shift_target
+    targets[2] = min(max(targets[2], min_purple), shift_target)
+    targets[1] = min(max(targets[1], targets[2]), shift_target)
+    return np.array(targets, dtype=np.int64)
+
+
+def get_volunteer_ranks(level_codes: np.ndarray) -> np.ndarray:
+    """
+    :return: index into RANKS of the highest level in each level code, -1 for none
+    """
+    level_codes = np.asarray(level_codes)
+    return np.select([(level_codes & sc.level_bits[level]) != 0 for level in reversed(RANKS)],
+                     list(reversed(range(len(RANKS)))), -1)
+
+
+def get_coverage(assigned: pd.DataFrame, schedule: sc.ShiftCalendar) -> np.ndarray:
+    """
+    :param assigned: Counts indexed by standard shift tuple, as from shift_counts.assign_sources_to_shift
+    :return: volunteers at or above each of RANKS, a row per slot of schedule
+    """
+    coverage = np.zeros((len(schedule), len(RANKS)), dtype=np.int64)
+    slots = np.array([schedule.positions[slot] for slot in assigned.index], dtype=np.int64)
+    for rank in range(len(RANKS)):
+        columns = [level for level in RANKS[rank:] if level in assigned.columns]
+        coverage[slots, rank] = assigned[columns].sum(axis=1).values
+    return coverage
+
+
+class _Window:
+    """
+    Balances the slots of one window.  Coverage and the volunteer lists are shared with suggest_staffing
+    and updated in place.
+    """
+
+    def __init__(self, slots: np.ndarray, coverage: np.ndarray, targets: np.ndarray, volunteers: list,
+                 held: dict):
+        self.coverage = coverage
+        self.targets = targets
+        self.volunteers = volunteers  # Movable volunteers by slot and rank
+        self.held = held  # Slots of each volunteer
+        self.short = []  # Max heaps as (-key, slot): by largest shortfall, and by most to spare of each rank
+        self.donors = [[] for _ in RANKS]
+        for slot in slots.tolist():
+            gap = self.shortfall(slot)[0]
+            if gap > 0:
+                self.short.append((-gap, slot))
+            for rank, heap in enumerate(self.donors):
+                spare = self.spare(slot, rank)
+                if spare > 0:
+                    heap.append((-spare, slot))
+        for heap in [self.short] + self.donors:
+            heapq.heapify(heap)
+
+    def shortfall(self, slot: int) -> tuple:
+        """
+        :return: tuple of (largest shortfall, highest rank short) of the slot, (0, -1) if none
+        """
+        gaps = self.targets - self.coverage[slot]
+        short = np.flatnonzero(gaps > 0)
+        return (int(gaps.max()), int(short[-1])) if len(short) else (0, -1)
+
+    def spare(self, slot: int, rank: int) -> int:
+        """
+        :return: volunteers of rank the slot can give up without falling short of a target
+        """
+        surplus = int((self.coverage[slot, :rank + 1] - self.targets[:rank + 1]).min())
+        return min(len(self.volunteers[slot][rank]), surplus)
+
+    def take_volunteer(self, to_slot: int, rank: int) -> Optional[tuple]:
+        """
+        Remove a volunteer of rank from the slot with the most to spare, skipping those already on to_slot
+        :return: tuple of (volunteer, from slot), None if no slot can spare one
+        """
+        heap = self.donors[rank]
+        passed = []
+        found = None
+        while heap and found is None:
+            key, slot = heapq.heappop(heap)
+            spare = self.spare(slot, rank)
+            if spare <= 0:
+                continue
+            if spare != -key:  # Stale entry
+                heapq.heappush(heap, (-spare, slot))
+                continue
+            volunteers = self.volunteers[slot][rank]
+            i = next((i for i, v in enumerate(volunteers) if to_slot not in self.held[v]), None)
+            if i is None:
+                passed.append((key, slot))
+                continue
+            found = (volunteers.pop(i), slot)
+            self.coverage[slot, :rank + 1] -= 1
+            self.held[found[0]].discard(slot)
+            if spare > 1:
+                heapq.heappush(heap, (-self.spare(slot, rank), slot))
+        for entry in passed:
+            heapq.heappush(heap, entry)
+        return found
+
+    def balance(self, suggestions: list):
+        while self.short:
+            key, slot = heapq.heappop(self.short)
+            gap, rank = self.shortfall(slot)
+            if gap <= 0:
+                continue
+            if gap != -key:
+                heapq.heappush(self.short, (-gap, slot))
+                continue
+            for donor_rank in range(rank, len(RANKS)):  # Lowest sufficient level first
+                taken = self.take_volunteer(slot, donor_rank)
+                if taken is not None:
+                    volunteer, from_slot = taken
+                    self.coverage[slot, :donor_rank + 1] += 1
+                    self.held[volunteer].add(slot)  # Not listed as movable again
+                    suggestions.append((MOVE, volunteer, donor_rank, from_slot, slot, 1))
+                    break
+            else:
+                count = int(self.targets[rank] - self.coverage[slot, rank])
+                self.coverage[slot, :rank + 1] += count
+                suggestions.append((RECRUIT, -1, rank, -1, slot, count))
+            if self.shortfall(slot)[0] > 0:
+                heapq.heappush(self.short, (-self.shortfall(slot)[0], slot))
+
+
+def suggest_staffing(schedule_df: pd.DataFrame, schedule: sc.ShiftCalendar, targets: Optional[Sequence[int]] = None,
+                     window_days: int = 14, other_assigned: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Moves of volunteers between shifts and recruits that close the shortfalls against the targets.
+    Volunteers only move between shifts in the same window of window_days days from the first shift.
+    The DBS coverage is counted from schedule_df, each volunteer once per shift at the level they are
+    moved as, rather than from the level counts, which count a volunteer in every level they hold.
+    :param schedule_df: Compact schedule of the DBS sign ups, see shift_counts.compact_schedule
+    :param schedule: Standard shifts covering the schedule, as from shift_counts.get_schedule
+    :param targets: Volunteers wanted at or above each of RANKS, get_level_targets() by default
+    :param other_assigned: Counts of the other sources, e.g. DCE, indexed by standard shift tuple, as from
+    shift_counts.assign_sources_to_shift.  They add to the coverage but are not moved.
+    :return: Action, Volunteer, Level, From, To and Count of each suggestion; From and To are shift tuples
+    """
+    targets = get_level_targets() if targets is None else np.asarray(targets, dtype=np.int64)
+    coverage = get_coverage(other_assigned, schedule) if other_assigned is not None \
+        else np.zeros((len(schedule), len(RANKS)), dtype=np.int64)
+    positions = sc.get_shift_positions(schedule_df['Start_Epoch'].values.view('datetime64[ns]'),
+                                       schedule_df['End_Epoch'].values.view('datetime64[ns]'), schedule)
+    ranks = get_volunteer_ranks(schedule_df['level_code'].values)
+    volunteer_codes = schedule_df['Volunteer'].cat.codes.values
+    volunteers = [[[] for _ in RANKS] for _ in range(len(schedule))]
+    held = {}
+    keep = (positions >= 0) & (ranks >= 0) & (volunteer_codes >= 0)
+    for slot, rank, volunteer in zip(positions[keep].tolist(), ranks[keep].tolist(), volunteer_codes[keep].tolist()):
+        if slot not in held.setdefault(volunteer, set()):
+            volunteers[slot][rank].append(volunteer)
+            held[volunteer].add(slot)
+            coverage[slot, :rank + 1] += 1
+
+    days = (schedule.starts.astype('datetime64[D]') - schedule.starts[:1].astype('datetime64[D]')).astype(np.int64)
+    windows = days // window_days
+    suggestions = []
+    for window in np.unique(windows):
+        _Window(np.flatnonzero(windows == window), coverage, targets, volunteers, held).balance(suggestions)
+
+    if not suggestions:
+        return pd.DataFrame(columns=['Action', 'Volunteer', 'Level', 'From', 'To', 'Count'])
+    suggestions.sort(key=lambda suggestion: (suggestion[4], suggestion[0]))  # By shift moved to, moves first
+    actions, volunteer_codes, ranks, from_slots, to_slots, counts = (np.array(values) for values in zip(*suggestions))
+    names = np.append(schedule_df['Volunteer'].cat.categories.values.astype(object), None)
+    slots = np.append(schedule.slot_array, None)
+    return pd.DataFrame({
+        'Action': actions,
+        'Volunteer': names[volunteer_codes],
+        'Level': np.array(RANKS, dtype=object)[ranks],
+        'From': slots[from_slots],
+        'To': slots[to_slots],
+        'Count': counts,
+    })
+
+
+def format_suggestions(suggestions_df: pd.DataFrame) -> pd.DataFrame:
+    def label(slot):
+        return '' if slot is None else f'{sc.shift_date_str(slot)} {sc.shift_time_str(slot)}'
+
+    return pd.DataFrame({
+        'Action': suggestions_df['Action'],
+        'Volunteer': suggestions_df['Volunteer'].fillna(''),
+        'Level': suggestions_df['Level'],
+        'From': suggestions_df['From'].map(label),
+        'To': suggestions_df['To'].map(label),
+        'Count': suggestions_df['Count'],
+    })
+
+
+def get_arg_parser() -> ArgumentParser:
+    parser = ArgumentParser()
+    parser.add_argument('dbs_report', help='File containing DBS Shift report PDF', metavar='dbs_file')
+    parser.add_argument('--dogs', help='Dog exercise csv whose DBS dog mix sets the level targets', metavar='dog_file',
+                        required=False)
+    parser.add_argument('--dce_html_dir', help='Directory containing DCE Schedules as HTML', metavar='dce_html_dir',
+                        required=False)
+    parser.add_argument('--dce_excel', help='DCE Schedule workbook, instead of --dce_html_dir', metavar='dce_excel',
+                        required=False)
+    parser.add_argument('--window_days', help='Days within which volunteers may be moved', type=int, default=14,
+                        required=False)
+    parser.add_argument('--markdown', help='Output as a Markdown table', required=False, action='store_true')
+    parser.add_argument('--slack', help='Output as Slack message text', required=False, action='store_true')
+    parser.add_argument('--exceptions', help='Exception rules file, YAML or JSON', metavar='rules_file',
+                        required=False)
+    parser.add_argument('--no_cache', help='Always extract the PDF, bypassing the schedule cache', required=False,
+                        action='store_true')
+    return parser
+
+
+def main():
+    args = get_arg_parser().parse_args()
+    if args.exceptions:
+        exceptions.use_rules(exceptions.load_rules(args.exceptions))
+    cache = None if args.no_cache else ScheduleCache()
+    schedule_df = sc.apply_exceptions(sc.compact_schedule(sc.etl_shift_schedule(args.dbs_report, cache)))
+    shift_counts_df = sc.get_dbs_shift_counts(schedule_df)
+    schedule = sc.get_schedule(shift_counts_df)
+    dce_assigned = None
+    if args.dce_html_dir:
+        dce_assigned = sc.assign_sources_to_shift(
+            {'DCE': dce_html.load_and_summarize_dce_counts(args.dce_html_dir)}, schedule)
+    elif args.dce_excel:
+        dce_assigned = sc.assign_sources_to_shift(
+            {'DCE': dce_excel.load_and_summarize_dce_counts(args.dce_excel, cache)}, schedule)
+
+    dog_counts_df = None
+    if args.dogs:
+        dogs, _ = dog_list.get_dogs(args.dogs)
+        dog_counts_df = dog_list.get_dog_counts_dataframe(dog_list.filter_for_dbs(dog_list.get_dog_dataframe(dogs)))
+    targets = get_level_targets(dog_counts_df)
+    suggestions_df = suggest_staffing(schedule_df, schedule, targets, args.window_days, dce_assigned)
+
+    moves = suggestions_df['Action'] == MOVE
+    print(f'Targets per shift: {targets[0]} volunteers, {targets[1]} Blue or Purple, {targets[2]} Purple')
+    print(f'{moves.sum()} moves and {suggestions_df.loc[~moves, "Count"].sum()} recruits suggested')
+    table_df = format_suggestions(suggestions_df)
+    if args.markdown or args.slack:
+        table_output.write_table(table_df, sys.stdout, table_output.MARKDOWN if args.markdown else table_output.SLACK)
+    else:
+        print(table_df.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
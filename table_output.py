@@ -0,0 +1,122 @@
+"""
+Streaming table output for the count reports as HTML, Markdown or Slack text.  Rows are formatted and
+written in chunks, and highlighting is decided per column with vectorized tests, so large tables need
+neither pandas' Styler nor a styled copy of the table.
+"""
+from __future__ import annotations
+
+import html
+import io
+from typing import Callable, NamedTuple, Optional, TextIO
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+HTML = 'html'
+MARKDOWN = 'markdown'
+SLACK = 'slack'
+formats = (HTML, MARKDOWN, SLACK)
+
+CHUNK_ROWS = 512
+
+
+class Highlight(NamedTuple):
+    test: Callable  # Takes the column values as an array and returns a bool mask
+    style: str  # CSS for HTML output; Markdown and Slack show highlighted cells in bold
+
+
+def _html_start(columns: list, index_name: Optional[str], table_id: str) -> str:
+    header = ''.join(f'<th>{html.escape(str(column))}</th>' for column in columns)
+    if index_name is not None:
+        header = f'<th>{html.escape(index_name)}</th>' + header
+    return (f'<style type="text/css">\n#T_{table_id} tr, #T_{table_id} th {{text-align: right;}}\n</style>\n'
+            f'<table id="T_{table_id}">\n<thead>\n<tr>{header}</tr>\n</thead>\n<tbody>\n')
+
+
+def _markdown_start(columns: list, index_name: Optional[str], numeric: list) -> str:
+    names = [str(column).replace('|', r'\|') for column in columns]
+    rules = ['---:' if is_numeric else '---' for is_numeric in numeric]
+    if index_name is not None:
+        names.insert(0, index_name)
+        rules.insert(0, '---')
+    return f'| {" | ".join(names)} |\n|{"|".join(rules)}|\n'
+
+
+def _slack_start(columns: list, index_name: Optional[str]) -> str:
+    names = [str(column) for column in columns]
+    if index_name is not None:
+        names.insert(0, index_name)
+    return f'*{" | ".join(names)}*\n'
+
+
+def _format_cells(values, mask, highlight: Optional[Highlight], fmt: str) -> list:
+    cells = [str(value) for value in values]
+    if fmt == HTML:
+        cells = [html.escape(cell) for cell in cells]
+        if highlight is None:
+            return [f'<td>{cell}</td>' for cell in cells]
+        return [f'<td style="{highlight.style}">{cell}</td>' if m else f'<td>{cell}</td>'
+                for cell, m in zip(cells, mask)]
+    if fmt == MARKDOWN:
+        cells = [cell.replace('|', r'\|') for cell in cells]
+    if highlight is None:
+        return cells
+    bold = '**' if fmt == MARKDOWN else '*'
+    return [f'{bold}{cell}{bold}' if m else cell for cell, m in zip(cells, mask)]
+
+
+def write_table(table_df: pd.DataFrame, out: TextIO, fmt: str = HTML, highlights: Optional[dict] = None,
+                index: bool = False, table_id: str = 'counts', chunk_rows: int = CHUNK_ROWS):
+    """
+    Write a table to out, chunk_rows rows at a time
+    :param table_df: Table to write
+    :param out: Text file or stream
+    :param fmt: One of formats
+    :param highlights: Highlight by column name
+    :param index: Write the index as the first column, e.g. the levels of the dog counts
+    :param table_id: HTML id of the table, used by its style rules
+    """
+    if fmt not in formats:
+        raise ValueError(f'Unknown table format {fmt}, expected one of {", ".join(formats)}')
+    highlights = highlights or {}
+    columns = list(table_df.columns)
+    index_name = (table_df.index.name or '') if index else None
+    if fmt == HTML:
+        out.write(_html_start(columns, index_name, table_id))
+    elif fmt == MARKDOWN:
+        numeric = [pd.api.types.is_numeric_dtype(table_df[column]) for column in columns]
+        out.write(_markdown_start(columns, index_name, numeric))
+    else:
+        out.write(_slack_start(columns, index_name))
+
+    for start in range(0, len(table_df), chunk_rows):
+        chunk = table_df.iloc[start:start + chunk_rows]
+        column_cells = []
+        if index:
+            labels = [str(label) for label in chunk.index]
+            column_cells.append([f'<th>{html.escape(label)}</th>' for label in labels] if fmt == HTML else labels)
+        for column in columns:
+            values = chunk[column].values
+            highlight = highlights.get(column)
+            mask = np.asarray(highlight.test(values), dtype=bool) if highlight else None
+            column_cells.append(_format_cells(values, mask, highlight, fmt))
+
+        if fmt == HTML:
+            lines = [f'<tr>{"".join(row)}</tr>\n' for row in zip(*column_cells)]
+        elif fmt == MARKDOWN:
+            lines = [f'| {" | ".join(row)} |\n' for row in zip(*column_cells)]
+        else:
+            lines = [f'{" | ".join(row)}\n' for row in zip(*column_cells)]
+        out.write(''.join(lines))
+
+    if fmt == HTML:
+        out.write('</tbody>\n</table>\n')
+
+
+def render_table(table_df: pd.DataFrame, fmt: str = HTML, highlights: Optional[dict] = None, index: bool = False,
+                 table_id: str = 'counts') -> str:
+    out = io.StringIO()
+    write_table(table_df, out, fmt, highlights, index, table_id)
+    return out.getvalue()
@@ -0,0 +1,6 @@
+import sys
+from os.path import abspath, dirname, join
+
+ROOT = abspath(join(dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, join(ROOT, 'benchmarks'))
@@ -0,0 +1,34 @@
+from datetime import datetime
+from os.path import dirname, join
+
+import pandas as pd
+import pytest
+
+import dce_shift_counts_from_html as dce_html
+from synthetic import write_dce_html_dir
+
+FIXTURE = join(dirname(__file__), 'data', 'dce_schedule.html')
+
+
+def test_fixture_counts():
+    expected = pd.DataFrame({
+        'Start_Date': [datetime(2020, 3, 1, 7, 30), datetime(2020, 3, 2, 16, 0), datetime(2020, 3, 5, 8, 0),
+                       datetime(2020, 3, 31, 7, 30)],
+        'End_Date': [datetime(2020, 3, 1, 10, 30), datetime(2020, 3, 2, 19, 30), datetime(2020, 3, 5, 11, 0),
+                     datetime(2020, 3, 31, 10, 30)],
+        'Green': [2, 1, 1, 1],
+    }).set_index(['Start_Date', 'End_Date'])
+    pd.testing.assert_frame_equal(dce_html.load_and_summarize_dce_counts(FIXTURE), expected)
+
+
+@pytest.mark.parametrize('parser', sorted(set(dce_html.dce_parsers) - {'html5lib'}))
+def test_parser_parity_fixture(parser):
+    pd.testing.assert_frame_equal(dce_html.load_and_summarize_dce_counts(FIXTURE, parser=parser),
+                                  dce_html.load_and_summarize_dce_counts(FIXTURE, parser='html5lib'))
+
+
+@pytest.mark.parametrize('parser', sorted(set(dce_html.dce_parsers) - {'html5lib'}))
+def test_parser_parity_synthetic(parser, tmp_path):
+    write_dce_html_dir(str(tmp_path), 3, max_entries_per_day=12)
+    pd.testing.assert_frame_equal(dce_html.load_and_summarize_dce_counts(str(tmp_path), 1, parser),
+                                  dce_html.load_and_summarize_dce_counts(str(tmp_path), 1, 'html5lib'))
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+ENTRY_POINTS = ['shift_counts', 'etl_dog_ex_list', 'counts_daemon']
+HEAVY_MODULES = ['pandas', 'numpy', 'tabula', 'bs4', 'html5lib', 'lxml.html', 'pyarrow']
+
+# Runs the entry point's --help and prints the heavy modules actually executed.  A lazily imported
+# module keeps the _LazyModule type until its first attribute access.
+CHECK = '''
+import sys
+import {module}
+sys.argv = ['{module}.py', '--help']
+try:
+    {module}.main()
+except SystemExit:
+    pass
+print('heavy:' + ','.join(m for m in {heavy!r} if m in sys.modules and type(sys.modules[m]).__name__ != '_LazyModule'))
+'''
+
+
+@pytest.mark.parametrize('module', ENTRY_POINTS)
+def test_help_loads_no_heavy_modules(module):
+    result = subprocess.run([sys.executable, '-c', CHECK.format(module=module, heavy=HEAVY_MODULES)], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    assert 'usage:' in result.stdout
+    assert result.stdout.splitlines()[-1] == 'heavy:'